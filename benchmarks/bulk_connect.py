@@ -0,0 +1,87 @@
+"""
+Benchmark: time to make and connect N motors, serial or bulk.
+
+Starts a local soft IOC (``bits.utils.soft_ioc``) on a private port, then
+makes ``N`` motors with ``bits.utils.sim_creator.motors`` (each mode in a
+new Python process, so no channels are shared):
+
+serial
+    Make each motor, wait for it to connect, then the next.
+batch
+    Make all motors, then wait for all to connect (as ``make_devices()``
+    does with its connection barrier).
+bulk
+    ``motors(..., bulk=True)``: create and connect the channels of all
+    motors at once, then make the motors.
+
+EXAMPLE::
+
+    python benchmarks/bulk_connect.py --motors 8 16 64
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+import pyRestTable
+
+from bits.utils.soft_ioc import soft_ioc
+
+PREFIX = "bench:m"
+
+CLIENT = """
+import time
+t0 = time.monotonic()
+from bits.utils.sim_creator import motors
+
+n, mode = {n}, {mode!r}
+t1 = time.monotonic()
+kwargs = dict(prefix={prefix!r}, first=1, last=n)
+if mode == "serial":
+    devices = []
+    for motor in motors(**kwargs):
+        motor.wait_for_connection(timeout=60)
+        devices.append(motor)
+else:
+    devices = list(motors(**kwargs, bulk=(mode == "bulk"), bulk_timeout=60))
+    for motor in devices:
+        motor.wait_for_connection(timeout=60)
+print("SECONDS", time.monotonic() - t1)
+"""
+
+
+def run_client(n, mode, env):
+    """Seconds to make and connect 'n' motors in 'mode' (a new process)."""
+    process = subprocess.run(
+        [sys.executable, "-c", CLIENT.format(n=n, mode=mode, prefix=PREFIX)],
+        capture_output=True,
+        env={**os.environ, **env},
+        text=True,
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith("SECONDS"):
+            return float(line.split()[1])
+    raise RuntimeError(f"{mode} client failed:\n{process.stderr}")
+
+
+def main():
+    """Run the benchmark, print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--motors", type=int, nargs="+", default=[8, 64])
+    parser.add_argument("--modes", nargs="+", default="serial batch bulk".split())
+    args = parser.parse_args()
+
+    with soft_ioc(prefix=PREFIX, motors=max(args.motors)) as env:
+        table = pyRestTable.Table()
+        table.labels = ["motors"] + [f"{mode} (s)" for mode in args.modes]
+        for n in args.motors:
+            row = [n]
+            for mode in args.modes:
+                row.append(f"{run_client(n, mode, env):.2f}")
+            table.addRow(row)
+        print(table)
+
+
+if __name__ == "__main__":
+    main()
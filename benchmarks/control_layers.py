@@ -0,0 +1,149 @@
+"""
+Benchmark: PyEpics and caproto control layers, same devices file.
+
+For each control layer (in a new Python process), measures:
+
+connect
+    Seconds to make the devices of the devices file and wait for them to
+    connect.
+gets
+    Reads per second: each EPICS signal of the devices, read (round trip,
+    not from the monitor) ``--rounds`` times.
+puts
+    Writes per second: each writable EPICS signal written (its own value,
+    waiting for completion) ``--rounds`` times.  Only with the built-in
+    soft IOC, or with ``--puts`` (do not write to a real instrument!).
+
+Without ``--devices``, a devices file with ``--motors`` motors is
+served by a local soft IOC (``bits.utils.soft_ioc``).
+
+EXAMPLE::
+
+    python benchmarks/control_layers.py --motors 32
+    python benchmarks/control_layers.py --devices devices.yml --rounds 2
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+import pyRestTable
+
+from bits.utils.soft_ioc import soft_ioc
+
+PREFIX = "bench:m"
+LAYERS = ("pyepics", "caproto")
+
+CLIENT = """
+import json
+import sys
+import time
+
+from bits.utils.controls_setup import set_control_layer
+from bits.utils.controls_setup import set_timeouts
+
+layer, path, rounds, puts = sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4]
+set_control_layer(layer)
+set_timeouts()
+
+from ophyd.signal import EpicsSignalBase
+from ophyd.signal import EpicsSignalRO
+from ophydregistry import Registry
+
+from bits.utils.make_devices_yaml import Instrument
+
+t0 = time.monotonic()
+instrument = Instrument({}, registry=Registry(auto_register=False), lazy=False)
+instrument.load(path)
+devices = instrument.unconnected_devices
+for device in devices:
+    device.wait_for_connection(timeout=60)
+result = {"connect": time.monotonic() - t0, "devices": len(devices)}
+
+signals = [
+    walk.item
+    for device in devices
+    if hasattr(device, "walk_signals")
+    for walk in device.walk_signals(include_lazy=False)
+    if isinstance(walk.item, EpicsSignalBase)
+]
+result["signals"] = len(signals)
+t0 = time.monotonic()
+for _ in range(rounds):
+    for signal in signals:
+        signal.get(use_monitor=False)
+result["gets"] = rounds * len(signals) / (time.monotonic() - t0)
+
+if puts == "yes":
+    writable = [s for s in signals if not isinstance(s, EpicsSignalRO)]
+    values = [s.get() for s in writable]
+    t0 = time.monotonic()
+    for _ in range(rounds):
+        for signal, value in zip(writable, values):
+            signal.put(value, wait=True)
+    result["puts"] = rounds * len(writable) / (time.monotonic() - t0)
+print("RESULT", json.dumps(result))
+"""
+
+
+def run_client(layer, path, rounds, puts, env):
+    """Results (dict) of one control layer (a new process)."""
+    process = subprocess.run(
+        [sys.executable, "-c", CLIENT, layer, str(path), str(rounds)]
+        + ["yes" if puts else "no"],
+        capture_output=True,
+        env={**os.environ, **env},
+        text=True,
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith("RESULT"):
+            return json.loads(line.split(maxsplit=1)[1])
+    raise RuntimeError(f"{layer} client failed:\n{process.stderr}")
+
+
+def main():
+    """Run the benchmark, print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", help="devices file (default: soft IOC motors)")
+    parser.add_argument("--motors", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--puts", action="store_true", help="also with --devices")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.devices is None:
+            env = stack.enter_context(soft_ioc(prefix=PREFIX, motors=args.motors))
+            path = pathlib.Path(stack.enter_context(tempfile.TemporaryDirectory()))
+            path = path / "devices.yml"
+            path.write_text(
+                "bits.utils.sim_creator.motors:\n"
+                f"- {{prefix: {PREFIX}, first: 1, last: {args.motors}}}\n"
+            )
+            puts = True
+        else:
+            env, path, puts = {}, pathlib.Path(args.devices), args.puts
+
+        table = pyRestTable.Table()
+        table.labels = "layer devices signals connect_s gets/s puts/s".split()
+        for layer in LAYERS:
+            result = run_client(layer, path, args.rounds, puts, env)
+            table.addRow(
+                (
+                    layer,
+                    result["devices"],
+                    result["signals"],
+                    f"{result['connect']:.2f}",
+                    f"{result['gets']:.0f}",
+                    f"{result['puts']:.0f}" if "puts" in result else "--",
+                )
+            )
+        print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: find runs with ``cat.search()`` or the local run index.
+
+Writes ``--runs`` runs (start and stop documents) to a temporary
+(msgpack) databroker catalog, indexes them (``backfill``), then finds
+runs by scan_id, plan_name, and time both ways.
+
+EXAMPLE::
+
+    python benchmarks/run_index.py --runs 2000
+"""
+
+import argparse
+import pathlib
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+import databroker
+import pyRestTable
+from databroker.queries import TimeRange
+
+from bits.utils.run_index import RunIndex
+from bits.utils.run_index import backfill
+
+PLANS = ("count", "scan", "rel_scan", "grid_scan")
+
+
+def fill(cat, runs):
+    """Write 'runs' runs to 'cat'.  Returns the start documents."""
+    starts = []
+    t0 = time.time() - runs * 60
+    for scan_id in range(1, runs + 1):
+        start = dict(
+            uid=str(uuid.uuid4()),
+            time=t0 + 60 * scan_id,
+            scan_id=scan_id,
+            plan_name=PLANS[scan_id % len(PLANS)],
+            detectors=["det"],
+            motors=["m1"],
+        )
+        stop = dict(
+            uid=str(uuid.uuid4()),
+            run_start=start["uid"],
+            time=start["time"] + 30,
+            exit_status="success",
+            num_events={"primary": 10},
+        )
+        cat.insert("start", start)
+        cat.insert("stop", stop)
+        starts.append(start)
+    return starts
+
+
+def timed(function, repeat):
+    """Mean seconds of 'function()'."""
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    """Run the benchmark, print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cat = databroker.temp()
+    starts = fill(cat, args.runs)
+    cat = cat.v2
+    work = pathlib.Path(tempfile.mkdtemp())
+    index = RunIndex(work / "runs.sqlite")
+    t0 = time.monotonic()
+    backfill(cat, index)
+    print(f"backfill: {args.runs} runs in {time.monotonic() - t0:.2f} s")
+
+    start = random.choice(starts)
+    since, until = start["time"] - 600, start["time"] + 600
+    lookups = [
+        (
+            "scan_id",
+            lambda: list(cat.search({"scan_id": start["scan_id"]})),
+            lambda: index.find(scan_id=start["scan_id"]),
+        ),
+        (
+            "plan_name",
+            lambda: list(cat.search({"plan_name": "grid_scan"})),
+            lambda: index.find(plan_name="grid_scan"),
+        ),
+        (
+            "time range",
+            lambda: list(cat.search(TimeRange(since=since, until=until))),
+            lambda: index.find(since=since, until=until),
+        ),
+    ]
+    table = pyRestTable.Table()
+    table.labels = "lookup runs cat.search_ms run_index_ms".split()
+    for name, search, find in lookups:
+        assert sorted(search()) == sorted(find())
+        table.addRow(
+            (
+                name,
+                args.runs,
+                f"{1000 * timed(search, args.repeat):.2f}",
+                f"{1000 * timed(find, args.repeat):.3f}",
+            )
+        )
+    print(table)
+    index.close()
+    shutil.rmtree(work)
+    shutil.rmtree(pathlib.Path(cat.paths[0]).parent)  # The temporary catalog.
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: dump and load times of each RE.md serializer.
+
+Makes a large RE.md (``iconfig``, ``versions``, and ``--keys`` user
+keys, as written by ``re_metadata()`` and many sessions), then times
+each serializer (``bits.utils.serializers``), and the pure-Python YAML
+used before, for reference:
+
+size_kB
+    Size of the serialized RE.md.
+dump_ms
+    Milliseconds to serialize it.
+load_ms
+    Milliseconds to read it back.
+
+The last row is a ``StoredDict`` write after one change: only the
+changed entry is serialized again.
+
+EXAMPLE::
+
+    python benchmarks/serializers.py --keys 2000
+"""
+
+import argparse
+import pathlib
+import tempfile
+import time
+
+import pyRestTable
+import yaml
+
+from bits.utils.config_loaders import iconfig
+from bits.utils.metadata import VERSIONS
+from bits.utils.serializers import SERIALIZERS
+from bits.utils.serializers import get_serializer
+from bits.utils.stored_dict import StoredDict
+
+
+def large_re_md(n_keys):
+    """A large RE.md, as written by re_metadata() and many sessions."""
+    md = {"iconfig": iconfig.to_dict(), "versions": VERSIONS, "scan_id": 1}
+    for i in range(n_keys):
+        md[f"user_key_{i}"] = {
+            "sample": f"sample {i}",
+            "positions": [0.1 * i, 0.2 * i, 0.3 * i],
+            "tags": ["tag1", "tag2"],
+        }
+    return md
+
+
+def timed(function, *args):
+    """(result, milliseconds) of 'function(*args)'."""
+    t0 = time.perf_counter()
+    result = function(*args)
+    return result, 1e3 * (time.perf_counter() - t0)
+
+
+def main():
+    """Run the benchmark, print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=2_000)
+    args = parser.parse_args()
+
+    md = large_re_md(args.keys)
+    table = pyRestTable.Table()
+    table.labels = "serializer size_kB dump_ms load_ms".split()
+
+    text, t_dump = timed(lambda: yaml.dump(md, indent=2))
+    _, t_load = timed(yaml.load, text, yaml.Loader)
+    table.addRow(("yaml.Loader", len(text) // 1000, f"{t_dump:.1f}", f"{t_load:.1f}"))
+
+    for name in sorted(SERIALIZERS):
+        serializer = get_serializer(name)
+        data, t_dump = timed(serializer.dumps, md)
+        _, t_load = timed(serializer.loads, data)
+        table.addRow((name, len(data) // 1000, f"{t_dump:.1f}", f"{t_load:.1f}"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = pathlib.Path(directory) / "md.yml"
+        StoredDict.dump(path, md)
+        sdict = StoredDict(path)
+        sdict.flush()
+        sdict["scan_id"] = 2
+        data, t_dump = timed(sdict._serialize)
+        sdict.flush()  # Before the directory is removed.
+        table.addRow(("yaml (1 change)", len(data) // 1000, f"{t_dump:.1f}", ""))
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
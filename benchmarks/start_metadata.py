@@ -0,0 +1,92 @@
+"""
+Benchmark: iconfig & versions in each start document, or in a store.
+
+For each mode, writes ``--runs`` runs (start and stop documents, as the
+RunEngine would) to a new temporary (msgpack) databroker catalog and
+measures:
+
+start_bytes
+    Mean size (JSON) of a start document.
+insert_s
+    Seconds to insert all the documents into the catalog.
+catalog_MB
+    Size of the catalog's files (with the metadata store, if any).
+
+EXAMPLE::
+
+    python benchmarks/start_metadata.py --runs 10000
+
+The demo iconfig is small: the difference grows with the iconfig.
+"""
+
+import argparse
+import json
+import pathlib
+import shutil
+import time
+import uuid
+
+import databroker
+import pyRestTable
+
+from bits.utils.metadata import re_metadata
+from bits.utils.metadata_store import metadata_store
+
+
+def run_documents(md, scan_id):
+    """Start and stop documents of a run with metadata 'md'."""
+    start = dict(md, uid=str(uuid.uuid4()), time=time.time(), scan_id=scan_id)
+    stop = dict(
+        uid=str(uuid.uuid4()),
+        run_start=start["uid"],
+        time=time.time(),
+        exit_status="success",
+        num_events={},
+    )
+    return start, stop
+
+
+def measure(runs, stored):
+    """Results (dict) of one mode."""
+    cat = databroker.temp()
+    store = metadata_store("catalog" if stored else None, cat.v2)
+    md = re_metadata(cat.v2, store)  # As when RE.md is set at startup.
+    size = 0
+    elapsed = 0
+    for scan_id in range(1, runs + 1):
+        start, stop = run_documents(md, scan_id)
+        size += len(json.dumps(start))
+        t0 = time.monotonic()
+        cat.insert("start", start)
+        cat.insert("stop", stop)
+        elapsed += time.monotonic() - t0
+    root = pathlib.Path(cat.v2.paths[0]).parent
+    disk = sum(p.stat().st_size for p in root.rglob("*") if p.is_file())
+    shutil.rmtree(root)  # The temporary catalog.
+    return dict(start_bytes=size / runs, insert_s=elapsed, catalog_MB=disk / 1e6)
+
+
+def main():
+    """Run the benchmark, print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10_000)
+    args = parser.parse_args()
+
+    table = pyRestTable.Table()
+    table.labels = "mode runs start_bytes insert_s catalog_MB".split()
+    for mode, stored in (("embedded", False), ("store", True)):
+        result = measure(args.runs, stored)
+        table.addRow(
+            (
+                mode,
+                args.runs,
+                f"{result['start_bytes']:.0f}",
+                f"{result['insert_s']:.2f}",
+                f"{result['catalog_MB']:.1f}",
+            )
+        )
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: cost of ``RE.md[key] = value`` (a StoredDict).
+
+Times ``--writes`` assignments to a ``StoredDict`` (``bits.utils.stored_dict``),
+called from ``--depth`` frames deep in the call stack (as in a plan run
+by the RunEngine) and from the top.  The writes to storage are delayed,
+so each assignment should only move the deadline of one pending write
+(``scheduled`` stays at most 1, the rest are ``coalesced``).  StoredDict
+never walks the stack; what depth still costs is the interpreter's.
+
+EXAMPLE::
+
+    python benchmarks/stored_dict.py --writes 2000 --depth 300
+"""
+
+import argparse
+import pathlib
+import tempfile
+import time
+
+import pyRestTable
+
+from bits.utils.stored_dict import StoredDict
+from bits.utils.stored_dict import flush_statistics
+
+
+def cost(sdict, writes, depth):
+    """Mean seconds of one 'sdict[key] = value', 'depth' frames deep."""
+    if depth > 0:
+        return cost(sdict, writes, depth - 1)
+    t0 = time.perf_counter()
+    for i in range(writes):
+        sdict["scan_id"] = i
+    return (time.perf_counter() - t0) / writes
+
+
+def main():
+    """Run the benchmark, print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writes", type=int, default=2_000)
+    parser.add_argument("--depth", type=int, default=300)
+    args = parser.parse_args()
+
+    table = pyRestTable.Table()
+    table.labels = "mode depth writes us_per_write scheduled coalesced".split()
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("yaml", "journal"):
+            path = pathlib.Path(directory) / f"md_{mode}.yml"
+            sdict = StoredDict(path, delay=60, journal=(mode == "journal"))
+            for depth in (0, args.depth):
+                before = flush_statistics()
+                seconds = cost(sdict, args.writes, depth)
+                after = flush_statistics()
+                table.addRow(
+                    (
+                        mode,
+                        depth,
+                        args.writes,
+                        f"{1e6 * seconds:.1f}",
+                        after["scheduled"] - before["scheduled"],
+                        after["coalesced"] - before["coalesced"],
+                    )
+                )
+            sdict.flush()  # Before the directory is removed.
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,12 @@
 # -- Project information -----------------------------------------------------
 # https://www.sphinx-doc.org/en/master/usage/configuration.html#project-information
 
-import bits
+import os
+
+# Tell the instrument package that Sphinx is building the documentation.
+os.environ["BITS_DOCS_BUILD"] = "1"
+
+import bits  # noqa: E402
 
 project = "BITS"
 copyright = "2023-2025, APS BCDA"
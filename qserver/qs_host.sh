@@ -25,6 +25,8 @@ QS_CONFIG_YML="${SCRIPT_DIR}/qs-config.yml"
 QS_HOSTNAME="$(hostname)"
 
 PROCESS=start-re-manager  # from the conda environment
+# Warm start: fork each RE worker from a process with the slow imports done.
+# PROCESS=bits-start-re-manager
 STARTUP_COMMAND="${PROCESS} --config=${QS_CONFIG_YML}"
 
 #--------------------
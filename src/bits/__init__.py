@@ -1,6 +1,12 @@
 # -*- coding: iso-8859-1 -*-
 
-"""Model Bluesky Data Acquisition Instrument."""
+"""
+Model Bluesky Data Acquisition Instrument.
+
+``import bits`` should take less than 0.5 s (``IMPORT_TIME_BUDGET``).  Heavy
+packages (matplotlib, IPython, databroker, ...) are imported when first used,
+not by ``import bits``.
+"""
 
 import bits.demo_instrument  # noqa: F401
 from bits.utils.logging_setup import configure_logging
@@ -8,12 +14,17 @@ from bits.utils.logging_setup import configure_logging
 configure_logging()
 
 __package__ = "bits"
+IMPORT_TIME_BUDGET = 0.5  # seconds
 try:
-    from setuptools_scm import get_version
-
-    __version__ = get_version(root="..", relative_to=__file__)
-    del get_version
-except (LookupError, ModuleNotFoundError):
+    # Written by setuptools_scm when the package is built or installed.
+    from ._version import __version__
+except ImportError:
+    from importlib.metadata import PackageNotFoundError
     from importlib.metadata import version
 
-    __version__ = version(__package__)
+    try:
+        __version__ = version(__package__)
+    except PackageNotFoundError:
+        from setuptools_scm import get_version
+
+        __version__ = get_version(root="..", relative_to=__file__)
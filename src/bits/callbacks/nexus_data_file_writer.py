@@ -17,6 +17,7 @@ import logging
 from bits.core.run_engine_init import RE
 from bits.utils.aps_functions import host_on_aps_subnet
 from bits.utils.config_loaders import iconfig
+from bits.utils.startup_profiler import phase
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
@@ -45,7 +46,8 @@ class MyNXWriter(NXWriter):
         return title
 
 
-nxwriter = MyNXWriter()  # create the callback instance
+with phase("NeXus file writer"):
+    nxwriter = MyNXWriter()  # create the callback instance
 """The NeXus file writer object."""
 
 if iconfig.get("NEXUS_DATA_FILES", {}).get("ENABLE", False):
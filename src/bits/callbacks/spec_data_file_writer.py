@@ -19,6 +19,7 @@ import apstools.utils
 
 from bits.core.run_engine_init import RE
 from bits.utils.config_loaders import iconfig
+from bits.utils.startup_profiler import phase
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
@@ -63,18 +64,19 @@ def newSpecFile(title, scan_id=None, RE=None):
 
 
 # write scans to SPEC data file
-try:
-    # apstools >=1.6.21
-    _specwriter = apstools.callbacks.SpecWriterCallback2()
-except AttributeError:
-    # apstools <1.6.21
-    _specwriter = apstools.callbacks.SpecWriterCallback()
-
-specwriter = _specwriter
-"""The SPEC file writer object."""
-
-# make the SPEC file in current working directory (assumes is writable)
-specwriter.newfile(specwriter.spec_filename)
+with phase("SPEC file writer"):
+    try:
+        # apstools >=1.6.21
+        _specwriter = apstools.callbacks.SpecWriterCallback2()
+    except AttributeError:
+        # apstools <1.6.21
+        _specwriter = apstools.callbacks.SpecWriterCallback()
+
+    specwriter = _specwriter
+    """The SPEC file writer object."""
+
+    # make the SPEC file in current working directory (assumes is writable)
+    specwriter.newfile(specwriter.spec_filename)
 
 if iconfig.get("SPEC_DATA_FILES", {}).get("ENABLE", False):
     RE.subscribe(specwriter.receiver)  # write data to SPEC files
@@ -12,12 +12,19 @@ import logging
 from bluesky.callbacks.best_effort import BestEffortCallback
 
 from bits.utils.config_loaders import iconfig
+from bits.utils.helper_functions import mpl_setup
 from bits.utils.helper_functions import running_in_queueserver
+from bits.utils.startup_profiler import phase
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
 
-bec = BestEffortCallback()
+# Choose the matplotlib backend before the first plot is made.
+with phase("matplotlib setup"):
+    mpl_setup()
+
+with phase("BestEffortCallback"):
+    bec = BestEffortCallback()
 """BestEffortCallback object, creates live tables and plots."""
 
 bec_config = iconfig.get("BEC", {})
@@ -11,6 +11,7 @@ import logging
 import databroker
 
 from bits.utils.config_loaders import iconfig
+from bits.utils.startup_profiler import phase
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
@@ -18,10 +19,11 @@ logger.bsdev(__file__)
 TEMPORARY_CATALOG_NAME = "temp"
 
 catalog_name = iconfig.get("DATABROKER_CATALOG", TEMPORARY_CATALOG_NAME)
-try:
-    _cat = databroker.catalog[catalog_name].v2
-except KeyError:
-    _cat = databroker.temp().v2
+with phase("databroker catalog"):
+    try:
+        _cat = databroker.catalog[catalog_name].v2
+    except KeyError:
+        _cat = databroker.temp().v2
 
 cat = _cat
 """Databroker catalog object, receives new data from ``RE``."""
@@ -5,6 +5,8 @@ Setup the Bluesky RunEngine, provides ``RE`` and ``sd``.
 .. autosummary::
     ~RE
     ~sd
+    ~catalog_sink
+    ~run_index
 """
 
 import logging
@@ -18,8 +20,13 @@ from bits.utils.config_loaders import iconfig
 from bits.utils.controls_setup import connect_scan_id_pv
 from bits.utils.controls_setup import set_control_layer
 from bits.utils.controls_setup import set_timeouts
+from bits.utils.document_sink import catalog_sink as make_catalog_sink
 from bits.utils.metadata import MD_PATH
 from bits.utils.metadata import re_metadata
+from bits.utils.metadata_store import STORED_KEYS
+from bits.utils.metadata_store import metadata_store
+from bits.utils.run_index import RunIndex
+from bits.utils.startup_profiler import phase
 from bits.utils.stored_dict import StoredDict
 
 logger = logging.getLogger(__name__)
@@ -27,12 +34,15 @@ logger.bsdev(__file__)
 
 re_config = iconfig.get("RUN_ENGINE", {})
 
-RE = bluesky.RunEngine()
+with phase("RunEngine"):
+    RE = bluesky.RunEngine()
 """The bluesky RunEngine object."""
 
 # Save/restore RE.md dictionary, in this precise order.
 if MD_PATH is not None:
     handler_name = re_config.get("MD_STORAGE_HANDLER", "StoredDict")
+    # "StoredDict:json" selects a file format (default: yaml).
+    handler_name, _, storage_format = handler_name.partition(":")
     logger.debug(
         "Select %r to store 'RE.md' dictionary in %s.",
         handler_name,
@@ -42,7 +52,16 @@ if MD_PATH is not None:
         if handler_name == "PersistentDict":
             RE.md = bluesky.utils.PersistentDict(MD_PATH)
         else:
-            RE.md = StoredDict(MD_PATH)
+            RE.md = StoredDict(
+                MD_PATH,
+                journal=re_config.get("MD_STORAGE_JOURNAL", False),
+                shared=re_config.get("MD_STORAGE_SHARED", False),
+                serializer=storage_format or "yaml",
+                track_nested=re_config.get("MD_STORAGE_TRACK_NESTED", False),
+            )
+            if RE.md.shared:
+                # Other processes use this file.  Allocate scan_id with it locked.
+                RE.scan_id_source = lambda md: md.increment("scan_id")
     except Exception as error:
         print(
             "\n"
@@ -51,13 +70,27 @@ if MD_PATH is not None:
         )
         logger.warning("%s('%s') error:%s", handler_name, MD_PATH, error)
 
-RE.md.update(re_metadata(cat))  # programmatic metadata
+md = re_metadata(cat, metadata_store(re_config.get("METADATA_STORE"), cat))
+for key in STORED_KEYS:  # RE.md (saved) might have the other form from before.
+    RE.md.pop(f"{key}_hash" if key in md else key, None)
+if "metadata_store" not in md:
+    RE.md.pop("metadata_store", None)
+RE.md.update(md)  # programmatic metadata
 RE.md.update(re_config.get("DEFAULT_METADATA", {}))
 
 sd = bluesky.SupplementalData()
 """Baselines & monitors for ``RE``."""
 
-RE.subscribe(cat.v1.insert)
+catalog_sink = make_catalog_sink(cat)
+"""Inserts the documents from ``RE`` into ``cat`` (see ``DATABROKER_SINK``)."""
+
+RE.subscribe(catalog_sink)
+
+run_index = None
+"""Local index of runs, if ``RUN_ENGINE.RUN_INDEX`` is configured."""
+if re_config.get("RUN_INDEX"):
+    run_index = RunIndex(re_config["RUN_INDEX"])
+    RE.subscribe(run_index)
 RE.subscribe(bec)
 RE.preprocessors.append(sd)
 
@@ -22,6 +22,7 @@ from bits.utils.config_loaders import iconfig
 from bits.utils.helper_functions import register_bluesky_magics
 from bits.utils.helper_functions import running_in_queueserver
 from bits.utils.make_devices_yaml import make_devices  # noqa: F401
+from bits.utils.warm_start import report_ready
 
 # User specific imports
 from .plans import *  # noqa: F403
@@ -29,6 +30,9 @@ from .plans import *  # noqa: F403
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
 
+if iconfig.get("ICONFIG_WATCH_INTERVAL", 0) > 0:
+    iconfig.watch(iconfig["ICONFIG_WATCH_INTERVAL"])
+
 if iconfig.get("USE_BLUESKY_MAGICS", False):
     register_bluesky_magics()
 
@@ -36,6 +40,13 @@ if iconfig.get("USE_BLUESKY_MAGICS", False):
 if iconfig.get("NEXUS_DATA_FILES", {}).get("ENABLE", False):
     from bits.callbacks.nexus_data_file_writer import nxwriter  # noqa: F401
 
+if iconfig.get("PV_HEALTH", {}).get("ENABLE", False):
+    from bits.utils.pv_health import health_summary  # noqa: F401
+    from bits.utils.pv_health import require_healthy  # noqa: F401
+    from bits.utils.pv_health import start_health_monitor
+
+    start_health_monitor(RE)
+
 if iconfig.get("SPEC_DATA_FILES", {}).get("ENABLE", False):
     from bits.callbacks.spec_data_file_writer import newSpecFile  # noqa: F401
     from bits.callbacks.spec_data_file_writer import spec_comment  # noqa: F401
@@ -57,3 +68,5 @@ else:
     from bluesky import plans as bp  # noqa: F401
 
     from bits.utils.controls_setup import oregistry  # noqa: F401
+
+report_ready()
@@ -0,0 +1,121 @@
+"""
+Test the utils.config_loaders module.
+"""
+
+import copy
+import os
+import pickle
+import time
+
+import pytest
+
+from bits.utils import config_loaders
+from bits.utils.config_loaders import FrozenDict
+from bits.utils.config_loaders import IConfig
+from bits.utils.config_loaders import IConfigFileVersionError
+from bits.utils.config_loaders import freeze
+from bits.utils.config_loaders import iconfig
+from bits.utils.config_loaders import load_config_yaml
+
+CONFIG = """
+ICONFIG_VERSION: 2.0.0
+RUN_ENGINE:
+    DEFAULT_METADATA:
+        beamline_id: unit_testing
+    tags: [a, b]
+"""
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Use an empty cache directory."""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("BITS_CACHE_DIR", str(path))
+    return path
+
+
+def test_cache(cache_dir, tmp_path, monkeypatch):
+    """A parsed file is cached until its content changes."""
+    config_file = tmp_path / "iconfig.yml"
+    config_file.write_text(CONFIG)
+    expected = load_config_yaml(config_file)
+    assert expected == load_config_yaml(config_file, cache=False)
+    assert len(list(cache_dir.iterdir())) == 1
+
+    def not_parsed(text, **kwargs):
+        raise AssertionError("YAML parsed, not from cache")
+
+    monkeypatch.setattr(config_loaders, "yaml_load", not_parsed)
+    contents = load_config_yaml(config_file)
+    assert contents == expected
+    assert contents is not load_config_yaml(config_file)  # safe to modify
+
+    # Same size, same modification time, different content.
+    st = config_file.stat()
+    config_file.write_text(CONFIG.replace("unit_testing", "unit_TESTING"))
+    os.utime(config_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+    with pytest.raises(AssertionError):
+        load_config_yaml(config_file)
+
+    monkeypatch.setenv("BITS_CACHE_DIR", "")  # disabled
+    assert config_loaders.config_cache_dir() is None
+    with pytest.raises(AssertionError):
+        load_config_yaml(config_file)
+
+
+def test_frozen():
+    """The configuration cannot be changed."""
+    frozen = freeze({"a": {"b": [1, {"c": 2}]}})
+    assert isinstance(frozen["a"], FrozenDict)
+    assert frozen["a"]["b"] == (1, {"c": 2})
+    for action in (
+        lambda: frozen.update(a=1),
+        lambda: frozen.pop("a"),
+        lambda: frozen["a"].setdefault("x", 1),
+        lambda: frozen["a"]["b"][1].clear(),
+    ):
+        with pytest.raises(TypeError) as exinfo:
+            action()
+        assert "read-only" in str(exinfo)
+    with pytest.raises(TypeError):
+        frozen["new"] = 1
+    assert copy.deepcopy(frozen) is frozen
+    assert pickle.loads(pickle.dumps(frozen)) == frozen
+    assert frozen.to_dict() == {"a": {"b": [1, {"c": 2}]}}
+    assert type(frozen.to_dict()["a"]) is dict
+
+    assert isinstance(iconfig, IConfig)
+    assert isinstance(iconfig["RUN_ENGINE"], FrozenDict)
+    assert type(iconfig.to_dict()) is dict
+
+
+def test_reload_and_watch(cache_dir, tmp_path):
+    """Changes to the file replace the configuration."""
+    config_file = tmp_path / "iconfig.yml"
+    config_file.write_text(CONFIG)
+    config = IConfig(config_file)
+    run_engine = config["RUN_ENGINE"]
+    assert config.reload() is False
+
+    changes = []
+    config.watch(interval=0.01, callback=changes.append)
+    try:
+        config_file.write_text(CONFIG.replace("unit_testing", "revised"))
+        for _ in range(200):
+            if changes:
+                break
+            time.sleep(0.01)
+        assert changes == [config]
+        assert config["RUN_ENGINE"]["DEFAULT_METADATA"]["beamline_id"] == "revised"
+        # Values read before the change are not changed.
+        assert run_engine["DEFAULT_METADATA"]["beamline_id"] == "unit_testing"
+
+        # A bad revision is reported, the present configuration is kept.
+        config_file.write_text("ICONFIG_VERSION: 1.0.0\n")
+        time.sleep(0.1)
+        assert config["RUN_ENGINE"]["DEFAULT_METADATA"]["beamline_id"] == "revised"
+    finally:
+        config.unwatch()
+
+    with pytest.raises(IConfigFileVersionError):
+        config.reload()
@@ -0,0 +1,71 @@
+"""
+Test the utils.connection_barrier module.
+"""
+
+import threading
+import time
+
+import pytest
+from bluesky import RunEngine
+from ophyd import Component
+from ophyd import Device
+from ophyd import Signal
+
+from bits.utils.connection_barrier import wait_for_connections
+
+
+class TwoSignals(Device):
+    """Device with two signals."""
+
+    a = Component(Signal)
+    b = Component(Signal)
+
+
+def disconnect(signal):
+    """Make 'signal' report it is not connected."""
+    signal._metadata["connected"] = False
+
+
+def connect_later(signal, delay):
+    """Make 'signal' report it is connected after 'delay' seconds."""
+    timer = threading.Timer(delay, signal._metadata.update, kwargs={"connected": True})
+    timer.start()
+    return timer
+
+
+@pytest.fixture
+def RE():
+    """A RunEngine for these tests."""
+    return RunEngine({}, call_returns_result=True)
+
+
+def test_all_connect(RE):
+    """The wait ends when the last device connects."""
+    fast = Signal(name="fast")
+    slow = TwoSignals(name="slow")
+    disconnect(slow.b)
+    connect_later(slow.b, 0.2)
+
+    t0 = time.monotonic()
+    report = RE(wait_for_connections([fast, slow], timeout=5)).plan_result
+    assert time.monotonic() - t0 < 1
+    assert report.connected
+    assert report.unconnected == {}
+    assert report.latency["fast"] < 0.1
+    assert 0.2 <= report.latency["slow"] < 1
+    assert "slow" in str(report)
+
+
+def test_timeout(RE):
+    """At the deadline, the unconnected signals are reported."""
+    fast = Signal(name="fast")
+    never = TwoSignals(name="never")
+    disconnect(never.a)
+
+    t0 = time.monotonic()
+    report = RE(wait_for_connections([fast, never], timeout=0.2)).plan_result
+    assert 0.2 <= time.monotonic() - t0 < 1
+    assert not report.connected
+    assert report.unconnected == {"never": ["never_a"]}
+    assert list(report.latency) == ["fast"]
+    assert "never_a" in str(report)
@@ -0,0 +1,48 @@
+"""Test startup and device factories with each control layer."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from bits.utils.soft_ioc import soft_ioc
+
+# The control layer is chosen once per process, so each client is a new one.
+CLIENT = """
+import ophyd
+from bits.demo_instrument.startup import RE
+from bits.demo_instrument.startup import make_devices
+from bits.utils.sim_creator import motors
+
+RE(make_devices())
+devices = list(motors(prefix="ctl:m", first=1, last=4, bulk=True))
+for motor in devices:
+    motor.wait_for_connection(timeout=10)
+motor = devices[0]
+motor.user_setpoint.put(1.5, wait=True)
+print(
+    "RESULT",
+    ophyd.cl.name,
+    all(motor.connected for motor in devices),
+    motor.user_setpoint.get(use_monitor=False),
+    motor.user_readback.connection_timeout,
+)
+"""
+
+
+@pytest.mark.parametrize("layer", ["pyepics", "caproto"])
+def test_control_layer(layer, tmp_path):
+    """startup, make_devices(), motors (bulk), get & put"""
+    with soft_ioc(prefix="ctl:m", motors=4) as env:
+        result = subprocess.run(
+            [sys.executable, "-c", CLIENT],
+            env={**os.environ, **env, "OPHYD_CONTROL_LAYER": layer},
+            cwd=tmp_path,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+    lines = [line for line in result.stdout.splitlines() if "RESULT" in line]
+    assert len(lines) == 1, result.stderr[-2000:]
+    assert lines[0].split()[1:] == [layer, "True", "1.5", "5"]
@@ -1,9 +1,20 @@
 """Test the device factories."""
 
+import time
+
+import numpy as np
+import ophyd
 import pytest
+from bluesky import RunEngine
+from bluesky import plans as bp
+from ophyd import Component
+from ophyd.areadetector import EpicsSignalWithRBV
 
+from bits.utils.bulk_channels import pv_names
 from bits.utils.sim_creator import motors
+from bits.utils.sim_creator import motors_entries
 from bits.utils.sim_creator import predefined_device
+from bits.utils.sim_creator import synthetic_beamline
 
 
 @pytest.mark.parametrize(
@@ -42,3 +53,96 @@ def test_motors(kwargs):
             assert device.name.startswith("m")
             assert isinstance(int(device.name[1:]), int)
     assert count == (1 + kwargs["last"] - kwargs["first"])
+
+
+def test_motors_entries():
+    """the manifest lists each motor separately"""
+    entries = motors_entries(prefix="ioc:m", first=3, last=1, labels=["motor"])
+    assert entries == [
+        (
+            "ophyd.EpicsMotor",
+            {"name": f"m{i}", "prefix": f"ioc:m{i}", "labels": ["motor"]},
+        )
+        for i in (1, 2, 3)
+    ]
+
+
+class _Stage(ophyd.Device):
+    """A device with each kind of component."""
+
+    x = Component(ophyd.EpicsMotor, ":x")
+    gain = Component(EpicsSignalWithRBV, ":gain")
+    temp = Component(ophyd.EpicsSignal, ":T", write_pv=":T_SP")
+    note = Component(ophyd.EpicsSignal, ":note", lazy=True)
+
+
+def _created_pvs(device):
+    """PV names of the channels made by 'device'."""
+    names = []
+    for walk in device.walk_signals(include_lazy=False):
+        for attr in ("_read_pv", "_write_pv"):
+            pv = getattr(walk.item, attr, None)
+            if pv is not None:
+                names.append(pv.pvname)
+    return set(names)
+
+
+@pytest.mark.parametrize("klass", [ophyd.EpicsMotor, _Stage])
+def test_pv_names(klass):
+    """all the channels a device makes are known from its class"""
+    predicted = pv_names(klass, "bulk:")
+    assert len(predicted) == len(set(predicted))
+    assert set(predicted) == _created_pvs(klass("bulk:", name="bulk"))
+
+
+def test_motors_bulk():
+    """bulk mode gives up at the timeout, then makes the motors"""
+    t0 = time.monotonic()
+    devices = list(
+        motors(prefix="nowhere:m", first=1, last=3, bulk=True, bulk_timeout=0.2)
+    )
+    assert 0.2 <= time.monotonic() - t0 < 5
+    assert [device.name for device in devices] == ["m1", "m2", "m3"]
+    assert motors_entries(prefix="nowhere:m", last=3, bulk=True) is None
+
+
+def _readings(seed):
+    """Synthetic beamline readings at a few motor positions."""
+    devices = list(
+        synthetic_beamline(n_motors=3, n_detectors=5, seed=seed, image_shape=[6, 8])
+    )
+    axes, detectors = devices[:3], devices[3:]
+    readings = []
+    for position in (-2, 0, 2):
+        axes[0].set(position).wait()
+        for detector in detectors:
+            detector.trigger().wait()
+            readings.append(detector.counts.get())
+            readings.append(detector.image.get().sum())
+    return readings
+
+
+def test_synthetic_beamline():
+    """same seed, same data; images of the requested shape"""
+    devices = list(synthetic_beamline(n_motors=4, n_detectors=6, image_shape=[6, 8]))
+    assert [
+        d.name for d in devices
+    ] == "sm1 sm2 sm3 sm4 sd1 sd2 sd3 sd4 sd5 sd6".split()
+    assert _readings(1) == _readings(1)
+    assert _readings(1) != _readings(2)
+
+    motor, detector = devices[0], devices[4]
+    model = detector.model
+    motor.set(model.center[0]).wait()
+    peak = model.peaks()[0]
+    motor.set(model.center[0] + 5 * model.sigma[0]).wait()
+    assert model.peaks()[0] < peak
+
+    RE = RunEngine({})
+    documents = []
+    RE(bp.scan([detector], motor, -1, 1, 3), lambda name, doc: documents.append(doc))
+    descriptor = documents[1]
+    assert descriptor["data_keys"]["sd1_image"]["shape"] == [6, 8]
+    events = [doc for doc in documents if "seq_num" in doc]
+    assert len(events) == 3
+    assert np.shape(events[0]["data"]["sd1_image"]) == (6, 8)
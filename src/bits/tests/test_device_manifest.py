@@ -0,0 +1,77 @@
+"""
+Test the utils.device_manifest module.
+"""
+
+import pytest
+
+from bits.utils import device_manifest
+from bits.utils.device_manifest import DeviceManifestError
+from bits.utils.device_manifest import load_manifest
+
+DEVICES = """
+bits.utils.sim_creator.factory_base:
+- {names: "sig{}", first: 1, last: 3, creator: ophyd.Signal, labels: [group]}
+
+ophyd.Signal:
+- {name: solo, value: 2, eager: true}
+
+bits.utils.sim_creator.predefined_device:
+- {creator: ophyd.sim.motor, name: sim_motor}
+"""
+
+BAD_DEVICES = """
+ophyd.Signal:
+- {name: good}
+- {value: 1}  # no name
+- {name: typo, valeu: 1}
+
+no_such_module.Device:
+- {name: missing}
+"""
+
+
+@pytest.fixture
+def devices_file(tmp_path, monkeypatch):
+    """A devices file, with an empty cache directory."""
+    monkeypatch.setenv("BITS_CACHE_DIR", str(tmp_path / "cache"))
+    path = tmp_path / "devices.yml"
+    path.write_text(DEVICES)
+    return path
+
+
+def test_compile(devices_file, monkeypatch):
+    """Factories are expanded, the manifest is used until the file changes."""
+    entries = load_manifest(devices_file)
+    names = [entry["kwargs"]["name"] for entry in entries]
+    assert names == "sig1 sig2 sig3 solo sim_motor".split()
+    assert entries[0]["device_class"] == "ophyd.Signal"
+    assert entries[0]["kwargs"]["labels"] == ["group"]
+    assert [entry["eager"] for entry in entries] == [False] * 3 + [True, False]
+    assert "eager" not in entries[3]["kwargs"]
+    assert entries[4]["several"] is True  # a generator function
+    assert (devices_file.parent / ".devices.yml.manifest.json").exists()
+
+    def not_used(*args):
+        raise AssertionError("manifest not used")
+
+    monkeypatch.setattr(device_manifest, "load_config_yaml", not_used)
+    monkeypatch.setattr(device_manifest, "resolve_creator", not_used)
+    assert load_manifest(devices_file) == entries
+
+    devices_file.write_text(DEVICES.replace("last: 3", "last: 2"))
+    with pytest.raises(AssertionError):
+        load_manifest(devices_file)
+
+
+def test_invalid(devices_file):
+    """All invalid entries are reported, nothing is saved."""
+    devices_file.write_text(BAD_DEVICES)
+    with pytest.raises(DeviceManifestError) as exinfo:
+        load_manifest(devices_file)
+    report = str(exinfo.value)
+    assert "3 of 4 device entries" in report
+    assert "missing a required argument: 'name'" in report
+    assert "unexpected keyword argument 'valeu'" in report
+    assert "no_such_module" in report
+    assert "good" not in report
+    assert not (devices_file.parent / ".devices.yml.manifest.json").exists()
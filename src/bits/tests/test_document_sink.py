@@ -0,0 +1,81 @@
+"""Test the buffered document sink."""
+
+import threading
+import time
+
+import bluesky
+import databroker
+from bluesky.plans import count
+from ophyd.sim import det
+
+from bits.utils.document_sink import BufferedSink
+
+
+def test_catalog():
+    """Runs are complete in the catalog when the plan ends."""
+    cat = databroker.temp().v2
+    sink = BufferedSink(cat.v1.insert)
+    RE = bluesky.RunEngine()
+    RE.subscribe(sink)
+    (uid,) = RE(count([det], 5))
+    assert cat[uid].primary.read()["det"].shape == (5,)
+    (uid,) = RE(count([det], 3))
+    assert len(cat[uid].primary.read()["det"]) == 3
+    stats = sink.stats()
+    assert stats["received"] == stats["inserted"] == 2 * 3 + 5 + 3
+    assert stats["depth"] == stats["failed"] == 0
+    assert "insert_p50_ms" in sink.summary()
+    sink.close()
+
+
+def test_pages_and_backpressure():
+    """Waiting events are inserted as pages, in order; full queue waits."""
+    received = []
+    busy = threading.Event()
+
+    def insert(name, doc):
+        busy.wait(5)  # Slow catalog.
+        received.append((name, doc))
+
+    sink = BufferedSink(insert, queue_size=4, batch=100)
+    RE = bluesky.RunEngine()
+    RE.subscribe(sink)
+    threading.Timer(0.5, busy.set).start()
+    t0 = time.monotonic()
+    RE(count([det], 10))
+    assert time.monotonic() - t0 > 0.4  # Waited for the catalog.
+    assert sink.waited > 0
+    assert sink.max_depth == 4
+
+    names = [name for name, _doc in received]
+    assert names[:2] == ["start", "descriptor"]
+    assert names[-1] == "stop"
+    assert "event_page" in names
+    seq_nums = []
+    for name, doc in received:
+        if name == "event":
+            seq_nums.append(doc["seq_num"])
+        elif name == "event_page":
+            seq_nums.extend(doc["seq_num"])
+    assert seq_nums == list(range(1, 11))
+    assert sink.inserted == 13
+    sink.close()
+
+
+def test_failure():
+    """Failed inserts are kept and reported, later documents inserted."""
+    received = []
+
+    def insert(name, doc):
+        if name == "descriptor":
+            raise RuntimeError("catalog is down")
+        received.append(name)
+
+    sink = BufferedSink(insert)
+    RE = bluesky.RunEngine()
+    RE.subscribe(sink)
+    RE(count([det]))
+    assert sink.stats()["failed"] == 1
+    assert sink.failures[0][0] == "descriptor"
+    assert received == ["start", "event", "stop"]
+    sink.close()
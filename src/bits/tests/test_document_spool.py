@@ -0,0 +1,136 @@
+"""Test the durable document spool, with a catalog that fails on demand."""
+
+import json
+
+import bluesky
+import databroker
+from bluesky.plans import count
+from ophyd.sim import det
+from pymongo.errors import DuplicateKeyError
+
+from bits.utils.document_spool import DocumentSpool
+
+
+class FlakyCatalog:
+    """Stand-in catalog: keeps documents, fails while 'down'."""
+
+    def __init__(self):
+        """No documents, available."""
+        self.documents = []
+        self.down = False
+
+    def insert(self, name, doc):
+        """Keep (name, uid) of 'doc', or fail."""
+        if self.down:
+            raise ConnectionError("catalog is down")
+        if (name, doc["uid"]) in self.documents:  # As MongoDB does.
+            raise DuplicateKeyError(f"duplicate key: {doc['uid']}")
+        self.documents.append((name, doc["uid"]))
+
+
+def run_plans(sink, *plans):
+    """Run 'plans', documents to 'sink'.  Returns [(name, uid)]."""
+    documents = []
+    RE = bluesky.RunEngine()
+    RE.subscribe(lambda name, doc: documents.append((name, doc["uid"])))
+    RE.subscribe(sink)
+    for plan in plans:
+        RE(plan)
+    return documents
+
+
+def test_catalog_down(tmp_path):
+    """Documents kept while the catalog is down, inserted once, in order."""
+    catalog = FlakyCatalog()
+    catalog.down = True
+    spool = DocumentSpool(tmp_path, catalog.insert, retry_interval=0.05)
+    sent = run_plans(spool, count([det], 3), count([det], 2))
+    assert not spool.flush(timeout=0.3)
+    assert catalog.documents == []
+    assert spool.pending() == len(sent) == 11
+    assert spool.failures > 0
+    assert len(spool._segments()) == 2  # One for each run.
+
+    catalog.down = False
+    assert spool.flush(timeout=5)
+    assert catalog.documents == sent
+    assert spool._segments() == []
+    assert spool.stats()["catalog"] == "available"
+    spool.close()
+
+
+def test_restart(tmp_path):
+    """A new spool inserts what the last one did not, and nothing twice."""
+    catalog = FlakyCatalog()
+    spool = DocumentSpool(tmp_path, catalog.insert, retry_interval=0.05)
+    sent = run_plans(spool, count([det], 2))
+    assert spool.flush(timeout=5)
+    catalog.down = True
+    sent += run_plans(spool, count([det], 4))
+    spool.close(timeout=0.2)  # Session ends, catalog still down.
+    assert len(catalog.documents) == 5  # First run only.
+
+    # Crash while writing: partial line at the end of a segment.
+    (segment,) = spool._segments()
+    with open(segment, "a") as f:
+        f.write('["event", {"uid": "trunc')
+    spool = DocumentSpool(tmp_path, catalog.insert, retry_interval=0.05)
+    assert spool.pending() == 7  # Second run (not the partial line).
+    catalog.down = False  # After the backlog is counted.
+    assert spool.flush(timeout=5)
+    assert catalog.documents == sent
+    assert spool._segments() == []
+    spool.close()
+
+
+def test_replay_after_crash(tmp_path):
+    """Crash between an insert and its note: the replay inserts it once."""
+    catalog = FlakyCatalog()
+    catalog.down = True
+    spool = DocumentSpool(tmp_path, catalog.insert, retry_interval=0.05)
+    sent = run_plans(spool, count([det], 2))
+    spool.close(timeout=0.2)
+
+    # Inserted, then the crash: no note in the done file.
+    catalog.documents = sent[:2]
+    spool = DocumentSpool(tmp_path, catalog.insert, retry_interval=0.05)
+    assert spool.pending() == 5
+    catalog.down = False  # After the backlog is counted.
+    assert spool.flush(timeout=5)
+    assert catalog.documents == sent
+    assert spool.stats()["rejected"] == 0
+    spool.close()
+
+
+def test_rejected(tmp_path):
+    """A document the catalog refuses is moved aside, the others inserted."""
+    catalog = FlakyCatalog()
+
+    def insert(name, doc):
+        if name == "event" and doc["seq_num"] == 2:
+            raise ValueError("bad event")
+        catalog.insert(name, doc)
+
+    spool = DocumentSpool(tmp_path, insert, retry_interval=0.01, max_attempts=2)
+    sent = run_plans(spool, count([det], 3))
+    assert spool.flush(timeout=5)
+    bad = sent.pop(3)  # start, descriptor, event 1, event 2, ...
+    assert catalog.documents == sent
+    assert spool.rejected == 1
+    assert spool.failures == 2
+    assert spool.pending() == 0
+    assert spool._segments() == []
+    name, doc, error = json.loads((tmp_path / "rejected.jsonl").read_text())
+    assert (name, doc["uid"]) == bad
+    assert "bad event" in error
+    spool.close()
+
+
+def test_databroker(tmp_path):
+    """Runs reach a databroker catalog through the spool."""
+    cat = databroker.temp().v2
+    spool = DocumentSpool(tmp_path, cat.v1.insert)
+    run_plans(spool, count([det], 3))
+    assert spool.flush(timeout=5)
+    assert len(cat[-1].primary.read()["det"]) == 3
+    spool.close()
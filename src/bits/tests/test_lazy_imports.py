@@ -0,0 +1,67 @@
+"""
+Test the utils.lazy_imports module and the import time of bits.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+import bits
+from bits.utils.lazy_imports import lazy_import
+from bits.utils.lazy_imports import module_if_imported
+
+HEAVY_MODULES = """
+    apstools
+    bluesky
+    bluesky_queueserver
+    databroker
+    epics
+    h5py
+    intake
+    IPython
+    matplotlib
+    numpy
+    ophyd
+    pysumreg
+    setuptools_scm
+    spec2nexus
+""".split()
+
+SCRIPT = """
+import sys
+import time
+
+t0 = time.perf_counter()
+import bits.utils.config_loaders
+print(time.perf_counter() - t0)
+print(" ".join(name for name in {heavy} if name in sys.modules))
+"""
+
+
+def test_lazy_import():
+    """A module is imported on first use."""
+    name = "json.tool"  # Not imported by this test session.
+    if module_if_imported(name) is not None:
+        pytest.skip(f"{name!r} already imported")
+    proxy = lazy_import(name)
+    assert not proxy.is_loaded
+    assert "not imported" in repr(proxy)
+    assert name not in sys.modules
+
+    assert callable(proxy.main)
+    assert proxy.is_loaded
+    assert module_if_imported(name) is sys.modules[name]
+
+
+def test_import_time():
+    """'import bits' is fast and does not import heavy modules."""
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, imported = result.stdout.splitlines()[-2:]
+    assert imported.split() == []
+    assert float(elapsed) < bits.IMPORT_TIME_BUDGET
@@ -0,0 +1,262 @@
+"""
+Test the utils.make_devices_yaml module.
+"""
+
+import sys
+import time
+import types
+
+import pytest
+from bluesky import RunEngine
+from bluesky import plan_stubs as bps
+from ophydregistry import Registry
+
+from bits.utils.controls_setup import ThreadSafeRegistry
+from bits.utils.device_manifest import DeviceManifestError
+from bits.utils.lazy_devices import LazyDevice
+from bits.utils.lazy_devices import is_pending
+from bits.utils.make_devices_yaml import DeviceConstructionError
+from bits.utils.make_devices_yaml import Instrument
+
+CREATORS = """
+import time
+
+import ophyd
+
+
+def slow_signal(*, name, delay=0.2):
+    time.sleep(delay)
+    return ophyd.Signal(name=name, value=0)
+
+
+def with_side_signal(*, name):
+    # Another object, made (and not returned) while the devices are made.
+    ophyd.Signal(name=f"{name}_side")
+    return slow_signal(name=name, delay=0.05)
+
+
+def signal_pair(*, name):
+    yield ophyd.Signal(name=f"{name}_a")
+    yield ophyd.Signal(name=f"{name}_b")
+
+
+def broken(*, name):
+    raise ValueError(f"cannot make {name}")
+
+
+SHARED = ophyd.Signal(name="shared")
+
+
+def shared(*, name):
+    SHARED.name = name
+    return SHARED
+
+
+MADE = []
+
+
+def counted(*, name, labels=()):
+    MADE.append(name)
+    return ophyd.Signal(name=name, value=0, labels=labels)
+"""
+
+DEVICES = """
+creators.slow_signal:
+- {name: s1, delay: 0.3}
+- {name: s2}
+- {name: s3}
+- {name: s4, delay: 0.01}
+
+creators.broken:
+- {name: bad1}
+
+creators.signal_pair:
+- {name: pair}
+"""
+
+
+@pytest.fixture
+def devices_file(tmp_path, monkeypatch):
+    """A devices file with slow and broken entries."""
+    (tmp_path / "creators.py").write_text(CREATORS)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    path = tmp_path / "devices.yml"
+    path.write_text(DEVICES)
+    return path
+
+
+@pytest.mark.parametrize("max_workers", [1, 8])
+def test_load(max_workers, devices_file):
+    """All entries are tried, failures reported together, order kept."""
+    registry = ThreadSafeRegistry(auto_register=True)
+    instr = Instrument({}, registry=registry, max_workers=max_workers)
+
+    t0 = time.time()
+    with pytest.raises(DeviceConstructionError) as exinfo:
+        instr.load(devices_file)
+    elapsed = time.time() - t0
+
+    report = str(exinfo.value)
+    assert "1 of 6 device entries failed" in report
+    assert "cannot make bad1" in report
+    names = [device.name for device in instr.unconnected_devices]
+    assert names == "s1 s2 s3 s4 pair_a pair_b".split()
+    for name in names:
+        assert registry[name].name == name
+    if max_workers > 1:
+        assert elapsed < 0.7  # not 0.3 + 0.2 + 0.2 + 0.01
+
+
+def test_parallel_registry(devices_file):
+    """Parallel: all objects made meanwhile are registered."""
+    devices_file.write_text(
+        "creators.with_side_signal:\n- {name: w1}\n- {name: w2}\n- {name: w3}\n"
+    )
+    registry = ThreadSafeRegistry(auto_register=True)
+    instr = Instrument({}, registry=registry, max_workers=3)
+    instr.load(devices_file)
+    assert registry.auto_register
+    for name in "w1 w2 w3 w1_side w2_side w3_side".split():
+        assert registry[name].name == name
+
+    # Not thread-safe: made one at a time.
+    registry = Registry(auto_register=True)
+    instr = Instrument({}, registry=registry, max_workers=3)
+    instr.load(devices_file, incremental=False)
+    assert registry["w2_side"].name == "w2_side"
+
+
+RELOAD_BEFORE = """
+ophyd.Signal:
+- {name: kept, value: 1}
+- {name: changed, value: 1}
+- {name: dropped, value: 1}
+
+creators.shared:
+- {name: shared}
+"""
+
+RELOAD_AFTER = """
+ophyd.Signal:
+- {name: kept, value: 1}
+- {name: changed, value: 2}
+- {name: added, value: 1}
+
+creators.shared:
+- {name: renamed}
+"""
+
+
+def test_reload(devices_file):
+    """Reloading a file only changes the entries that were edited."""
+    registry = Registry(auto_register=True)
+    instr = Instrument({}, registry=registry)
+    devices_file.write_text(RELOAD_BEFORE)
+    instr.load(devices_file)
+    assert instr.changes.created == "kept changed dropped shared".split()
+    before = {name: registry[name] for name in "kept changed dropped".split()}
+
+    devices_file.write_text(RELOAD_AFTER)
+    instr.load(devices_file)
+    changes = instr.changes
+    assert changes.unchanged == ["kept"]
+    assert changes.replaced == ["changed"]
+    assert changes.removed == ["dropped", "shared"]
+    assert changes.created == ["added", "renamed"]
+    assert "1 unchanged" in str(changes)
+
+    assert registry["kept"] is before["kept"]
+    assert not before["kept"]._destroyed
+    assert registry["changed"] is not before["changed"]
+    assert registry["changed"].get() == 2
+    assert before["changed"]._destroyed
+    assert before["dropped"]._destroyed
+    assert registry.find(name="dropped", allow_none=True) is None
+    # Objects provided again by a creator are not destroyed.
+    assert not registry["renamed"]._destroyed
+
+    instr.load(devices_file, incremental=False)
+    assert instr.changes.unchanged == []
+    assert sorted(instr.changes.replaced) == "added changed kept renamed".split()
+
+
+def test_loader_reload(devices_file, monkeypatch):
+    """make_devices() reload: new devices in __main__ and connected."""
+    from bits.utils import make_devices_yaml
+
+    registry = Registry(auto_register=True)
+    namespace = types.SimpleNamespace()
+    monkeypatch.setattr(make_devices_yaml, "_instr", Instrument({}, registry=registry))
+    monkeypatch.setattr(make_devices_yaml, "main_namespace", namespace)
+
+    devices_file.write_text(RELOAD_BEFORE)
+    loaded = []
+    make_devices_yaml._loader(devices_file, loaded=loaded)
+    assert [d.name for d in loaded] == "kept changed dropped shared".split()
+    old = namespace.changed
+
+    devices_file.write_text(RELOAD_AFTER)
+    loaded = []
+    make_devices_yaml._loader(devices_file, loaded=loaded)
+    assert [d.name for d in loaded] == "changed added renamed".split()
+    assert old._destroyed
+    assert namespace.changed is registry["changed"] is loaded[0]
+    assert not namespace.changed._destroyed
+    assert namespace.added is registry["added"]
+    assert namespace.kept is registry["kept"]
+    assert not hasattr(namespace, "dropped")
+    assert not hasattr(namespace, "shared")
+
+
+LAZY_DEVICES = """
+creators.counted:
+- {name: used, labels: [motors]}
+- {name: unused}
+- {name: shutter, eager: true}
+
+creators.signal_pair:
+- {name: pair}
+"""
+
+
+def test_lazy(devices_file):
+    """Devices are made when first used, except 'eager' ones and factories."""
+    registry = Registry(auto_register=True)
+    instr = Instrument({}, registry=registry, lazy=True)
+    devices_file.write_text(LAZY_DEVICES)
+    instr.load(devices_file)
+    made = sys.modules["creators"].MADE
+    assert made == ["shutter"]
+    assert registry.device_names == set("used unused shutter pair_a pair_b".split())
+    proxy = registry.find(label="motors")
+    assert type(proxy) is LazyDevice
+    assert is_pending(proxy)
+    assert made == ["shutter"]
+
+    RE = RunEngine({})
+    RE(bps.mv(proxy, 5))
+    assert made == ["shutter", "used"]
+    assert not is_pending(proxy)
+    assert proxy.get() == 5
+    # The stand-in is replaced by the device.
+    assert type(registry["used"]) is not LazyDevice
+    assert registry["used"] is proxy._lazy_device
+    assert registry.find(label="motors") is registry["used"]
+    assert is_pending(registry["unused"])
+
+    devices_file.write_text(LAZY_DEVICES.replace("unused", "other"))
+    instr.load(devices_file)
+    assert instr.changes.removed == ["unused"]
+    assert made == ["shutter", "used"]
+
+
+def test_invalid_entry(devices_file):
+    """No device is made if any entry is not valid."""
+    registry = Registry(auto_register=True)
+    instr = Instrument({}, registry=registry)
+    devices_file.write_text(LAZY_DEVICES + "\nophyd.Signal:\n- {value: 1}\n")
+    made = list(sys.modules["creators"].MADE)
+    with pytest.raises(DeviceManifestError):
+        instr.load(devices_file)
+    assert sys.modules["creators"].MADE == made
+    assert registry.device_names == set()
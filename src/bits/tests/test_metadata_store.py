@@ -0,0 +1,72 @@
+"""Test the content-addressed store of run metadata."""
+
+import bluesky
+import databroker
+import pytest
+from bluesky.plans import count
+from ophyd.sim import det
+
+from bits.utils.metadata import re_metadata
+from bits.utils.metadata_store import DirectoryStore
+from bits.utils.metadata_store import content_hash
+from bits.utils.metadata_store import metadata_store
+from bits.utils.metadata_store import resolve_metadata
+
+
+def test_directory_store(tmp_path):
+    """Same content, same hash, saved once."""
+    store = DirectoryStore(tmp_path / "md")
+    key = store.put({"b": [1, 2], "a": {"x": None}})
+    assert key == content_hash({"a": {"x": None}, "b": [1, 2]})
+    assert key.startswith("sha256:")
+    assert store.put({"a": {"x": None}, "b": [1, 2]}) == key
+    assert len(list(store.path.rglob("*.json"))) == 1
+    assert store.get(key) == {"a": {"x": None}, "b": [1, 2]}
+    with pytest.raises(KeyError):
+        store.get(content_hash("other"))
+
+
+def test_directory_store_home(tmp_path, monkeypatch):
+    """'~' is the home directory, as in the document spool and run index."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    store = DirectoryStore("~/md")
+    assert store.path == tmp_path / "md"
+    store.put("content")
+    assert (tmp_path / "md").is_dir()
+
+
+def test_re_metadata(tmp_path):
+    """Hashes instead of iconfig & versions, resolved again."""
+    embedded = re_metadata()
+    md = re_metadata(store=DirectoryStore(tmp_path))
+    assert "iconfig" not in md and "versions" not in md
+    assert md["metadata_store"] == str(tmp_path)
+    assert len(repr(md)) < len(repr(embedded)) / 2
+    resolved = resolve_metadata(md)
+    assert resolved["iconfig"] == embedded["iconfig"]
+    assert resolved["versions"] == embedded["versions"]
+    assert "iconfig_hash" not in resolved
+    assert resolve_metadata(embedded) == embedded
+
+
+def test_catalog_store():
+    """Store with the (msgpack) catalog, resolve a run's start document."""
+    cat = databroker.temp().v2
+    RE = bluesky.RunEngine()
+    RE.subscribe(cat.v1.insert)
+    store = metadata_store("catalog", cat)
+    assert store.path.name == "bits_metadata"
+    RE.md.update(re_metadata(cat, store))
+    RE(count([det]))
+    RE(count([det], 2))
+    assert len(list(store.path.rglob("*.json"))) == 2  # iconfig & versions
+
+    start = cat[-1].metadata["start"]
+    assert start["iconfig_hash"] == cat[-2].metadata["start"]["iconfig_hash"]
+    md = resolve_metadata(start)
+    assert md["versions"]["bluesky"] == bluesky.__version__
+    assert md["uid"] == start["uid"]
+
+    assert metadata_store(None) is None
+    with pytest.raises(ValueError):
+        metadata_store("catalog")
@@ -0,0 +1,100 @@
+"""Test the PV connection health monitor."""
+
+import time
+
+import ophyd
+import pytest
+from bluesky import RunEngine
+from bluesky import plan_stubs as bps
+from ophyd.sim import SynAxis
+from ophydregistry import Registry
+
+from bits.utils.controls_setup import oregistry
+from bits.utils.latency import RingBuffer
+from bits.utils.pv_health import DeviceHealthError
+from bits.utils.pv_health import HealthMonitor
+from bits.utils.pv_health import require_healthy
+from bits.utils.pv_health import start_health_monitor
+from bits.utils.pv_health import stop_health_monitor
+
+
+def _set_connected(monitor, signal, connected):
+    """Simulate a connection change of 'signal', wait for 'monitor' to see it."""
+    signal._metadata["connected"] = connected
+    signal._run_metadata_callbacks()  # in another thread
+    t0 = time.monotonic()
+    while monitor.device_health(signal)["connected"] != connected:
+        assert time.monotonic() - t0 < 2
+        time.sleep(0.01)
+
+
+def test_ring_buffer():
+    """keeps the last values only"""
+    buffer = RingBuffer(4)
+    assert buffer.percentile(50) is None
+    for value in range(10):
+        buffer.add(value)
+    assert len(buffer) == 4
+    assert list(buffer.values()) == [6, 7, 8, 9]
+    assert buffer.percentile(100) == 9
+
+
+def test_monitor():
+    """connection changes, put latency, fail-fast plan stub"""
+    registry = Registry(auto_register=False)
+    motor = SynAxis(name="hm1", delay=0.05)
+    flaky = ophyd.Signal(name="flaky", value=1)
+    registry.register(motor)
+    registry.register(flaky)
+
+    RE = RunEngine({})
+    monitor = HealthMonitor(registry, interval=0.05)
+    monitor.attach(RE)
+    monitor.start()
+    try:
+        RE(bps.mv(motor, 1))
+        health = monitor.device_health("hm1")
+        assert health["connected"]
+        assert health["put_p50"] >= 0.04
+
+        for connected in (False, True, False):
+            _set_connected(monitor, flaky, connected)
+        health = monitor.device_health(flaky)
+        assert health["unconnected"] == ["flaky"]
+        assert (health["disconnects"], health["reconnects"]) == (2, 1)
+        assert "NO (1 signals)" in monitor.summary()
+
+        with pytest.raises(DeviceHealthError, match="flaky"):
+            RE(require_healthy([motor, flaky], monitor=monitor))
+        _set_connected(monitor, flaky, True)
+        RE(require_healthy([motor, flaky], monitor=monitor))
+        RE(require_healthy(["hm1", "flaky"], monitor=monitor))  # by name
+        RE(require_healthy(None, monitor=monitor))  # all watched
+        with pytest.raises(DeviceHealthError, match="reconnected 2 times"):
+            RE(require_healthy([flaky], max_reconnects=1, monitor=monitor))
+        with pytest.raises(DeviceHealthError, match="put_p95"):
+            RE(require_healthy([motor], max_latency=0.01, monitor=monitor))
+    finally:
+        monitor.stop()
+
+
+def test_require_healthy_without_monitor():
+    """checks the connections now"""
+    device = ophyd.EpicsSignal("nowhere:health", name="nowhere")
+    with pytest.raises(DeviceHealthError, match="nowhere"):
+        RunEngine({})(require_healthy([device]))
+
+
+def test_start_health_monitor():
+    """Default registry: oregistry."""
+    signal = ophyd.Signal(name="hm_started", value=1)
+    oregistry.register(signal)
+    try:
+        monitor = start_health_monitor()
+        assert monitor.registry is oregistry
+        assert start_health_monitor() is monitor  # once
+        assert monitor.device_health("hm_started")["connected"]
+        RunEngine({})(require_healthy(["hm_started"]))
+    finally:
+        stop_health_monitor()
+        oregistry.pop(signal)
@@ -0,0 +1,70 @@
+"""Test the local (SQLite) index of runs."""
+
+import time
+
+import bluesky
+import databroker
+from bluesky.plans import count
+from bluesky.plans import scan
+from ophyd.sim import det
+from ophyd.sim import motor
+
+from bits.utils.run_index import RunIndex
+from bits.utils.run_index import backfill
+from bits.utils.run_index import main
+
+
+def test_subscription(tmp_path):
+    """Runs indexed as they stop, found by each term."""
+    index = RunIndex(tmp_path / "runs.sqlite")
+    RE = bluesky.RunEngine()
+    RE.subscribe(index)
+    t0 = time.time()
+    (count_uid,) = RE(count([det], 3), scan_id=41, title="dark current")
+    (scan_uid,) = RE(scan([det], motor, 0, 1, 5), scan_id=42, title="align m1")
+    assert len(index) == 2
+
+    assert index.find() == [scan_uid, count_uid]  # newest first
+    assert index.find(scan_id=41) == [count_uid]
+    assert index.find(plan_name="scan") == [scan_uid]
+    assert index.find(title="align%") == [scan_uid]
+    assert index.find(motor=motor.name) == [scan_uid]
+    assert index.find(detector=det.name) == [scan_uid, count_uid]
+    assert index.find(detector=det.name, limit=1) == [scan_uid]
+    assert index.find(since=t0, exit_status="success", scan_id=42) == [scan_uid]
+    assert index.find(until=t0) == []
+    assert index.find(scan_id=43) == []
+
+    md = index.get(scan_uid)
+    assert md["num_events"] == 5
+    assert md["detectors"] == [det.name]
+    assert md["motors"] == [motor.name]
+    assert md["time_stop"] >= md["time_start"] >= t0
+
+
+def test_backfill(tmp_path):
+    """Index the runs already in a catalog, once."""
+    cat = databroker.temp().v2
+    RE = bluesky.RunEngine()
+    RE.subscribe(cat.v1.insert)
+    uids = [RE(count([det]), scan_id=i)[0] for i in range(1, 8)]
+    path = tmp_path / "runs.sqlite"
+    index = RunIndex(path)
+    index.add([])  # nothing
+    assert backfill(cat, index, workers=3, batch=2) == 7
+    assert backfill(cat, index, workers=3, batch=2) == 0  # already indexed
+    assert index.find(scan_id=5) == [uids[4]]
+    assert sorted(index.find(plan_name="count")) == sorted(uids)
+    index.close()
+
+
+def test_command(tmp_path, capsys):
+    """bits-run-index find"""
+    path = tmp_path / "runs.sqlite"
+    index = RunIndex(path)
+    RE = bluesky.RunEngine()
+    RE.subscribe(index)
+    (uid,) = RE(count([det]), scan_id=7)
+    index.close()
+    assert main(["--db", str(path), "find", "--scan-id", "7"]) == 0
+    assert capsys.readouterr().out.split() == [uid]
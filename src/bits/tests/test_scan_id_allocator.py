@@ -0,0 +1,87 @@
+"""Test the scan_id allocator."""
+
+import os
+import subprocess
+import sys
+
+import ophyd
+
+from bits.utils.scan_id_allocator import ScanIdAllocator
+from bits.utils.soft_ioc import soft_ioc
+
+
+def _set_connected(signal, connected):
+    """Simulate a connection change of 'signal'."""
+    signal._metadata["connected"] = connected
+    signal._run_metadata_callbacks()
+
+
+def test_allocator(tmp_path):
+    """local fallback, reconciliation, crash safety, reset"""
+    path = tmp_path / "scan_id"
+    pv = ophyd.Signal(name="scan_id_pv", value=10)
+    allocator = ScanIdAllocator(pv, path, timeout=0.2)
+    allocator.sync()
+    assert allocator() == 11
+    allocator.sync()
+    assert pv.get() == 11
+    assert path.read_text() == "11\n"
+
+    _set_connected(pv, False)
+    assert [allocator(), allocator()] == [12, 13]
+    allocator.sync()
+    assert pv.get() == 11  # not written while disconnected
+    _set_connected(pv, True)
+    allocator.sync()
+    assert pv.get() == 13  # reconciled
+
+    pv.put(20)  # by another session
+    assert allocator() == 21
+    allocator.close()
+
+    pv.put(0)  # such as an IOC restarted without its value
+    allocator = ScanIdAllocator(pv, path, timeout=0.2)
+    assert allocator() == 22  # never given twice
+    allocator.reset(0)
+    assert (allocator(), path.read_text()) == (1, "1\n")
+    allocator.close()
+
+
+CLIENT = """
+import sys
+import ophyd
+from bits.utils.scan_id_allocator import ScanIdAllocator
+
+signal = ophyd.EpicsSignal("test:scan_id", name="scan_id_epics")
+allocator = ScanIdAllocator(signal, sys.argv[1], timeout=float(sys.argv[2]))
+allocator.sync()
+ids = [allocator(), allocator()]
+allocator.sync()
+pv = signal.get() if signal.connected else None
+allocator.close()
+print("RESULT", ids, pv)
+"""
+
+
+def test_allocator_ioc(tmp_path):
+    """against a local caproto IOC, stopped and restarted"""
+    path = tmp_path / "scan_id"
+
+    def client(env, timeout):
+        result = subprocess.run(
+            [sys.executable, "-c", CLIENT, str(path), str(timeout)],
+            env={**os.environ, **env},
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        lines = [line for line in result.stdout.splitlines() if "RESULT" in line]
+        assert len(lines) == 1, result.stderr
+        return lines[0].split(maxsplit=1)[1]
+
+    with soft_ioc(scan_id="test:scan_id") as env:
+        assert client(env, 5) == "[1, 2] 2"
+    assert client(env, 0.5) == "[3, 4] None"  # from the local counter file
+    port = int(env["EPICS_CA_SERVER_PORT"])
+    with soft_ioc(scan_id="test:scan_id", port=port):  # starts at zero again
+        assert client(env, 5) == "[5, 6] 6"
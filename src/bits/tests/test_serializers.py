@@ -0,0 +1,88 @@
+"""
+Test the utils.serializers module.
+"""
+
+import pytest
+import yaml
+
+from bits.utils.config_loaders import load_config_yaml
+from bits.utils.serializers import SERIALIZERS
+from bits.utils.serializers import get_serializer
+from bits.utils.serializers import yaml_load
+from bits.utils.stored_dict import StoredDict
+
+MD = {
+    "a": 1,
+    "b": [1, 2.5, "three", None, True],
+    "c": {"nested": {"deeper": [{"x": 1}]}},
+    "scan_id": 1234,
+}
+
+
+@pytest.mark.parametrize("name", sorted(SERIALIZERS))
+def test_round_trip(name, tmp_path):
+    """Each serializer reads back what it writes."""
+    serializer = get_serializer(name)
+    assert serializer.name == name
+    assert get_serializer(serializer) is serializer
+
+    data = serializer.dumps(MD, title="unit testing")
+    assert isinstance(data, bytes)
+    assert serializer.loads(data) == MD
+    assert serializer.loads(serializer.dumps({})) in ({}, None)
+
+    path = tmp_path / f"md{serializer.suffix}"
+    sdict = StoredDict(path, delay=0.05, serializer=name)
+    sdict.update(MD)
+    sdict["tuple"] = (1, 2)
+    sdict.flush()
+    assert dict(StoredDict(path, serializer=name)) == {**MD, "tuple": [1, 2]}
+
+
+def test_unknown_serializer():
+    """Unknown serializer names are reported."""
+    with pytest.raises(ValueError) as reason:
+        get_serializer("pickle")
+    assert "Unknown serializer" in str(reason)
+
+
+@pytest.mark.parametrize("name", ["json", "msgpack"])
+def test_validation_fragment_reused(name, tmp_path):
+    """The bytes made to validate a value are the bytes written."""
+    sdict = StoredDict(tmp_path / "md", serializer=name)
+    sdict["a"] = {"b": 1}
+    fragment = sdict._fragments["a"]
+    assert isinstance(fragment, bytes)
+    assert fragment in sdict._serialize()
+
+    with pytest.raises(TypeError):
+        sdict["bad"] = object()
+
+
+def test_only_changed_entries_serialized(tmp_path):
+    """A write serializes only the entries changed since the last write."""
+    sdict = StoredDict(tmp_path / "md.yml")
+    sdict.update(MD)
+    sdict.flush()
+    before = dict(sdict._encoded)
+    sdict["scan_id"] += 1
+    sdict.flush()
+    for key in MD:
+        if key != "scan_id":
+            assert sdict._encoded[key][1] is before[key][1]  # reused
+    assert sdict._encoded["scan_id"][1] != before["scan_id"][1]
+
+
+def test_legacy_yaml(tmp_path):
+    """YAML written by 'yaml.dump()' (with python tags): config files only."""
+    text = yaml.dump({"a": (1, 2)})
+    assert "!!python/tuple" in text
+    assert yaml_load(text, legacy=True) == {"a": (1, 2)}
+    with pytest.raises(ValueError, match="Not safe YAML"):
+        yaml_load(text)
+
+    path = tmp_path / "md.yml"
+    path.write_text(text)
+    assert load_config_yaml(path, cache=False) == {"a": (1, 2)}
+    with pytest.raises(ValueError, match="Not safe YAML"):
+        StoredDict(path)  # RE.md: never with the unsafe loader.
@@ -0,0 +1,186 @@
+"""Test the monitor/poll policy of EPICS signals."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+from ophyd import EpicsMotor
+from ophyd import EpicsSignalRO
+
+from bits.utils.device_manifest import DeviceManifestError
+from bits.utils.device_manifest import compile_manifest
+from bits.utils.signal_policy import SignalPolicy
+from bits.utils.signal_policy import check_rules
+from bits.utils.soft_ioc import soft_ioc
+
+
+def test_rules():
+    """Which rules match, last one wins, unconnected motor."""
+    motor = EpicsMotor("pol:m1", name="m1")
+    policy = SignalPolicy(
+        [
+            {"kind": "config", "monitor": False, "timeout": 3},
+            {"device_class": "ophyd.EpicsMotor", "component": "velocity", "timeout": 7},
+            {"device_class": "EpicsScaler", "timeout": 99},
+            {"device": "m[0-9]", "component": "user_readback", "deadband": 0.01},
+            {"device": "other", "monitor": True},
+        ]
+    )
+    assert policy.settings(motor, "velocity", motor.velocity) == {
+        "monitor": False,
+        "timeout": 7,
+    }
+    assert policy.settings(motor, "acceleration", motor.acceleration) == {
+        "monitor": False,
+        "timeout": 3,
+    }
+    assert policy.settings(motor, "user_readback", motor.user_readback) == {
+        "deadband": 0.01
+    }
+    assert policy.settings(motor, "user_setpoint", motor.user_setpoint) == {}
+
+    applied = policy.apply(motor)
+    assert applied["m1_velocity"] == {"timeout": 7, "monitor": False}
+    assert motor.velocity._timeout == 7
+    assert not motor.velocity._auto_monitor
+    assert applied["m1"] == {"deadband": 0.01}
+    # The motor's readback has a subscriber: keeps its monitor.
+    policy.rules.append({"component": "user_readback", "monitor": False})
+    assert policy.apply(motor)["m1"]["monitor"] is True
+    motor.destroy()
+
+
+def test_deadband():
+    """Monitor updates smaller than the deadband are ignored."""
+    motor = EpicsMotor("pol:m2", name="m2")
+    SignalPolicy([{"component": "user_readback", "deadband": 0.1}]).apply(motor)
+    values = []
+    motor.user_readback.subscribe(lambda value, **kw: values.append(value), run=False)
+    for i, value in enumerate([1.0, 1.05, 1.09, 1.2, 1.25, "text", 0.5]):
+        motor.user_readback._read_changed(value=value, timestamp=i + 1.0)
+    assert values == [1.0, 1.2, "text", 0.5]
+    motor.destroy()
+
+
+@pytest.mark.parametrize(
+    "rules",
+    [
+        {"kind": "config"},
+        [{"monitor": False, "colour": "red"}],
+        [{"kind": "important"}],
+        [{"timeout": -1}],
+        [{"deadband": "small"}],
+    ],
+)
+def test_invalid_rules(rules):
+    """Rules that are not valid."""
+    with pytest.raises(ValueError):
+        check_rules(rules)
+
+
+def test_manifest(tmp_path):
+    """'signal_policy' is kept in the entry, not passed to the creator."""
+    path = tmp_path / "devices.yml"
+    path.write_text(
+        "bits.utils.sim_creator.motors:\n"
+        "- {prefix: 'pol:m', first: 1, last: 2, signal_policy: [{monitor: false}]}\n"
+        "ophyd.EpicsMotor:\n"
+        "- {name: m9, prefix: 'pol:m9'}\n"
+    )
+    entries = compile_manifest(path)["entries"]
+    policies = [entry["signal_policy"] for entry in entries]
+    assert policies == [[{"monitor": False}], [{"monitor": False}], []]
+    assert all("signal_policy" not in entry["kwargs"] for entry in entries)
+
+    path.write_text(
+        "ophyd.EpicsMotor:\n"
+        "- {name: m9, prefix: 'pol:m9', signal_policy: [{kind: bad}]}\n"
+    )
+    with pytest.raises(DeviceManifestError, match="kind"):
+        compile_manifest(path)
+
+
+# The control layer is chosen once per process, so each client is a new one.
+CLIENT = """
+from ophyd import EpicsMotor
+
+from bits.utils.controls_setup import set_control_layer
+from bits.utils.signal_policy import policy_report
+
+set_control_layer("{layer}")
+motors = [EpicsMotor(f"pol:m{{i}}", name=f"m{{i}}") for i in (1, 2)]
+for motor in motors:
+    motor.wait_for_connection(timeout=10)
+    motor.velocity.get()
+report = policy_report(motors, [{{"kind": "config", "monitor": False}}], seconds=0.2)
+motors[0].velocity.put(2.5, wait=True)
+print(report)
+print(
+    "RESULT",
+    report.before.monitors,
+    report.after.monitors,
+    motors[0].velocity.get(),
+    motors[1].velocity.get(),
+)
+"""
+
+
+@pytest.mark.parametrize("layer", ["pyepics", "caproto"])
+def test_policy_report(layer, tmp_path):
+    """Fewer monitors after the policy, config signals still read."""
+    with soft_ioc(prefix="pol:m", motors=2) as env:
+        result = subprocess.run(
+            [sys.executable, "-c", CLIENT.format(layer=layer)],
+            env={**os.environ, **env},
+            cwd=tmp_path,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+    lines = [line for line in result.stdout.splitlines() if "RESULT" in line]
+    assert len(lines) == 1, result.stderr[-2000:]
+    before, after, velocity1, velocity2 = lines[0].split()[1:]
+    assert int(after) < int(before), result.stdout
+    assert (float(velocity1), float(velocity2)) == (2.5, 0)
+
+
+PRIVATE_CLIENT = """
+from ophyd import EpicsSignal
+
+from bits.utils.controls_setup import set_control_layer
+from bits.utils.signal_policy import _check_private_api
+
+set_control_layer("{layer}")
+signal = EpicsSignal("pol:x", write_pv="pol:x_sp", name="x")
+_check_private_api(signal)
+print("RESULT", type(signal._read_pv).__module__)
+"""
+
+
+@pytest.mark.parametrize("layer", ["pyepics", "caproto"])
+def test_private_api(layer, tmp_path):
+    """ophyd and the control layer still have the private attributes used."""
+    result = subprocess.run(
+        [sys.executable, "-c", PRIVATE_CLIENT.format(layer=layer)],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    lines = [line for line in result.stdout.splitlines() if "RESULT" in line]
+    assert len(lines) == 1, result.stderr[-2000:]
+    assert lines[0].split()[1].endswith(f"_{layer}_shim")
+
+
+def test_private_api_missing():
+    """A private attribute removed (by a new version) is named at once."""
+
+    class Changed(EpicsSignalRO):
+        pass
+
+    signal = Changed("pol:y", name="y")
+    del signal._monitors
+    with pytest.raises(RuntimeError, match="Changed._monitors not found"):
+        SignalPolicy([{"monitor": False}]).apply(signal)
+    signal.destroy()
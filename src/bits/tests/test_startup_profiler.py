@@ -0,0 +1,66 @@
+"""
+Test the utils.startup_profiler module.
+"""
+
+import json
+import time
+
+from bits.utils import startup_profiler
+from bits.utils.startup_profiler import aggregate_import_times
+from bits.utils.startup_profiler import phase
+from bits.utils.startup_profiler import report
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     yaml.error
+import time:      2000 |       2100 |   yaml
+import time:       500 |        500 |     numpy.core
+import time:      1500 |       2000 |   numpy
+import time:        50 |       4150 | bits
+"""
+
+
+def test_phase():
+    """Phases are timed, nested phases are deeper."""
+    with phase("outer"):
+        with phase("inner"):
+            time.sleep(0.01)
+    names = [entry["name"] for entry in startup_profiler.phases()]
+    assert names.index("outer") < names.index("inner")
+    outer, inner = [
+        entry
+        for entry in startup_profiler.phases()
+        if entry["name"] in ("outer", "inner")
+    ]
+    assert inner["depth"] == outer["depth"] + 1
+    assert outer["seconds"] >= inner["seconds"] >= 0.01
+
+
+def test_aggregate_import_times():
+    """Self times are summed by top-level package, largest first."""
+    totals = aggregate_import_times(IMPORTTIME)
+    assert list(totals) == ["yaml", "numpy", "bits"]
+    assert abs(totals["yaml"] - 0.0021) < 1e-9
+    assert abs(totals["numpy"] - 0.002) < 1e-9
+
+    results = dict(
+        total_seconds=1.5,
+        phases=[dict(name="RunEngine", seconds=0.5, start=0.1, depth=0)],
+        imports=totals,
+    )
+    text = report(results, top=2)
+    assert "RunEngine" in text
+    assert "numpy" in text
+    assert "bits" not in text.split("Import time")[1]
+
+
+def test_main(tmp_path, capsys):
+    """The command profiles startup in a new process."""
+    json_file = tmp_path / "startup.json"
+    assert startup_profiler.main(["--json", str(json_file)]) == 0
+    assert "Startup phases" in capsys.readouterr().out
+    results = json.loads(json_file.read_text())
+    names = [entry["name"] for entry in results["phases"]]
+    for name in ("databroker catalog", "RunEngine", "BestEffortCallback"):
+        assert name in names
+    assert results["total_seconds"] > 0
@@ -2,15 +2,22 @@
 Test the utils.stored_dict module.
 """
 
+import collections
+import copy
+import inspect
 import pathlib
+import subprocess
+import sys
 import tempfile
 import time
+import traceback
 from contextlib import nullcontext as does_not_raise
 
 import pytest
 
 from bits.utils.config_loaders import load_config_yaml
 from bits.utils.stored_dict import StoredDict
+from bits.utils.stored_dict import flush_statistics
 
 
 def luftpause(delay=0.05):
@@ -44,7 +51,6 @@ def test_StoredDict(md_file):
     assert sdict._delay == 0.2
     assert sdict._title == "unit testing"
     assert len(open(md_file).read().splitlines()) == 0  # still empty
-    assert sdict._sync_key == f"sync_agent_{id(sdict):x}"
     assert not sdict.sync_in_progress
 
     # Write an empty dictionary.
@@ -137,3 +143,250 @@ def test_repr(md_file):
     sdict["a"] = 1
     assert repr(sdict) == "<StoredDict {'a': 1}>"
     assert str(sdict) == "<StoredDict {'a': 1}>"
+
+
+def test_coalesced_writes(md_file):
+    """Many quick writes are written to storage together, once."""
+    stats = flush_statistics()
+    sdict = StoredDict(md_file, delay=0.2, title="unit testing")
+    for i in range(10):
+        sdict["a"] = i
+    assert sdict.sync_in_progress
+    assert sdict.coalesced_writes == 9
+    assert flush_statistics()["coalesced"] == stats["coalesced"] + 9
+
+    luftpause(sdict._delay * 2)
+    assert not sdict.sync_in_progress
+    assert load_config_yaml(md_file)["a"] == 9
+    assert flush_statistics()["flushes"] > stats["flushes"]
+
+
+def test_snapshot_copy_on_write(md_file):
+    """Updates after a snapshot do not change the snapshot."""
+    sdict = StoredDict(md_file, delay=0.1, title="unit testing")
+    sdict.update({"a": 1, "b": 2})
+    snapshot = sdict._snapshot()
+    sdict["c"] = 3
+    del sdict["a"]
+    assert snapshot == {"a": 1, "b": 2}
+    assert dict(sdict) == {"b": 2, "c": 3}
+    sdict.flush()
+    assert load_config_yaml(md_file) == {"b": 2, "c": 3}
+
+
+def test_journal(md_file):
+    """Changes are appended to the journal, then compacted."""
+    sdict = StoredDict(md_file, delay=60, journal=True, compact_lines=5)  # flush()
+    journal = sdict._journal_file
+    assert journal.name == f"{md_file.name}.journal"
+    assert not journal.exists()
+
+    sdict.update({"a": 1, "b": [1, 2], 3: "three"})
+    sdict["a"] = 2  # replaces the pending change of "a"
+    del sdict["b"]
+    sdict.flush()
+    assert len(open(md_file).read().splitlines()) == 0  # not compacted yet
+    assert len(journal.read_text().splitlines()) == 3
+
+    again = StoredDict(md_file, journal=True)
+    assert dict(again) == {"a": 2, 3: "three"}
+    assert again._journal_lines == 3
+
+    # An incomplete last line (such as from a crash) is ignored.
+    with open(journal, "a") as f:
+        f.write('{"op": "set", "key": "c", "va')
+    assert dict(StoredDict(md_file, journal=True)) == {"a": 2, 3: "three"}
+    assert len(journal.read_text().splitlines()) == 3  # repaired
+
+    # Past the compaction threshold, the YAML file is rewritten.
+    sdict.update({"c": 3, "d": 4})
+    sdict.flush()
+    assert len(journal.read_text()) == 0
+    assert load_config_yaml(md_file) == {"a": 2, 3: "three", "c": 3, "d": 4}
+    assert dict(StoredDict(md_file, journal=True)) == dict(sdict)
+    journal.unlink()
+
+
+@pytest.mark.parametrize(
+    "md, text",
+    [
+        [{"a": object()}, "not JSON serializable"],
+        [{object(): 1}, "keys must be str, int, float, "],
+    ],
+)
+def test_journal_exceptions(md, text, md_file):
+    """Journal mode validates new content just the same."""
+    sdict = StoredDict(md_file, journal=True)
+    with pytest.raises(TypeError) as reason:
+        sdict.update(md)
+    assert text in str(reason), f"{reason=}"
+    assert len(sdict) == 0
+
+
+def test_shared_reload_only_when_changed(md_file):
+    """Shared mode reads storage again only after another process writes."""
+    first = StoredDict(md_file, delay=0.1, shared=True)
+    second = StoredDict(md_file, delay=0.1, shared=True)
+    first["a"] = 1
+    first.flush()
+    assert second["a"] == 1  # changed on disk: reloaded
+
+    signature = second._signature
+    assert second.get("a") == 1  # unchanged on disk: not reloaded
+    assert second._signature is signature
+
+    # Conflicts are resolved by key.
+    second["b"] = 2
+    first["a"] = 11
+    first.flush()
+    second.flush()
+    assert load_config_yaml(md_file) == {"a": 11, "b": 2}
+    assert dict(first) == {"a": 11, "b": 2}
+    md_file.with_name(f"{md_file.name}.lock").unlink()
+
+
+SHARED_WRITER = """
+import sys
+from bits.utils.stored_dict import StoredDict
+
+md = StoredDict(sys.argv[1], delay=0.01, shared=True, journal=sys.argv[4] == "1")
+for i in range(int(sys.argv[3])):
+    md.increment("scan_id")
+    md[f"writer_{sys.argv[2]}"] = i + 1
+md.flush()
+"""
+
+
+@pytest.mark.parametrize("journal", [False, True])
+def test_shared_multiprocess_stress(journal, md_file, tmp_path):
+    """Many processes write to the same file at the same time."""
+    n_writers, n_increments = 8, 25
+    writers = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                SHARED_WRITER,
+                str(md_file),
+                str(i),
+                str(n_increments),
+                str(int(journal)),
+            ],
+            cwd=tmp_path,
+        )
+        for i in range(n_writers)
+    ]
+    for writer in writers:
+        assert writer.wait(timeout=120) == 0
+
+    md = StoredDict(md_file, shared=True, journal=journal)
+    assert md["scan_id"] == n_writers * n_increments  # no scan_id collisions
+    for i in range(n_writers):
+        assert md[f"writer_{i}"] == n_increments
+    for suffix in ("journal", "lock"):
+        md_file.with_name(f"{md_file.name}.{suffix}").unlink(missing_ok=True)
+
+
+def test_write_cost(md_file, monkeypatch):
+    """'RE.md[key] = value' neither walks the stack nor writes each time."""
+
+    def no_stack(*args, **kwargs):
+        raise AssertionError("StoredDict walked the call stack.")
+
+    monkeypatch.setattr(inspect, "stack", no_stack)
+    monkeypatch.setattr(inspect, "getouterframes", no_stack)
+    monkeypatch.setattr(traceback, "extract_stack", no_stack)
+
+    sdict = StoredDict(md_file, delay=60)
+    writes = []
+    monkeypatch.setattr(sdict, "_write_storage", lambda: writes.append(dict(sdict)))
+    n_writes = 2_000
+
+    def deep(depth):
+        if depth > 0:
+            return deep(depth - 1)
+        for i in range(n_writes):
+            sdict["scan_id"] = i
+
+    before = flush_statistics()
+    deep(300)
+    after = flush_statistics()
+    assert after["scheduled"] - before["scheduled"] == 1  # One pending write,
+    assert after["coalesced"] - before["coalesced"] == n_writes - 1  # moved.
+    assert sdict.coalesced_writes == n_writes - 1
+    assert writes == []
+
+    sdict.flush()
+    assert writes == [{"scan_id": n_writes - 1}]
+
+
+def test_track_nested(md_file):
+    """Changes within nested containers are written to storage."""
+    sdict = StoredDict(md_file, delay=0.05, track_nested=True)
+    sdict["sample"] = {"name": "Si", "env": {"T": 20}, "tags": ["a"]}
+    sdict["other"] = {"x": 1}
+    sdict.flush()
+    fragment = sdict._encoded["other"][1]
+
+    sample = sdict["sample"]
+    assert sample == {"name": "Si", "env": {"T": 20}, "tags": ["a"]}
+    assert sdict["sample"] is sample  # tracked once, not copied on each access
+    sample["env"]["T"] = 300
+    sample["tags"].append("b")
+    sample.setdefault("holder", []).append({"slot": 1})
+    sample["holder"][0]["slot"] = 2
+    assert sdict.sync_in_progress
+    sdict.flush()
+    assert sdict._encoded["other"][1] is fragment  # not serialized again
+    expected = {"name": "Si", "env": {"T": 300}, "tags": ["a", "b"]}
+    expected["holder"] = [{"slot": 2}]
+    assert load_config_yaml(md_file)["sample"] == expected
+
+    with pytest.raises(TypeError) as exinfo:
+        sample["env"]["bad"] = object()
+    assert "not JSON serializable" in str(exinfo)
+    assert "bad" not in sample["env"]
+
+    # Copies are plain containers.
+    assert type(dict(sample)) is dict
+    assert type(sample.copy()) is dict
+
+    # A replaced container is no longer part of the dictionary.
+    sdict["sample"] = {}
+    sdict.flush()
+    sample["name"] = "Ge"
+    assert not sdict.sync_in_progress
+    assert load_config_yaml(md_file)["sample"] == {}
+
+
+def test_track_nested_journal(md_file):
+    """Nested changes are journaled by key path."""
+    sdict = StoredDict(md_file, delay=0.05, journal=True, track_nested=True)
+    journal = sdict._journal_file
+    sdict["sample"] = {"name": "Si", "env": {"T": 20}, "tags": ["a"]}
+    sdict["sample"]["env"]["T"] = 300
+    sdict["sample"]["tags"].insert(0, "z")
+    del sdict["sample"]["name"]
+    sdict["sample"]["env"]["T"] = 301  # replaces the pending change of this path
+    sdict.flush()
+
+    lines = journal.read_text().splitlines()
+    assert len(lines) == 4
+    assert '"path": ["sample", "env", "T"], "value": 301' in lines[-1]
+    assert dict(StoredDict(md_file, journal=True)) == {
+        "sample": {"env": {"T": 301}, "tags": ["z", "a"]}
+    }
+    journal.unlink()
+
+
+def test_copy(md_file):
+    """Copies are plain dictionaries."""
+    sdict = StoredDict(md_file, delay=0.05)
+    sdict["a"] = {"b": [1, 2]}
+    for action in (copy.copy, copy.deepcopy):
+        result = action(sdict)
+        assert type(result) is dict
+        assert result == {"a": {"b": [1, 2]}}
+    assert copy.deepcopy(sdict)["a"] is not sdict["a"]
+    chain = copy.deepcopy(collections.ChainMap({"c": 3}, sdict))  # as in bluesky
+    assert chain["a"] == {"b": [1, 2]}
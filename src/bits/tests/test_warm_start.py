@@ -0,0 +1,49 @@
+"""
+Test the utils.warm_start module.
+"""
+
+import multiprocessing
+
+import pytest
+
+from bits.utils import warm_start
+from bits.utils.warm_start import prepare_template
+from bits.utils.warm_start import ready_latency
+
+THREADED_MODULE = """
+import threading
+import time
+
+threading.Thread(target=time.sleep, args=(1,), daemon=True).start()
+"""
+
+
+def _report_from_worker(queue):
+    """Runs in the forked worker."""
+    queue.put((warm_start._forked_at is not None, ready_latency()))
+
+
+def test_prepare_template(tmp_path, monkeypatch):
+    """Modules are imported, unless they start threads."""
+    times = prepare_template(["colorsys", "json"])
+    assert list(times) == ["colorsys", "json"]
+
+    (tmp_path / "starts_a_thread.py").write_text(THREADED_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    with pytest.raises(RuntimeError) as exinfo:
+        prepare_template(["starts_a_thread"])
+    assert "Remove it from WARM_START.MODULES" in str(exinfo)
+
+
+def test_forked_worker():
+    """A forked worker knows when it was forked."""
+    prepare_template(["colorsys"])
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    worker = context.Process(target=_report_from_worker, args=(queue,))
+    worker.start()
+    forked, latency = queue.get(timeout=60)
+    worker.join()
+    assert forked
+    assert 0 <= latency < 60
+    assert warm_start._forked_at is None  # not in this process
@@ -0,0 +1,88 @@
+"""
+Create EPICS channels in bulk
+=============================
+
+Create (and connect) the EPICS channels of many devices at once, before
+the devices are made.
+
+When the channels are already connected, making each device does not
+wait for its channels one device at a time.  The channels are made
+through ophyd's control layer (``ophyd.cl``), which keeps them for the
+devices to use.
+
+EXAMPLE::
+
+    names = [pv for i in range(1, 65) for pv in pv_names(EpicsMotor, f"ioc:m{i}")]
+    channels, unconnected = connect_channels(names, timeout=10)
+    motors = [EpicsMotor(f"ioc:m{i}", name=f"m{i}") for i in range(1, 65)]
+
+Only the PVs that can be known from the device class are created:
+components (not lazy) of ``EpicsSignal``, ``EpicsSignalRO``,
+``EpicsSignalWithRBV``, and of sub-devices.  Other PVs (such as those of
+a ``FormattedComponent``) are created when the device is made.
+
+.. autosummary::
+    ~connect_channels
+    ~pv_names
+"""
+
+import logging
+import time
+
+import ophyd
+from ophyd import Component
+from ophyd import Device
+from ophyd.areadetector import EpicsSignalWithRBV
+from ophyd.signal import EpicsSignalBase
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+
+def pv_names(klass, prefix=""):
+    """
+    PV names (list) of the channels a 'klass' device with 'prefix' creates.
+
+    Includes only the PVs known from the class (see the module notes).
+    """
+    names = []
+    for cpt in getattr(klass, "_sig_attrs", {}).values():
+        if cpt.lazy or type(cpt) is not Component:
+            continue  # Not made with the device, or not a simple suffix.
+        suffix = prefix + (cpt.suffix or "")
+        if issubclass(cpt.cls, Device):
+            names += pv_names(cpt.cls, suffix)
+        elif issubclass(cpt.cls, EpicsSignalWithRBV):
+            names += [suffix + "_RBV", suffix]
+        elif issubclass(cpt.cls, EpicsSignalBase):
+            names.append(suffix)
+            write_pv = cpt.kwargs.get("write_pv")
+            if write_pv is not None:
+                names.append(prefix + write_pv)
+    return names
+
+
+def connect_channels(names, timeout=10, poll=0.01):
+    """
+    Create the channels for PVs 'names' and wait (once) for them to connect.
+
+    Returns ``(channels, unconnected)``: the channel objects (keep them
+    until the devices are made) and the names of any PVs not connected
+    within 'timeout' seconds.
+    """
+    t0 = time.monotonic()
+    channels = [ophyd.cl.get_pv(name) for name in dict.fromkeys(names)]
+    waiting = channels
+    while True:
+        waiting = [channel for channel in waiting if not channel.connected]
+        if len(waiting) == 0 or time.monotonic() - t0 > timeout:
+            break
+        time.sleep(poll)
+    unconnected = [channel.pvname for channel in waiting]
+    logger.debug(
+        "%d channels created, %d connected in %.3f s.",
+        len(channels),
+        len(channels) - len(unconnected),
+        time.monotonic() - t0,
+    )
+    return channels, unconnected
@@ -4,15 +4,33 @@ Load configuration files
 
 Load supported configuration files, such as ``iconfig.yml``.
 
+Parsed YAML files are cached (see :func:`config_cache_dir`), keyed by the
+file's path, modification time, size, and content hash.  A process start
+with unchanged configuration files reads the cache instead of parsing YAML.
+
+The ``iconfig`` object is read-only.  When the file changes, :meth:`IConfig.reload`
+(or a watcher started by :meth:`IConfig.watch`) replaces its content as a whole.
+Values already used (such as during startup) are not changed.
+
 .. autosummary::
+    ~config_cache_dir
+    ~freeze
     ~load_config_yaml
+    ~FrozenDict
+    ~IConfig
     ~IConfigFileVersionError
 """
 
+import collections.abc
+import hashlib
 import logging
+import marshal
+import os
 import pathlib
+import sys
+import threading
 
-import yaml
+from .serializers import yaml_load
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
@@ -21,9 +39,66 @@ DEFAULT_ICONFIG_YML_FILE = (
     instrument_path / "demo_instrument" / "configs" / "iconfig.yml"
 )
 ICONFIG_MINIMUM_VERSION = "2.0.0"
+CACHE_FORMAT = 1  # Change when the cache file content changes.
 
 
-def load_config_yaml(iconfig_yml=None) -> dict:
+def config_cache_dir():
+    """
+    Directory for the cache of parsed configuration files, or None.
+
+    Environment variable ``BITS_CACHE_DIR`` names the directory.  Set it to
+    an empty string to disable the cache.
+    Default: ``$XDG_CACHE_HOME/bits`` (``~/.cache/bits``)
+    """
+    name = os.environ.get("BITS_CACHE_DIR")
+    if name is None:
+        base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+        return pathlib.Path(base) / "bits"
+    if name == "":
+        return None
+    return pathlib.Path(name)
+
+
+def _parse_cached(path):
+    """Parse YAML file 'path', using the cache if its entry is current."""
+    st = path.stat()
+    data = path.read_bytes()
+    cache_dir = config_cache_dir()
+    if cache_dir is None:
+        return yaml_load(data, legacy=True)
+
+    resolved = str(path.resolve())
+    key = (
+        CACHE_FORMAT,
+        sys.implementation.cache_tag,
+        resolved,
+        st.st_mtime_ns,
+        st.st_size,
+        hashlib.sha256(data).hexdigest(),
+    )
+    name = hashlib.sha256(resolved.encode()).hexdigest()[:24]
+    cache_file = cache_dir / f"{path.stem}-{name}.marshal"
+    try:
+        # marshal, unlike pickle, cannot run code when loaded.
+        cached_key, contents = marshal.loads(cache_file.read_bytes())
+        if cached_key == key:
+            logger.debug("Configuration from cache: %s", path)
+            return contents
+    except (OSError, EOFError, TypeError, ValueError):
+        pass  # Not cached (or unreadable).  Parse the file.
+
+    contents = yaml_load(data, legacy=True)
+    try:
+        cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        temporary = cache_file.with_name(f".{cache_file.name}.{os.getpid()}.tmp")
+        temporary.write_bytes(marshal.dumps((key, contents)))
+        os.replace(temporary, cache_file)
+    except (OSError, ValueError) as exc:  # ValueError: not marshal-able
+        logger.debug("Could not cache %s: %s", path, exc)
+    return contents
+
+
+def load_config_yaml(iconfig_yml=None, cache=True) -> dict:
     """
     Load iconfig.yml (and other YAML) configuration files.
 
@@ -33,6 +108,9 @@ def load_config_yaml(iconfig_yml=None) -> dict:
         Name of the YAML file to be loaded.  The name can be
         absolute or relative to the current working directory.
         Default: ``INSTRUMENT/demo_instrument/configs/iconfig.yml``
+    cache: bool
+        Use the cache of parsed configuration files.
+        Default: ``True``
     """
 
     if iconfig_yml is None:
@@ -41,22 +119,197 @@ def load_config_yaml(iconfig_yml=None) -> dict:
         path = pathlib.Path(iconfig_yml)
     if not path.exists():
         raise FileExistsError(f"Configuration file '{path}' does not exist.")
-    iconfig = yaml.load(open(path, "r").read(), yaml.Loader)
-    return iconfig
+    if cache:
+        return _parse_cached(path)
+    return yaml_load(path.read_bytes(), legacy=True)
 
 
 class IConfigFileVersionError(ValueError):
     """Configuration file version too old."""
 
 
-iconfig = load_config_yaml(DEFAULT_ICONFIG_YML_FILE)
+class FrozenDict(dict):
+    """
+    Read-only dictionary.
+
+    Methods that would change the content raise ``TypeError``.
+    Use :func:`freeze` to make one from nested dictionaries and lists.
 
-# Validate the iconfig file has the minimum version.
-_version = iconfig.get("ICONFIG_VERSION")
-if _version is None or _version < ICONFIG_MINIMUM_VERSION:
-    raise IConfigFileVersionError(
-        "Configuration file version too old."
-        f" Found {_version!r}."
-        f" Expected minimum {ICONFIG_MINIMUM_VERSION!r}."
-        f" Configuration file '{DEFAULT_ICONFIG_YML_FILE}'."
-    )
+    .. autosummary::
+        ~to_dict
+    """
+
+    def _read_only(self, *args, **kwargs):
+        """Raise TypeError."""
+        raise TypeError(f"{self.__class__.__name__} is read-only.")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        """Immutable: copies are not needed."""
+        return self
+
+    def __deepcopy__(self, memo):
+        """Immutable: copies are not needed."""
+        return self
+
+    def __reduce__(self):
+        """Pickle support."""
+        return self.__class__, (dict(self),)
+
+    def __repr__(self):
+        """representation of this object."""
+        return f"{self.__class__.__name__}({dict.__repr__(self)})"
+
+    def to_dict(self):
+        """Return a plain (mutable) copy: dictionaries and lists."""
+        return _thaw(self)
+
+
+def freeze(contents):
+    """Read-only copy of 'contents': dictionaries become FrozenDict, lists tuples."""
+    if isinstance(contents, dict):
+        return FrozenDict({k: freeze(v) for k, v in contents.items()})
+    if isinstance(contents, (list, tuple)):
+        return tuple(freeze(v) for v in contents)
+    return contents
+
+
+def _thaw(contents):
+    """Mutable copy of frozen 'contents'."""
+    if isinstance(contents, dict):
+        return {k: _thaw(v) for k, v in contents.items()}
+    if isinstance(contents, tuple):
+        return [_thaw(v) for v in contents]
+    return contents
+
+
+def _file_signature(path):
+    """Identify the present content of file 'path' without reading it."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _validate_version(config, path):
+    """Validate the iconfig file has the minimum version."""
+    version = config.get("ICONFIG_VERSION")
+    if version is None or version < ICONFIG_MINIMUM_VERSION:
+        raise IConfigFileVersionError(
+            "Configuration file version too old."
+            f" Found {version!r}."
+            f" Expected minimum {ICONFIG_MINIMUM_VERSION!r}."
+            f" Configuration file '{path}'."
+        )
+
+
+class IConfig(collections.abc.Mapping):
+    """
+    Read-only instrument configuration (``iconfig``), from a YAML file.
+
+    Changes to the file are used after :meth:`reload`, which replaces the
+    whole configuration at once.  Each value, once read, is consistent
+    (never a mixture of old and new content).
+
+    .. autosummary::
+        ~reload
+        ~to_dict
+        ~unwatch
+        ~watch
+    """
+
+    def __init__(self, path=DEFAULT_ICONFIG_YML_FILE):
+        """Load (and validate) configuration file 'path'."""
+        self.path = pathlib.Path(path)
+        self._config = FrozenDict()
+        self._signature = None
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def __getitem__(self, key):
+        """Get configuration value by key."""
+        return self._config[key]
+
+    def __iter__(self):
+        """Iterate over the configuration keys."""
+        return iter(self._config)
+
+    def __len__(self):
+        """Number of configuration keys."""
+        return len(self._config)
+
+    def __repr__(self):
+        """representation of this object."""
+        return f"<{self.__class__.__name__} {str(self.path)!r}>"
+
+    def __deepcopy__(self, memo):
+        """The present configuration (immutable)."""
+        return self._config
+
+    def reload(self):
+        """Read the file again.  Returns True if the configuration changed."""
+        signature = _file_signature(self.path)
+        config = freeze(load_config_yaml(self.path))
+        _validate_version(config, self.path)
+        changed = config != self._config
+        self._config = config  # Replaced at once.
+        self._signature = signature
+        return changed
+
+    def to_dict(self):
+        """Return a plain (mutable) copy of the configuration."""
+        return self._config.to_dict()
+
+    def watch(self, interval=2.0, callback=None):
+        """
+        Start a thread to reload the configuration when the file changes.
+
+        PARAMETERS
+
+        interval : float
+            Check the file every 'interval' seconds.
+        callback : callable or None
+            Call ``callback(iconfig)`` after each change.
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(
+            target=self._watch,
+            args=(max(0.01, interval), callback),
+            name="iconfig_watcher",
+            daemon=True,
+        )
+        self._watcher.start()
+
+    def unwatch(self):
+        """Stop watching the file."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+        self._watcher = None
+
+    def _watch(self, interval, callback):
+        """Threaded task."""
+        logger.debug("Watching %s for changes.", self.path)
+        while not self._stop.wait(interval):
+            if _file_signature(self.path) == self._signature:
+                continue
+            try:
+                changed = self.reload()
+            except Exception as exc:
+                # Keep the present configuration.  Try again after the next edit.
+                self._signature = _file_signature(self.path)
+                logger.error("Could not reload %s: %s", self.path, exc)
+                continue
+            if changed:
+                logger.info("Configuration reloaded: %s", self.path)
+                if callback is not None:
+                    callback(self)
+
+
+iconfig = IConfig(DEFAULT_ICONFIG_YML_FILE)
@@ -0,0 +1,156 @@
+"""
+Wait for devices to connect
+===========================
+
+A plan stub that waits until devices are connected, instead of waiting
+a fixed time.  The wait ends when every device is connected, or at a
+deadline (whichever comes first).  The RunEngine keeps running (other
+callbacks, pause requests) while it waits.
+
+EXAMPLE::
+
+    report = yield from wait_for_connections([m1, scaler1], timeout=10)
+    if not report.connected:
+        print(report.unconnected)
+
+The report gives each device's connection latency (seconds after the
+wait started) and the names of the signals that did not connect.
+
+.. autosummary::
+    ~wait_for_connections
+    ~ConnectionReport
+"""
+
+import logging
+import time
+
+from bluesky import plan_stubs as bps
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+DEFAULT_POLL = 0.05  # seconds between checks
+DEFAULT_TIMEOUT = 10  # seconds
+
+
+def _is_connected(device):
+    """Is 'device' connected?  Objects without 'connected' always are."""
+    return getattr(device, "connected", True)
+
+
+def _unconnected_signals(device):
+    """Names of the signals of 'device' that are not connected."""
+    if not hasattr(device, "walk_signals"):
+        return [device.name]  # a Signal
+    names = [
+        walk.item.name
+        for walk in device.walk_signals(include_lazy=False)
+        if not walk.item.connected
+    ]
+    # A device also waits for its own setup (after its signals connect).
+    return names or [device.name]
+
+
+class ConnectionReport:
+    """
+    Result of :func:`wait_for_connections`.
+
+    .. autosummary::
+        ~connected
+        ~latency
+        ~unconnected
+        ~elapsed
+    """
+
+    def __init__(self, latency, unconnected, elapsed):
+        """Connection results of a wait."""
+        self.latency = latency
+        """Seconds (after the wait started) to connect, by device name."""
+        self.unconnected = unconnected
+        """Signals not connected, by device name."""
+        self.elapsed = elapsed
+        """Seconds waited."""
+
+    @property
+    def connected(self):
+        """Are all the devices connected?"""
+        return len(self.unconnected) == 0
+
+    def __str__(self):
+        """Table of the devices, slowest first."""
+        import pyRestTable
+
+        table = pyRestTable.Table()
+        table.labels = "device latency_s unconnected_signals".split()
+        for name in self.unconnected:
+            signals = self.unconnected[name]
+            text = ", ".join(signals[:5])
+            if len(signals) > 5:
+                text += f", ... ({len(signals)} total)"
+            table.addRow((name, "--", text))
+        ranked = sorted(self.latency.items(), key=lambda item: item[1], reverse=True)
+        for name, seconds in ranked:
+            table.addRow((name, f"{seconds:.3f}", ""))
+        return str(table)
+
+    def __repr__(self):
+        """representation of this object."""
+        return (
+            f"<{self.__class__.__name__}"
+            f" connected={len(self.latency)}"
+            f" unconnected={len(self.unconnected)}"
+            f" elapsed={self.elapsed:.3f}>"
+        )
+
+
+def wait_for_connections(devices, *, timeout=DEFAULT_TIMEOUT, poll=DEFAULT_POLL):
+    """
+    (plan stub) Wait until 'devices' are connected or 'timeout' has passed.
+
+    Returns a :class:`ConnectionReport`, which is also logged.  Does not
+    raise if devices are not connected at the deadline.
+
+    PARAMETERS
+
+    devices : list
+        Objects to wait for.  Those without a ``connected`` attribute
+        (such as ophyd-async devices) are not waited for.
+    timeout : float
+        Stop waiting after 'timeout' seconds (default: 10).
+    poll : float
+        Check the devices every 'poll' seconds (default: 0.05).
+    """
+    t0 = time.monotonic()
+    latency = {}
+    waiting = list(devices)
+    while True:
+        elapsed = time.monotonic() - t0
+        still_waiting = []
+        for device in waiting:
+            if _is_connected(device):
+                latency[device.name] = elapsed
+            else:
+                still_waiting.append(device)
+        waiting = still_waiting
+        remaining = timeout - elapsed
+        if len(waiting) == 0 or remaining <= 0:
+            break
+        yield from bps.sleep(min(poll, remaining))
+
+    report = ConnectionReport(
+        latency,
+        {device.name: _unconnected_signals(device) for device in waiting},
+        time.monotonic() - t0,
+    )
+    if report.connected:
+        logger.info("%d devices connected in %.3f s.", len(latency), report.elapsed)
+        logger.debug("Device connection latency:\n%s", report)
+    else:
+        logger.warning(
+            "%d of %d devices not connected after %.3f s:\n%s",
+            len(report.unconnected),
+            len(latency) + len(report.unconnected),
+            report.elapsed,
+            report,
+        )
+    return report
@@ -4,6 +4,7 @@ EPICS & ophyd related setup
 
 .. autosummary::
     ~oregistry
+    ~ThreadSafeRegistry
     ~set_control_layer
     ~set_timeouts
     ~epics_scan_id_source
@@ -11,6 +12,8 @@ EPICS & ophyd related setup
 """
 
 import logging
+import os
+import threading
 
 import ophyd
 from ophyd.signal import EpicsSignalBase
@@ -24,6 +27,7 @@ logger.bsdev(__file__)
 re_config = iconfig.get("RUN_ENGINE", {})
 
 DEFAULT_CONTROL_LAYER = "PyEpics"
+CONTROL_LAYERS = ("PyEpics", "caproto")
 DEFAULT_TIMEOUT = 60  # default used next...
 ophyd_config = iconfig.get("OPHYD", {})
 
@@ -41,6 +45,9 @@ def epics_scan_id_source(_md):
 
     Exception will be raised if PV is not connected when next
     ``bps.open_run()`` is called.
+
+    :func:`connect_scan_id_pv` uses a
+    :class:`~instrument.utils.scan_id_allocator.ScanIdAllocator` instead.
     """
     scan_id_epics = oregistry.find(name="scan_id_epics")
     new_scan_id = max(scan_id_epics.get(), 0) + 1
@@ -48,12 +55,21 @@ def epics_scan_id_source(_md):
     return new_scan_id
 
 
-def connect_scan_id_pv(RE, pv: str = None):
+def connect_scan_id_pv(RE, pv: str = None, path: str = None):
     """
     Define a PV to use for the RunEngine's `scan_id`.
+
+    The scan_id is allocated by a
+    :class:`~instrument.utils.scan_id_allocator.ScanIdAllocator`, with
+    local counter file 'path' (default: ``RUN_ENGINE.SCAN_ID_FILE`` in
+    iconfig, or ``.scan_id``) for when the PV is not available.  Returns
+    the allocator (None if no PV).
     """
     from ophyd import EpicsSignal
 
+    from .scan_id_allocator import DEFAULT_FILE
+    from .scan_id_allocator import ScanIdAllocator
+
     pv = pv or re_config.get("SCAN_ID_PV")
     if pv is None:
         return
@@ -64,50 +80,114 @@ def connect_scan_id_pv(RE, pv: str = None):
         return
     logger.info("Using EPICS PV %r for RunEngine 'scan_id'", pv)
 
-    # Setup the RunEngine to call epics_scan_id_source()
-    # which uses the EPICS PV to provide the scan_id.
-    RE.scan_id_source = epics_scan_id_source
-
-    scan_id_epics.wait_for_connection()
+    # The PV connects in the background.  Runs do not wait for it.
+    allocator = ScanIdAllocator(
+        scan_id_epics, path or re_config.get("SCAN_ID_FILE", DEFAULT_FILE)
+    )
+    RE.scan_id_source = allocator
     try:
         RE.md["scan_id_pv"] = scan_id_epics.pvname
-        RE.md["scan_id"] = scan_id_epics.get()  # set scan_id from EPICS
+        RE.md["scan_id"] = allocator.last
     except TypeError:
         pass  # Ignore PersistentDict errors that only raise when making the docs
+    return allocator
 
 
-def set_control_layer(control_layer: str = DEFAULT_CONTROL_LAYER):
+def set_control_layer(control_layer: str = None):
     """
     Communications library between ophyd and EPICS Channel Access.
 
     Choices are: PyEpics (default) or caproto.
 
-    OPHYD_CONTROL_LAYER is an application of "lessons learned."
+    The first of these is used:
 
-    Only used in a couple rare cases where PyEpics code was failing.
-    It's defined here since it was difficult to find how to do this
-    in the ophyd documentation.
-    """
+    * 'control_layer', if given,
+    * environment variable ``OPHYD_CONTROL_LAYER`` (as with ophyd),
+    * ``OPHYD.CONTROL_LAYER`` in iconfig,
+    * PyEpics.
 
-    control_layer = ophyd_config.get("CONTROL_LAYER", control_layer)
+    Call before any EPICS signal is created: signals made already keep
+    the control layer they were made with.
+    """
+    from ophyd.signal import EpicsSignalBase
+
+    control_layer = (
+        control_layer
+        or os.environ.get("OPHYD_CONTROL_LAYER")
+        or ophyd_config.get("CONTROL_LAYER")
+        or DEFAULT_CONTROL_LAYER
+    )
+    if control_layer.lower() not in [layer.lower() for layer in CONTROL_LAYERS]:
+        raise ValueError(
+            f"Unknown control layer {control_layer!r}.  Use one of {CONTROL_LAYERS}."
+        )
+    previous = getattr(getattr(ophyd, "cl", None), "name", None)
+    if (
+        previous not in (None, control_layer.lower())
+        and EpicsSignalBase._EpicsSignalBase__any_instantiated
+    ):
+        logger.warning(
+            "Control layer changed from %r to %r after EPICS signals were made.",
+            previous,
+            control_layer,
+        )
     ophyd.set_cl(control_layer.lower())
 
     logger.info("using ophyd control layer: %r", ophyd.cl.name)
 
 
 def set_timeouts():
-    """Set default timeout for all EpicsSignal connections & communications."""
+    """
+    Set default timeout for all EpicsSignal connections & communications.
+
+    The same timeouts apply with either control layer.  With caproto,
+    PV_READ is also the timeout of operations that ophyd does not time
+    (the caproto client's default).
+    """
+    timeouts = ophyd_config.get("TIMEOUTS", {})
     if not EpicsSignalBase._EpicsSignalBase__any_instantiated:
         # Only BEFORE any EpicsSignalBase (or subclass) are created!
-        timeouts = ophyd_config.get("TIMEOUTS", {})
         EpicsSignalBase.set_defaults(
             auto_monitor=True,
             timeout=timeouts.get("PV_READ", DEFAULT_TIMEOUT),
             write_timeout=timeouts.get("PV_WRITE", DEFAULT_TIMEOUT),
-            connection_timeout=iconfig.get("PV_CONNECTION", DEFAULT_TIMEOUT),
+            connection_timeout=timeouts.get("PV_CONNECTION", DEFAULT_TIMEOUT),
         )
+    if ophyd.cl.name == "caproto":
+        from caproto.threading.pyepics_compat import PV
+
+        PV.default_context().timeout = timeouts.get("PV_READ", DEFAULT_TIMEOUT)
+
+
+class ThreadSafeRegistry(Registry):
+    """
+    Registry that may be changed from several threads at once.
+
+    Ophyd objects made in other threads (such as by
+    ``make_devices()`` in parallel) are registered one at a time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Registry with a lock."""
+        self._lock = threading.RLock()
+        super().__init__(*args, **kwargs)
+
+    def register(self, component, labels=None):
+        """Register 'component' (see 'ophydregistry.Registry.register()')."""
+        with self._lock:
+            return super().register(component, labels=labels)
+
+    def pop(self, *args, **kwargs):
+        """Remove an item (see 'ophydregistry.Registry.pop()')."""
+        with self._lock:
+            return super().pop(*args, **kwargs)
+
+    def clear(self, *args, **kwargs):
+        """Remove all items (see 'ophydregistry.Registry.clear()')."""
+        with self._lock:
+            return super().clear(*args, **kwargs)
 
 
-oregistry = Registry(auto_register=True)
+oregistry = ThreadSafeRegistry(auto_register=True)
 """Registry of all ophyd-style Devices and Signals."""
 oregistry.warn_duplicates = False
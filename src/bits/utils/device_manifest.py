@@ -0,0 +1,234 @@
+"""
+Device manifests
+================
+
+A devices file (such as ``devices.yml``), compiled into the list of
+devices to be made: one entry for each device, with its creator's import
+path and keyword arguments.
+
+Compiling a devices file:
+
+* imports each creator (once per session, see :func:`resolve_creator`),
+* expands factories that describe a range of devices (such as
+  :func:`~instrument.utils.sim_creator.motors`) into one entry per device,
+* validates the keyword arguments of every entry against its creator
+  (and its ``signal_policy`` rules, if any).
+
+All problems are reported together (:class:`DeviceManifestError`) before
+any device is made.
+
+The manifest is saved next to the devices file (``.devices.yml.manifest.json``)
+or, if that directory cannot be written, in the cache directory (see
+:func:`~instrument.utils.config_loaders.config_cache_dir`).  It is used
+until the content of the devices file changes.  Then, neither YAML
+parsing nor imports are needed to know which devices to make.
+
+EXAMPLE::
+
+    python -m bits.utils.device_manifest devices.yml
+
+.. autosummary::
+    ~load_manifest
+    ~compile_manifest
+    ~register_expansion
+    ~resolve_creator
+    ~DeviceManifestError
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pathlib
+import sys
+
+from apstools.utils import dynamic_import
+
+from .config_loaders import config_cache_dir
+from .config_loaders import load_config_yaml
+from .signal_policy import check_rules
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+MANIFEST_FORMAT = 2  # Change when the manifest content changes.
+_expansions = {}  # {factory: expander}
+
+
+class DeviceManifestError(ValueError):
+    """
+    One or more entries of a devices file are not valid.
+
+    ``problems`` is a list of (entry, exception).
+    """
+
+    def __init__(self, path, problems, n_entries):
+        """Report all the 'problems'."""
+        self.problems = problems
+        lines = [f"{len(problems)} of {n_entries} device entries in {path} not valid:"]
+        for entry, exc in problems:
+            lines.append(f"  {entry['device_class']} {entry['kwargs']}: {exc}")
+        super().__init__("\n".join(lines))
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_creator(import_path):
+    """Import (once) and return the creator named 'import_path'."""
+    return dynamic_import(import_path)
+
+
+def register_expansion(factory, expander):
+    """
+    Compile entries of 'factory' as one entry for each device it makes.
+
+    ``expander(**kwargs)`` returns a list of (creator import path, kwargs),
+    one for each device that ``factory(**kwargs)`` would make, or None to
+    keep the entry as it is.
+    """
+    _expansions[factory] = expander
+
+
+def _validate(kwargs, creator):
+    """Raise TypeError if 'creator' cannot be called with 'kwargs'."""
+    try:
+        signature = inspect.signature(creator)
+    except (TypeError, ValueError):
+        return  # No signature to check (such as some compiled classes).
+    signature.bind(**kwargs)
+
+
+def _compile_entries(specs):
+    """Manifest entries from the parsed devices file 'specs'."""
+    entries = []
+    problems = []
+    pending = [  # (creator, kwargs)
+        (creator, table) for creator, tables in specs.items() for table in tables
+    ]
+    while len(pending) > 0:
+        creator_name, table = pending.pop(0)
+        kwargs = dict(table)
+        entry = {
+            "device_class": creator_name,
+            "args": [],  # ALL specs are kwargs!
+            "kwargs": kwargs,
+            "eager": bool(kwargs.pop("eager", False)),  # Not passed to the creator.
+            "signal_policy": kwargs.pop("signal_policy", None) or [],  # Nor this.
+            "several": False,
+        }
+        try:
+            check_rules(entry["signal_policy"])
+            creator = resolve_creator(creator_name)
+            expander = _expansions.get(creator)
+            expanded = None if expander is None else expander(**kwargs)
+            if expanded is not None:
+                expanded = [
+                    (
+                        name,
+                        {
+                            **keywords,
+                            "eager": entry["eager"],
+                            "signal_policy": entry["signal_policy"],
+                        },
+                    )
+                    for name, keywords in expanded
+                ]
+                pending = expanded + pending
+                continue
+            _validate(kwargs, creator)
+            entry["several"] = inspect.isgeneratorfunction(creator)
+        except Exception as exc:
+            problems.append((entry, exc))
+        entries.append(entry)
+    return entries, problems
+
+
+def compile_manifest(path):
+    """
+    Compile devices file 'path'.  Returns the manifest (dict).
+
+    Raises DeviceManifestError if any entry is not valid.
+    """
+    path = pathlib.Path(path)
+    data = path.read_bytes()
+    specs = load_config_yaml(path) or {}
+    entries, problems = _compile_entries(specs)
+    if len(problems) > 0:
+        raise DeviceManifestError(path, problems, len(entries))
+    return dict(
+        format=MANIFEST_FORMAT,
+        source=str(path.resolve()),
+        sha256=hashlib.sha256(data).hexdigest(),
+        entries=entries,
+    )
+
+
+def _manifest_files(path):
+    """Where the manifest of devices file 'path' might be saved."""
+    name = f".{path.name}.manifest.json"
+    files = [path.parent / name]
+    cache_dir = config_cache_dir()
+    if cache_dir is not None:
+        key = hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:24]
+        files.append(cache_dir / f"{path.stem}-{key}.manifest.json")
+    return files
+
+
+def load_manifest(path, cache=True):
+    """
+    Device entries of devices file 'path', from its manifest if current.
+
+    Compiles (and saves) the manifest if the file has changed.
+    Raises DeviceManifestError if any entry is not valid.
+    """
+    path = pathlib.Path(path)
+    if not cache:
+        return compile_manifest(path)["entries"]
+
+    sha256 = hashlib.sha256(path.read_bytes()).hexdigest()
+    files = _manifest_files(path)
+    for manifest_file in files:
+        try:
+            manifest = json.loads(manifest_file.read_text())
+        except (OSError, ValueError):
+            continue
+        if manifest.get("format") == MANIFEST_FORMAT and manifest["sha256"] == sha256:
+            logger.debug("Devices from manifest %s", manifest_file)
+            return manifest["entries"]
+
+    manifest = compile_manifest(path)
+    try:
+        text = json.dumps(manifest, indent=2)
+    except (TypeError, ValueError) as exc:  # Not JSON: keep in memory only.
+        logger.debug("Manifest of %s not saved: %s", path, exc)
+        return manifest["entries"]
+    for manifest_file in files:
+        try:
+            manifest_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            temporary = manifest_file.with_name(
+                f".{manifest_file.name}.{os.getpid()}.tmp"
+            )
+            temporary.write_text(text)
+            os.replace(temporary, manifest_file)
+            break
+        except OSError as exc:
+            logger.debug("Could not save %s: %s", manifest_file, exc)
+    return manifest["entries"]
+
+
+def main(argv=None):
+    """Compile (and check) the devices files named on the command line."""
+    status = 0
+    for name in argv if argv is not None else sys.argv[1:]:
+        try:
+            entries = load_manifest(name)
+            print(f"{name}: {len(entries)} devices")
+        except (OSError, DeviceManifestError) as exc:
+            print(exc)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
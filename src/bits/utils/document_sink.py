@@ -0,0 +1,248 @@
+"""
+Buffered document sink for the databroker catalog
+=================================================
+
+The RunEngine calls each of its subscriptions as each document is made,
+in its own thread.  Subscribed directly, ``cat.v1.insert`` adds the
+catalog's insert time (a database round trip, or a file write) to every
+point of a scan.
+
+A :class:`BufferedSink` takes the documents into a bounded queue and
+returns at once.  A background thread inserts them, in order:
+
+* Consecutive events (or datums) that are waiting are inserted together,
+  as one EventPage (or DatumPage): one bulk insert instead of many.
+* When the queue is full, the RunEngine waits (backpressure) until
+  there is room: memory stays bounded, no document is dropped.
+* Each ``stop`` document waits until all documents are inserted, so the
+  run is complete in the catalog when the plan ends.
+
+:meth:`BufferedSink.summary` reports the queue depth and the insert
+latency.  (To keep the documents even when the catalog is not
+available, use a :class:`~instrument.utils.document_spool.DocumentSpool`
+instead.)  Configure in ``iconfig.yml``::
+
+    DATABROKER_SINK:
+        BUFFERED: true
+        QUEUE_SIZE: 10000
+        BATCH: 500
+
+.. autosummary::
+    ~BufferedSink
+    ~catalog_sink
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+import event_model
+
+from .config_loaders import iconfig
+from .document_spool import DEFAULT_FSYNC_INTERVAL
+from .document_spool import DEFAULT_MAX_ATTEMPTS
+from .document_spool import DEFAULT_RETRY_INTERVAL
+from .document_spool import DocumentSpool
+from .latency import RingBuffer
+from .latency import milliseconds
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+DEFAULT_QUEUE_SIZE = 10_000  # documents
+DEFAULT_BATCH = 500  # most documents taken from the queue at once
+DEFAULT_SAMPLES = 1000  # latencies kept
+PAGES = {"event": event_model.pack_event_page, "datum": event_model.pack_datum_page}
+PAGE_KEYS = {"event": "descriptor", "datum": "resource"}
+
+
+def _grouped(items):
+    """(name, doc) of 'items', consecutive events (or datums) as pages."""
+    group = []  # consecutive documents, same name and container
+    for name, doc in items:
+        if (
+            group
+            and name == group[0][0]
+            and name in PAGES
+            and doc[PAGE_KEYS[name]] == group[0][1][PAGE_KEYS[name]]
+        ):
+            group.append((name, doc))
+            continue
+        yield from _page(group)
+        group = [(name, doc)]
+    yield from _page(group)
+
+
+def _page(group):
+    """One (name, doc): a page if several documents are in the group."""
+    if len(group) == 1:
+        yield group[0]
+    elif len(group) > 1:
+        name = group[0][0]
+        yield f"{name}_page", PAGES[name](*[doc for _n, doc in group])
+
+
+class BufferedSink:
+    """
+    Insert documents in a background thread.  See the module notes.
+
+    PARAMETERS
+
+    insert : callable
+        Called ``insert(name, doc)`` (such as ``cat.v1.insert``).  Must
+        accept ``event_page`` and ``datum_page`` documents.
+    queue_size : int
+        Most documents waiting.  (default: 10000)
+    batch : int
+        Most documents taken from the queue at once (and so, in a page).
+        (default: 500)
+
+    .. autosummary::
+        ~__call__
+        ~flush
+        ~close
+        ~stats
+        ~summary
+    """
+
+    def __init__(self, insert, *, queue_size=DEFAULT_QUEUE_SIZE, batch=DEFAULT_BATCH):
+        """Sink of documents for 'insert'."""
+        self.insert = insert
+        self.batch = batch
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._latency = RingBuffer(DEFAULT_SAMPLES)  # seconds, each insert call
+        self.received = 0
+        """Documents received."""
+        self.inserted = 0
+        """Documents inserted (a page counts its documents)."""
+        self.max_depth = 0
+        """Most documents waiting in the queue so far."""
+        self.waited = 0.0
+        """Seconds callers waited because the queue was full."""
+        self.failures = []
+        """(name, doc, exception) of each failed insert."""
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name="document_sink"
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __call__(self, name, doc):
+        """Queue document 'doc' ('name': start, event, ...) for insert."""
+        try:
+            self._queue.put_nowait((name, doc))
+        except queue.Full:
+            logger.warning(
+                "Document queue full (%d).  Waiting for the catalog.",
+                self._queue.maxsize,
+            )
+            t0 = time.monotonic()
+            self._queue.put((name, doc))
+            self.waited += time.monotonic() - t0
+        self.received += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        if name == "stop":
+            self.flush()
+            logger.debug("Run %s inserted.  %s", doc.get("run_start"), self.stats())
+
+    def flush(self):
+        """Wait until all documents received are inserted (or failed)."""
+        self._queue.join()
+
+    def close(self):
+        """Insert the documents waiting, then stop the background thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        """(background thread) Insert documents as they arrive."""
+        while True:
+            items = [self._queue.get()]
+            while items[-1] is not None and len(items) < self.batch:
+                try:  # Also take the documents already waiting.
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            documents = [item for item in items if item is not None]
+            try:
+                for name, doc in _grouped(documents):
+                    self._insert(name, doc)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+            if items[-1] is None:
+                return
+
+    def _insert(self, name, doc):
+        """Insert one document (or page), note the time taken."""
+        count = 1
+        if name == "event_page":
+            count = len(doc["uid"])
+        elif name == "datum_page":
+            count = len(doc["datum_id"])
+        t0 = time.monotonic()
+        try:
+            self.insert(name, doc)
+            self.inserted += count
+        except Exception as exc:
+            self.failures.append((name, doc, exc))
+            logger.error("Could not insert %s document (%d): %s", name, count, exc)
+        self._latency.add(time.monotonic() - t0)
+
+    def stats(self):
+        """Queue and insert statistics (dict)."""
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "failed": len(self.failures),
+            "depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "waited_s": round(self.waited, 3),
+            "insert_p50_ms": milliseconds(self._latency.percentile(50)),
+            "insert_p99_ms": milliseconds(self._latency.percentile(99)),
+        }
+
+    def summary(self):
+        """Table (str) of :meth:`stats`."""
+        import pyRestTable
+
+        table = pyRestTable.Table()
+        table.labels = ["statistic", "value"]
+        for key, value in self.stats().items():
+            table.addRow((key, value))
+        return str(table)
+
+
+def catalog_sink(cat):
+    """
+    Subscription for the RunEngine: inserts its documents into 'cat'.
+
+    From ``DATABROKER_SINK`` in iconfig: a
+    :class:`~instrument.utils.document_spool.DocumentSpool` if ``SPOOL``
+    is set, a :class:`BufferedSink` if ``BUFFERED`` is true, else
+    ``cat.v1.insert`` itself.
+    """
+    config = iconfig.get("DATABROKER_SINK", {})
+    if config.get("SPOOL"):
+        logger.info(
+            "Documents for catalog %r spooled in %s.", cat.name, config["SPOOL"]
+        )
+        return DocumentSpool(
+            config["SPOOL"],
+            cat.v1.insert,
+            fsync_interval=config.get("FSYNC_INTERVAL", DEFAULT_FSYNC_INTERVAL),
+            retry_interval=config.get("RETRY_INTERVAL", DEFAULT_RETRY_INTERVAL),
+            max_attempts=config.get("MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS),
+        )
+    if not config.get("BUFFERED", False):
+        return cat.v1.insert
+    logger.info("Buffered inserts into catalog %r.", cat.name)
+    return BufferedSink(
+        cat.v1.insert,
+        queue_size=config.get("QUEUE_SIZE", DEFAULT_QUEUE_SIZE),
+        batch=config.get("BATCH", DEFAULT_BATCH),
+    )
@@ -0,0 +1,366 @@
+"""
+Durable document spool for the databroker catalog
+=================================================
+
+When the database behind the catalog is down (or slow), inserting the
+documents of a run fails (or stalls the RunEngine), and the data can be
+lost.  With a :class:`DocumentSpool`, the RunEngine's documents are
+written first to local files (the *spool*).  A background thread then
+inserts them into the catalog, in order, whenever it is reachable.
+
+* Documents are appended (as JSON lines) to *segment* files, one for
+  each run (a new segment starts after each ``stop`` document).
+* Segments are written to disk (``fsync``) in groups: at each ``stop``,
+  and when ``FSYNC_INTERVAL`` seconds have passed since the last.
+* Inserts that fail are tried again (every ``RETRY_INTERVAL`` seconds,
+  up to a minute), with the same document: order is kept.  While the
+  catalog is not reachable (connection errors), they are tried forever.
+* A document the catalog refuses ``MAX_ATTEMPTS`` times (any other
+  error) is moved aside, to ``rejected.jsonl`` in the spool directory,
+  with the error.  The documents after it are inserted.
+* The uid of each document inserted is noted beside its segment.  After
+  a restart, the spool continues with the segments left, skipping those
+  documents: each document is inserted once.  (After a crash between an
+  insert and its note, the catalog has the document already: its
+  duplicate key error counts as inserted.)
+* A segment is removed once all of its documents are inserted.
+
+Configure in ``iconfig.yml``::
+
+    DATABROKER_SINK:
+        SPOOL: ~/.cache/bits/spool
+        FSYNC_INTERVAL: 1
+        RETRY_INTERVAL: 5
+        MAX_ATTEMPTS: 5
+
+.. autosummary::
+    ~DocumentSpool
+"""
+
+import atexit
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+import event_model
+from pymongo.errors import ConnectionFailure
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+DEFAULT_FSYNC_INTERVAL = 1  # seconds
+DEFAULT_RETRY_INTERVAL = 5  # seconds, doubled after each failure (up to a minute)
+MAX_RETRY_INTERVAL = 60
+DEFAULT_MAX_ATTEMPTS = 5  # inserts of a document the catalog refuses
+SEGMENT = "segment-{:08d}.jsonl"
+DONE_SUFFIX = ".done"  # uids inserted, beside each segment
+REJECTED = "rejected.jsonl"  # documents the catalog refused, with the error
+UNAVAILABLE = (OSError, ConnectionFailure)
+"""Exceptions meaning: the catalog is not reachable (try again later)."""
+
+
+def _doc_key(name, doc):
+    """Identify document 'doc' (its uid; datum_id for datums)."""
+    uid = doc.get("uid", doc.get("datum_id"))
+    if isinstance(uid, list):  # A page.
+        uid = uid[0] if uid else ""
+    return f"{name}:{uid}"
+
+
+def _segment_number(path):
+    """Sequence number of segment file 'path'."""
+    return int(path.stem.split("-")[1])
+
+
+class DocumentSpool:
+    """
+    Write documents to local files, insert them later.  See module notes.
+
+    PARAMETERS
+
+    directory : str
+        Directory of the spool (created if needed).
+    insert : callable
+        Called ``insert(name, doc)`` for each document (such as
+        ``cat.v1.insert``).  Any exception means: try again later.
+        (A duplicate key error means: inserted before.)
+    fsync_interval : float
+        Most seconds between writes to disk (``fsync``).  (default: 1)
+    retry_interval : float
+        Seconds before the first try again of a failed insert.
+        (default: 5)
+    max_attempts : int
+        Inserts of a document the catalog refuses (for reasons other
+        than its connection) before it is moved aside.  (default: 5)
+
+    .. autosummary::
+        ~__call__
+        ~flush
+        ~close
+        ~pending
+        ~stats
+        ~summary
+    """
+
+    def __init__(
+        self,
+        directory,
+        insert,
+        *,
+        fsync_interval=DEFAULT_FSYNC_INTERVAL,
+        retry_interval=DEFAULT_RETRY_INTERVAL,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+    ):
+        """Spool in 'directory', for 'insert'."""
+        self.directory = pathlib.Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.insert = insert
+        self.fsync_interval = fsync_interval
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self.written = 0
+        """Documents written to the spool."""
+        self.inserted = 0
+        """Documents inserted from the spool."""
+        self.failures = 0
+        """Inserts that failed (and were tried again)."""
+        self.rejected = 0
+        """Documents the catalog refused, moved to ``rejected.jsonl``."""
+        self.last_error = None
+        """Most recent insert exception (None once an insert succeeds)."""
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closing = False
+        self._dirty = True  # Documents to insert?
+        self._idle = False  # Finished with the segments (and removed them)?
+        segments = self._segments()
+        self._number = _segment_number(segments[-1]) if segments else 0
+        self._backlog = sum(self._count_pending(path) for path in segments)
+        if self._backlog > 0:
+            logger.info("%d documents in %s to insert.", self._backlog, directory)
+        self._file = None  # Segment being written.
+        self._path = None
+        self._synced = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name="document_spool"
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    # Written by the RunEngine's thread.
+
+    def __call__(self, name, doc):
+        """Append document 'doc' ('name': start, event, ...) to the spool."""
+        line = json.dumps([name, doc], cls=event_model.NumpyEncoder) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._number += 1
+                self._path = self.directory / SEGMENT.format(self._number)
+                self._file = open(self._path, "a")
+            self._file.write(line)
+            self._file.flush()  # Readable by the insert thread.
+            self.written += 1
+            if name == "stop":
+                self._close_segment()  # One segment for each run.
+            elif time.monotonic() - self._synced >= self.fsync_interval:
+                self._fsync()
+            self._dirty = True
+            self._idle = False
+            self._wake.notify_all()
+
+    def _fsync(self):
+        """Write the segment to disk (with the lock)."""
+        os.fsync(self._file.fileno())
+        self._synced = time.monotonic()
+
+    def _close_segment(self):
+        """Finish the segment being written (with the lock)."""
+        self._fsync()
+        self._file.close()
+        self._file = None
+        self._path = None
+
+    def flush(self, timeout=None):
+        """
+        Wait until all documents written are inserted.
+
+        Returns False if 'timeout' (seconds) passed first.
+        """
+        with self._lock:
+            return self._wake.wait_for(
+                lambda: self._idle and self.pending() == 0, timeout=timeout
+            )
+
+    def close(self, timeout=5):
+        """
+        Write the spool to disk and stop inserting (for now).
+
+        First waits (up to 'timeout' seconds) for the documents to be
+        inserted.  Those left are inserted by the next spool in this
+        directory.
+        """
+        self.flush(timeout=timeout)
+        with self._lock:
+            if self._file is not None:
+                self._fsync()
+                self._file.close()
+                self._file = None
+                self._path = None
+            self._closing = True
+            self._wake.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    # Inserted by the background thread.
+
+    def _segments(self):
+        """Segment files, oldest first."""
+        return sorted(self.directory.glob(SEGMENT.replace("{:08d}", "*")))
+
+    @staticmethod
+    def _done(path):
+        """File of the uids inserted from segment 'path'."""
+        return path.with_name(path.name + DONE_SUFFIX)
+
+    def _count_pending(self, path):
+        """Number of documents in segment 'path' not inserted yet."""
+        done_path = self._done(path)
+        done = len(done_path.read_text().split()) if done_path.exists() else 0
+        with open(path, "rb") as f:
+            return sum(1 for line in f if line.endswith(b"\n")) - done
+
+    def _run(self):
+        """(background thread) Insert documents from the segments, in order."""
+        while True:
+            with self._lock:
+                self._wake.wait_for(lambda: self._dirty or self._closing, timeout=1)
+                if self._closing:
+                    return
+                self._dirty = False
+            for path in self._segments():
+                if not self._drain(path):
+                    break  # Not finished with this one.
+            with self._lock:
+                self._idle = not self._dirty  # Done with all written so far.
+                self._wake.notify_all()
+
+    def _drain(self, path):
+        """
+        Insert the documents of segment 'path' not inserted before.
+
+        Returns True if the segment is finished (and removed).
+        """
+        with self._lock:
+            finished = path != self._path  # No more will be written.
+        done_path = self._done(path)
+        done = set()
+        if done_path.exists():
+            done = set(done_path.read_text().split())
+        with open(path, "rb") as f, open(done_path, "a") as done_file:
+            for line in f:
+                if not line.endswith(b"\n"):  # Being written, or a crash.
+                    if finished:
+                        logger.warning("Incomplete document in %s, ignored.", path)
+                    break
+                name, doc = json.loads(line)
+                key = _doc_key(name, doc)
+                if key in done:
+                    continue
+                if not self._insert(name, doc):
+                    return False  # Stopping.
+                done_file.write(key + "\n")
+                done_file.flush()
+                done.add(key)
+        if finished:
+            path.unlink()
+            done_path.unlink()
+        return finished
+
+    def _insert(self, name, doc):
+        """
+        Insert one document, trying until it works (or it is rejected).
+
+        Returns False if stopping.
+        """
+        delay = self.retry_interval
+        attempts = 0
+        while True:
+            try:
+                self.insert(name, doc)
+            except DuplicateKeyError:
+                logger.debug("%s already in the catalog.", _doc_key(name, doc))
+            except Exception as exc:
+                self.failures += 1
+                if not isinstance(exc, UNAVAILABLE):
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        self._reject(name, doc, exc)
+                        return True
+                if self.last_error is None:
+                    logger.warning(
+                        "Catalog insert failed (%s).  Documents kept in %s.",
+                        exc,
+                        self.directory,
+                    )
+                self.last_error = exc
+                with self._lock:
+                    if self._wake.wait_for(lambda: self._closing, timeout=delay):
+                        return False
+                delay = min(2 * delay, MAX_RETRY_INTERVAL)
+                continue
+            with self._lock:
+                if self.last_error is not None:
+                    logger.info("Catalog available again.  Inserting from spool.")
+                    self.last_error = None
+                self.inserted += 1
+                self._wake.notify_all()
+            return True
+
+    def _reject(self, name, doc, exc):
+        """Move document 'doc', refused by the catalog, aside."""
+        logger.error(
+            "Catalog refused %s (%s).  Moved to %s.",
+            _doc_key(name, doc),
+            exc,
+            self.directory / REJECTED,
+        )
+        line = json.dumps([name, doc, repr(exc)], cls=event_model.NumpyEncoder)
+        with open(self.directory / REJECTED, "a") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self.rejected += 1
+            self._wake.notify_all()
+
+    # Reports
+
+    def pending(self):
+        """Number of documents written to the spool, not yet inserted."""
+        return self._backlog + self.written - self.inserted - self.rejected
+
+    def stats(self):
+        """Spool statistics (dict)."""
+        return {
+            "written": self.written,
+            "inserted": self.inserted,
+            "pending": self.pending(),
+            "segments": len(self._segments()),
+            "failed_inserts": self.failures,
+            "rejected": self.rejected,
+            "catalog": "available" if self.last_error is None else "NOT available",
+        }
+
+    def summary(self):
+        """Table (str) of :meth:`stats`."""
+        import pyRestTable
+
+        table = pyRestTable.Table()
+        table.labels = ["statistic", "value"]
+        for key, value in self.stats().items():
+            table.addRow((key, value))
+        return str(table)
@@ -3,6 +3,7 @@ Generic utility helper functions
 ================================
 
 .. autosummary::
+    ~get_ipython
     ~register_bluesky_magics
     ~running_in_queueserver
     ~debug_python
@@ -12,18 +13,29 @@ Generic utility helper functions
 
 import logging
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-from bluesky.magics import BlueskyMagics
-from bluesky_queueserver import is_re_worker_active
-from IPython import get_ipython
-
 from .config_loaders import iconfig
+from .lazy_imports import lazy_import
+from .lazy_imports import module_if_imported
+
+mpl = lazy_import("matplotlib")
+plt = lazy_import("matplotlib.pyplot")
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
 
 
+def get_ipython():
+    """
+    Return the IPython shell, or None.
+
+    IPython is not imported here.  Any IPython session has imported it already.
+    """
+    ipython = module_if_imported("IPython")
+    if ipython is None:
+        return None
+    return ipython.get_ipython()
+
+
 def register_bluesky_magics() -> None:
     """
     Register Bluesky magics if an IPython environment is detected.
@@ -33,6 +45,8 @@ def register_bluesky_magics() -> None:
     """
     ipython = get_ipython()
     if ipython is not None:
+        from bluesky.magics import BlueskyMagics
+
         ipython.register_magics(BlueskyMagics)
 
 
@@ -43,7 +57,13 @@ def running_in_queueserver() -> bool:
     Returns:
         bool: True if running in the queueserver, False otherwise.
     """
+    # The queueserver's RE worker has imported bluesky_queueserver already.
+    # Otherwise, do not import it (slow) just to learn it is not running.
+    if module_if_imported("bluesky_queueserver") is None:
+        return False
     try:
+        from bluesky_queueserver import is_re_worker_active
+
         active: bool = is_re_worker_active()
         return active
     except Exception as cause:
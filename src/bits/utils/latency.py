@@ -0,0 +1,61 @@
+"""
+Latency statistics
+==================
+
+Keep the latest round-trip times (of EPICS reads, catalog inserts, ...)
+in a fixed amount of memory, and report them.
+
+.. autosummary::
+    ~RingBuffer
+    ~milliseconds
+"""
+
+import numpy as np
+
+DEFAULT_SIZE = 64  # values kept
+
+
+class RingBuffer:
+    """
+    The last 'size' values (float) added.
+
+    .. autosummary::
+        ~add
+        ~values
+        ~percentile
+    """
+
+    __slots__ = ("_values", "_count")
+
+    def __init__(self, size=DEFAULT_SIZE):
+        """Empty buffer for 'size' values."""
+        self._values = np.zeros(size, dtype=float)
+        self._count = 0
+
+    def __len__(self):
+        """Number of values kept."""
+        return min(self._count, len(self._values))
+
+    def add(self, value):
+        """Add 'value', replacing the oldest if full."""
+        self._values[self._count % len(self._values)] = value
+        self._count += 1
+
+    def values(self):
+        """The values kept (array), oldest first."""
+        size = len(self._values)
+        if self._count <= size:
+            return self._values[: self._count].copy()
+        start = self._count % size
+        return np.concatenate((self._values[start:], self._values[:start]))
+
+    def percentile(self, q):
+        """The q-th percentile of the values kept, or None if empty."""
+        if len(self) == 0:
+            return None
+        return float(np.percentile(self.values(), q))
+
+
+def milliseconds(seconds):
+    """Text of 'seconds' in milliseconds ('--' if None)."""
+    return "--" if seconds is None else f"{1000 * seconds:.1f}"
@@ -0,0 +1,159 @@
+"""
+Deferred devices
+================
+
+Stand-ins for devices that are made (and connected) when first used.
+
+With many devices, most are not used in a given session.  A
+:class:`LazyDevice` has the device's name and labels, so it can be found
+in ``oregistry`` and used in the ``__main__`` namespace.  Any other use
+(such as ``m1.position`` or ``bps.mv(m1, 1)``) makes the device first.
+
+EXAMPLE::
+
+    m1 = LazyDevice("m1", lambda: ophyd.EpicsMotor("ioc:m1", name="m1"))
+    m1                      # <LazyDevice 'm1' (not made)>
+    m1.position             # EpicsMotor made (and connected) now
+
+Bluesky plans use devices through their attributes (``set()``,
+``read()``, ...), which works with a stand-in.  Code that tests the
+class of a device (``isinstance(m1, ophyd.EpicsMotor)``) needs the
+device itself: ``resolve(m1)``.  :func:`is_pending` tells if a device
+has not been made yet.
+
+.. autosummary::
+    ~is_pending
+    ~resolve
+    ~LazyDevice
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+
+class LazyDevice:
+    """
+    Stand-in for a device, made when first used.
+
+    PARAMETERS
+
+    name : str
+        Name of the device.
+    factory : callable
+        ``factory()`` returns the device.
+    labels : list
+        Labels of the device (for ``oregistry``).
+    on_made : callable or None
+        ``on_made(proxy, device)`` is called after the device is made,
+        such as to replace this stand-in with the device.
+    connect_timeout : float
+        After it is made, wait up to this long (seconds) for the device to
+        connect.  Default: 10
+
+    .. autosummary::
+        ~is_made
+    """
+
+    __slots__ = (
+        "_lazy_name",
+        "_lazy_factory",
+        "_lazy_labels",
+        "_lazy_on_made",
+        "_lazy_timeout",
+        "_lazy_device",
+        "_lazy_lock",
+        "__weakref__",
+    )
+
+    def __init__(self, name, factory, labels=(), on_made=None, connect_timeout=10):
+        """Stand-in for device 'name'.  Nothing is made yet."""
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_labels", set(labels or ()))
+        object.__setattr__(self, "_lazy_on_made", on_made)
+        object.__setattr__(self, "_lazy_timeout", connect_timeout)
+        object.__setattr__(self, "_lazy_device", None)
+        object.__setattr__(self, "_lazy_lock", threading.RLock())
+
+    def _make(self):
+        """Make the device now (once) and wait for it to connect."""
+        device = self._lazy_device
+        if device is None:
+            with self._lazy_lock:
+                device = self._lazy_device
+                if device is None:
+                    logger.info("Making device %r (first use).", self._lazy_name)
+                    device = self._lazy_factory()
+                    object.__setattr__(self, "_lazy_device", device)
+                    if hasattr(device, "wait_for_connection"):
+                        try:
+                            device.wait_for_connection(timeout=self._lazy_timeout)
+                        except TimeoutError as exc:
+                            logger.warning("%r not connected: %s", self._lazy_name, exc)
+                    if self._lazy_on_made is not None:
+                        self._lazy_on_made(self, device)
+        return device
+
+    @property
+    def is_made(self):
+        """Has the device been made?"""
+        return self._lazy_device is not None
+
+    # Used by 'oregistry' (and others) without making the device.
+
+    @property
+    def name(self):
+        """Name of the device."""
+        if self._lazy_device is None:
+            return self._lazy_name
+        return self._lazy_device.name
+
+    @property
+    def _ophyd_labels_(self):
+        """Labels of the device."""
+        if self._lazy_device is None:
+            return self._lazy_labels
+        return getattr(self._lazy_device, "_ophyd_labels_", set())
+
+    @property
+    def parent(self):
+        """Devices made from a devices file have no parent."""
+        if self._lazy_device is None:
+            return None
+        return self._lazy_device.parent
+
+    def __getattr__(self, name):
+        """Get attribute 'name' of the device (made now if needed)."""
+        if name in ("_signals", "children") and self._lazy_device is None:
+            # Not made yet: no components to register or look up.
+            raise AttributeError(name)
+        return getattr(self._make(), name)
+
+    def __setattr__(self, name, value):
+        """Set attribute 'name' of the device (made now if needed)."""
+        setattr(self._make(), name, value)
+
+    def __dir__(self):
+        """Attributes of the device (made now if needed)."""
+        return dir(self._make())
+
+    def __repr__(self):
+        """representation of this object."""
+        if self._lazy_device is None:
+            return f"<LazyDevice {self._lazy_name!r} (not made)>"
+        return repr(self._lazy_device)
+
+
+def is_pending(obj):
+    """Is 'obj' a :class:`LazyDevice` whose device has not been made?"""
+    return type(obj) is LazyDevice and not obj.is_made
+
+
+def resolve(obj):
+    """Return the device for 'obj' (made now if needed), or 'obj' itself."""
+    if type(obj) is LazyDevice:
+        return obj._make()
+    return obj
@@ -0,0 +1,93 @@
+"""
+Deferred imports
+================
+
+Import heavy modules (such as matplotlib or IPython) when first used, not
+when ``bits`` is imported.
+
+EXAMPLE::
+
+    from bits.utils.lazy_imports import lazy_import
+
+    plt = lazy_import("matplotlib.pyplot")  # not imported yet
+
+    def show():
+        plt.show()  # imported now
+
+The proxy is not put in ``sys.modules``.  Until it is used, the module is
+not imported and other code sees it as not imported.
+
+.. autosummary::
+    ~lazy_import
+    ~module_if_imported
+    ~LazyModule
+"""
+
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    """
+    Stand-in for a module, imported on first attribute access.
+
+    .. autosummary::
+        ~is_loaded
+    """
+
+    __slots__ = ("_lazy_name", "_lazy_module", "_lazy_lock")
+
+    def __init__(self, name):
+        """Stand-in for module 'name' (such as ``"matplotlib.pyplot"``)."""
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_module", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def _load(self):
+        """Import the module now (once)."""
+        module = self._lazy_module
+        if module is None:
+            with self._lazy_lock:
+                module = self._lazy_module
+                if module is None:
+                    module = importlib.import_module(self._lazy_name)
+                    object.__setattr__(self, "_lazy_module", module)
+        return module
+
+    @property
+    def is_loaded(self):
+        """Has the module been imported (by this proxy or elsewhere)?"""
+        return self._lazy_module is not None or self._lazy_name in sys.modules
+
+    def __getattr__(self, name):
+        """Get attribute 'name' of the module (imported now if needed)."""
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        """Set attribute 'name' of the module (imported now if needed)."""
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        """Attributes of the module (imported now if needed)."""
+        return dir(self._load())
+
+    def __repr__(self):
+        """representation of this object."""
+        state = "imported" if self.is_loaded else "not imported"
+        return f"<{self.__class__.__name__} {self._lazy_name!r} ({state})>"
+
+
+def lazy_import(name):
+    """Return a :class:`LazyModule` for module 'name'.  Nothing is imported yet."""
+    return LazyModule(name)
+
+
+def module_if_imported(name):
+    """
+    Return module 'name' if it has been imported already, otherwise None.
+
+    Use this when the module matters only if something else imported it
+    first, such as ``IPython`` (imported by any IPython session).
+    """
+    return sys.modules.get(name)
@@ -182,7 +182,7 @@ def _setup_ipython_logger(logger, cfg):
     """
     log_path = pathlib.Path(cfg.get("log_directory", ".logs")).resolve()
     try:
-        from IPython import get_ipython
+        from .helper_functions import get_ipython
 
         # start logging console to file
         # https://ipython.org/ipython-doc/3/interactive/magics.html#magic-logstart
@@ -4,13 +4,52 @@ Make devices from YAML files
 
 Construct ophyd-style devices from simple specifications in YAML files.
 
+Each devices file is compiled (once, until it is edited) into a manifest
+of the devices to make (see :mod:`~instrument.utils.device_manifest`).
+Invalid entries are reported together, before any device is made.
+
+Devices may be made in parallel (threads), which helps when each device
+waits for its EPICS channels to be created.  Set ``MAKE_DEVICES.MAX_WORKERS``
+in ``iconfig.yml``.  (The registry must be thread-safe, as ``oregistry``
+is: see :class:`~instrument.utils.controls_setup.ThreadSafeRegistry`.)
+Devices are returned in file order.  Every entry that fails is reported
+(in one :class:`DeviceConstructionError`), after the other devices are
+registered.
+
+After the devices are made, :func:`make_devices` waits until they are
+connected (see :func:`~instrument.utils.connection_barrier.wait_for_connections`),
+up to ``MAKE_DEVICES.CONNECT_TIMEOUT`` seconds.
+
+Running :func:`make_devices` again after editing a devices file only
+changes what was edited.  Each entry's creator and keyword arguments are
+remembered.  Entries that are new (or changed) are made, those removed
+(or changed) are destroyed, and devices of unchanged entries (with their
+EPICS connections) are kept.  The changes are logged and described by
+``Instrument.changes`` (:class:`DeviceChanges`).  Edits to a creator's
+Python code are not detected: use ``make_devices(incremental=False)``.
+
+For instruments with many devices, set ``MAKE_DEVICES.LAZY: true`` to make
+each device when it is first used (see
+:class:`~instrument.utils.lazy_devices.LazyDevice`).  Until then,
+``__main__`` and ``oregistry`` have a stand-in with the device's name and
+labels.  Entries with ``eager: true`` (and factories, which make several
+devices) are made at once.
+
+Each new device gets the monitor/poll policy of its EPICS signals
+(``SIGNAL_POLICY`` in iconfig, then the entry's ``signal_policy``, see
+:mod:`~instrument.utils.signal_policy`).
+
 .. autosummary::
     :nosignatures:
 
     ~make_devices
+    ~DeviceChanges
+    ~DeviceConstructionError
     ~Instrument
 """
 
+import concurrent.futures
+import json
 import logging
 import pathlib
 import sys
@@ -18,13 +57,19 @@ import time
 
 import guarneri
 from apstools.plans import run_blocking_function
-from apstools.utils import dynamic_import
-from bluesky import plan_stubs as bps
 
 from bits.utils.aps_functions import host_on_aps_subnet
 from bits.utils.config_loaders import iconfig
-from bits.utils.config_loaders import load_config_yaml
+from bits.utils.connection_barrier import DEFAULT_TIMEOUT
+from bits.utils.connection_barrier import wait_for_connections
+from bits.utils.controls_setup import ThreadSafeRegistry
 from bits.utils.controls_setup import oregistry  # noqa: F401
+from bits.utils.device_manifest import load_manifest
+from bits.utils.device_manifest import resolve_creator
+from bits.utils.lazy_devices import LazyDevice
+from bits.utils.lazy_devices import is_pending
+from bits.utils.signal_policy import SignalPolicy
+from bits.utils.startup_profiler import phase
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
@@ -36,7 +81,9 @@ local_control_devices_file = iconfig["DEVICES_FILE"]
 aps_control_devices_file = iconfig["APS_DEVICES_FILE"]
 
 
-def make_devices(*, pause: float = 1):
+def make_devices(
+    *, timeout: float = None, pause: float = None, incremental: bool = True
+):
     """
     (plan stub) Create the ophyd-style controls for this instrument.
 
@@ -48,31 +95,45 @@ def make_devices(*, pause: float = 1):
 
     PARAMETERS
 
+    timeout : float
+        Wait up to 'timeout' seconds for the new devices to connect.
+        Default: ``MAKE_DEVICES.CONNECT_TIMEOUT`` from ``iconfig.yml``
+        (or 10).  Use 0 to not wait.
     pause : float
-        Wait 'pause' seconds (default: 1) for slow objects to connect.
+        Deprecated.  Same as 'timeout'.
+    incremental : bool
+        If ``True`` (default), only make (or destroy) the devices of
+        entries that changed since the last time.  If ``False``, destroy
+        and re-create all the devices in the files.
 
     """
-    logger.debug("(Re)Loading local control objects.")
-    yield from run_blocking_function(
-        _loader, configs_path / local_control_devices_file, main=True
-    )
+    if timeout is None:
+        timeout = pause
+    if timeout is None:
+        timeout = iconfig.get("MAKE_DEVICES", {}).get(
+            "CONNECT_TIMEOUT", DEFAULT_TIMEOUT
+        )
 
+    logger.debug("(Re)Loading local control objects.")
+    files = [configs_path / local_control_devices_file]
     if host_on_aps_subnet():
+        files.append(configs_path / aps_control_devices_file)
+
+    devices = []
+    for devices_file in files:
         yield from run_blocking_function(
-            _loader, configs_path / aps_control_devices_file, main=True
+            _loader, devices_file, main=True, loaded=devices, incremental=incremental
         )
 
-    if pause > 0:
-        logger.debug(
-            "Waiting %s seconds for slow objects to connect.",
-            pause,
-        )
-        yield from bps.sleep(pause)
+    if timeout > 0:
+        # Lazy devices connect when they are made.
+        devices = [device for device in devices if not is_pending(device)]
+        yield from wait_for_connections(devices, timeout=timeout)
 
     # Configure any of the controls here, or in plan stubs
 
 
-def _loader(yaml_device_file, main=True):
+def _loader(yaml_device_file, main=True, loaded=None, incremental=True):
     """
     Load our ophyd-style controls as described in a YAML file.
 
@@ -81,49 +142,367 @@ def _loader(yaml_device_file, main=True):
     yaml_device_file : str or pathlib.Path
         YAML file describing ophyd-style controls to be created.
     main : bool
-        If ``True`` add these devices to the ``__main__`` namespace.
+        If ``True`` add these devices to the ``__main__`` namespace
+        (and remove the devices destroyed).
+    loaded : list or None
+        If a list, append the devices made.
+    incremental : bool
+        Only make (or destroy) the devices of entries that changed.
 
     """
     logger.debug("Devices file %r.", str(yaml_device_file))
     t0 = time.time()
-    _instr.load(yaml_device_file)
-    logger.debug("Devices loaded in %.3f s.", time.time() - t0)
+    try:
+        with phase(f"make_devices: {pathlib.Path(yaml_device_file).name}"):
+            _instr.load(yaml_device_file, incremental=incremental)
+        logger.debug("Devices loaded in %.3f s.", time.time() - t0)
+    finally:
+        # Also the devices made before a DeviceConstructionError.
+        made = _instr.changes.devices
+        if loaded is not None:
+            loaded.extend(made)
+        if main:
+            for name in _instr.changes.removed:
+                if hasattr(main_namespace, name):
+                    delattr(main_namespace, name)
+            for device in made:
+                # add to __main__ namespace (replaced devices too)
+                setattr(main_namespace, device.name, device)
+
+
+def _source_key(config_file):
+    """Identify a devices file (name, path, or open file)."""
+    if not isinstance(config_file, (str, pathlib.Path)):
+        config_file = config_file.name  # An open file.
+    return str(pathlib.Path(config_file).resolve())
+
+
+def _spec_key(entry, fake):
+    """Identify the devices made by device file 'entry' (and 'fake')."""
+    spec = [
+        entry["device_class"],
+        entry.get("args", ()),
+        entry["kwargs"],
+        entry.get("eager", False),
+        entry.get("signal_policy", []),
+        fake,
+    ]
+    return json.dumps(spec, sort_keys=True, default=repr)
+
+
+class DeviceChanges:
+    """
+    Changes made by the last :meth:`Instrument.load` (names of devices).
+
+    ``created``, ``replaced`` (destroyed and made again, with different
+    arguments), ``removed``, and ``unchanged`` are lists of device names.
+    ``devices`` is the list of the devices made (created or replaced).
+    ``elapsed`` is the time (seconds) taken.
+    """
+
+    def __init__(self, source=None):
+        """Start with no changes."""
+        self.source = source
+        self.devices = []
+        self.created = []
+        self.replaced = []
+        self.removed = []
+        self.unchanged = []
+        self.elapsed = 0
+
+    def __str__(self):
+        """Summary of the changes."""
+        counts = ", ".join(
+            f"{len(names)} {key}"
+            for key, names in (
+                ("created", self.created),
+                ("replaced", self.replaced),
+                ("removed", self.removed),
+                ("unchanged", self.unchanged),
+            )
+        )
+        text = f"{counts} in {self.elapsed:.3f} s"
+        for key in "created replaced removed".split():
+            names = getattr(self, key)
+            if len(names) > 0:
+                text += f"\n  {key}: {' '.join(names)}"
+        return text
 
-    if main:
-        for label in oregistry.device_names:
-            # add to __main__ namespace
-            setattr(main_namespace, label, oregistry[label])
+
+class DeviceConstructionError(RuntimeError):
+    """
+    One or more device entries could not be made.
+
+    ``failures`` is a list of (entry, exception).  ``devices`` is the
+    list of devices that were made.
+    """
+
+    def __init__(self, failures, devices, n_entries):
+        """Report all the 'failures'."""
+        self.failures = failures
+        self.devices = devices
+        lines = [f"{len(failures)} of {n_entries} device entries failed:"]
+        for entry, exc in failures:
+            lines.append(f"  {entry['device_class']} {entry['kwargs']}: {exc!r}")
+        super().__init__("\n".join(lines))
 
 
 class Instrument(guarneri.Instrument):
-    """Custom YAML loader for guarneri."""
+    """
+    Custom YAML loader for guarneri.
 
-    def parse_yaml_file(self, config_file: pathlib.Path | str) -> list[dict]:
-        """Read device configurations from YAML format file."""
-        if isinstance(config_file, str):
-            config_file = pathlib.Path(config_file)
+    Remembers the entries loaded from each file, so that loading the file
+    again only makes (or destroys) the devices of entries that changed.
+
+    PARAMETERS
 
-        def parser(creator, specs):
-            if creator not in self.device_classes:
-                self.device_classes[creator] = dynamic_import(creator)
-            entries = [
-                {
-                    "device_class": creator,
-                    "args": (),  # ALL specs are kwargs!
-                    "kwargs": table,
-                }
-                for table in specs
-            ]
-            return entries
-
-        devices = [
-            device
-            # parse the file
-            for k, v in load_config_yaml(config_file).items()
-            # each support type (class, factory, function, ...)
-            for device in parser(k, v)
+    max_workers : int or None
+        Make up to this many devices at once.  If None, use
+        ``MAKE_DEVICES.MAX_WORKERS`` from ``iconfig.yml`` (default: 1).
+    lazy : bool or None
+        Make devices when first used (except entries with ``eager: true``).
+        If None, use ``MAKE_DEVICES.LAZY`` from ``iconfig.yml``
+        (default: False).
+
+    .. autosummary::
+        ~load
+        ~make_devices
+        ~parse_yaml_file
+    """
+
+    def __init__(self, *args, max_workers=None, lazy=None, **kwargs):
+        """Create the loader."""
+        super().__init__(*args, **kwargs)
+        self.max_workers = max_workers
+        self.lazy = lazy
+        self.changes = DeviceChanges()
+        self._loaded = {}  # {file: {spec: [devices]}}
+        self._source = None  # The file being loaded.
+        self._incremental = True
+
+    def load(self, config_file, *, incremental=True, **kwargs):
+        """
+        Load the devices in 'config_file' (see 'guarneri.Instrument.load()').
+
+        If 'incremental' is ``True``, keep the devices of entries that did
+        not change since this file was last loaded.  The changes are
+        described by ``self.changes``.
+        """
+        t0 = time.monotonic()
+        self._source = _source_key(config_file)
+        self._incremental = incremental
+        self.changes = DeviceChanges(self._source)
+        try:
+            return super().load(config_file, **kwargs)
+        except DeviceConstructionError as exc:
+            # Keep the devices that were made.  Then, report all failures.
+            self.unconnected_devices.extend(exc.devices)
+            for device in exc.devices:
+                self.devices.register(device)
+            raise
+        finally:
+            self.changes.elapsed = time.monotonic() - t0
+            logger.info(
+                "Devices from %s: %s",
+                pathlib.Path(self._source).name,
+                self.changes,
+            )
+            self._source = None
+
+    def _unregister(self, device):
+        """Forget 'device' (its entry was removed or changed)."""
+        try:
+            if self.devices[device.name] is device:
+                self.devices.pop(device.name)
+        except Exception:
+            pass  # Not registered.
+        if device in self.unconnected_devices:
+            self.unconnected_devices.remove(device)
+
+    def _creator(self, name):
+        """The creator (class, factory, or function) named 'name'."""
+        creator = self.device_classes.get(name)
+        if creator is None:
+            creator = resolve_creator(name)
+        return creator
+
+    def _made(self, proxy, device):
+        """Replace the stand-in 'proxy' with its 'device' (just made)."""
+        try:
+            self.devices.pop(proxy)
+        except Exception:
+            pass  # Not registered.
+        self.devices.register(device)
+        if proxy in self.unconnected_devices:
+            index = self.unconnected_devices.index(proxy)
+            self.unconnected_devices[index] = device
+        for loaded in self._loaded.values():
+            for devices in loaded.values():
+                if proxy in devices:
+                    devices[devices.index(proxy)] = device
+        if getattr(main_namespace, proxy.name, None) is proxy:
+            setattr(main_namespace, proxy.name, device)
+
+    def make_devices(self, defns, fake):
+        """
+        Make devices from their definitions, in parallel if configured.
+
+        When called by :meth:`load`, devices of entries unchanged since the
+        file was last loaded are kept (and not returned).  Devices of
+        entries no longer in the file are destroyed.
+
+        Returns the new devices, in the order of 'defns'.  Raises
+        DeviceConstructionError (after all entries are tried) if any fail.
+        """
+        config = iconfig.get("MAKE_DEVICES", {})
+        workers = self.max_workers
+        if workers is None:
+            workers = config.get("MAX_WORKERS", 1)
+        if (
+            workers > 1
+            and getattr(self.devices, "auto_register", False)
+            and not isinstance(self.devices, ThreadSafeRegistry)
+        ):
+            logger.warning(
+                "Devices made one at a time: registry %r is not thread-safe.",
+                self.devices,
+            )
+            workers = 1
+        lazy = self.lazy
+        if lazy is None:
+            lazy = config.get("LAZY", False)
+        policy = SignalPolicy.from_iconfig()
+        entries = [
+            defn for defn in defns if defn["device_class"] not in self.ignored_classes
         ]
+        previous = {}  # {spec: [devices]} from the last load of this file
+        if self._source is not None:
+            previous = self._loaded.pop(self._source, {})
+        if not self._incremental:
+            previous = {None: [d for devices in previous.values() for d in devices]}
+        loaded = {}  # {spec: [devices]} from this load
+
+        def deferred(entry):
+            """Make this entry when first used?"""
+            return (
+                lazy
+                and not entry.get("eager", False)
+                and not entry.get("several", True)  # from the manifest
+                and "name" in entry["kwargs"]
+            )
+
+        failures = []
+        jobs = []  # (entry, Klass) ready to be made
+        later = []  # entries to be made when first used
+        for entry in entries:
+            key = _spec_key(entry, fake)
+            if key in previous:
+                loaded[key] = previous.pop(key)
+                self.changes.unchanged += [d.name for d in loaded[key]]
+                continue
+            if deferred(entry):
+                later.append(entry)  # Validated by the manifest.
+                continue
+            try:
+                Klass = self._creator(entry["device_class"])
+                self.validate_params(entry["kwargs"], Klass)
+                jobs.append((entry, Klass))
+            except Exception as exc:
+                failures.append((entry, exc))
+
+        # Entries removed (or changed) since the last load.
+        removed = [device for devices in previous.values() for device in devices]
+        removed_names = [device.name for device in removed]  # before any renaming
+        for device in removed:
+            self._unregister(device)
+
+        def build(entry, Klass):
+            device = self.make_device(
+                Klass,
+                args=entry.get("args", ()),
+                kwargs=entry.get("kwargs", {}),
+                fake=fake,
+            )
+            try:
+                made = list(device)  # Factories provide several devices.
+            except TypeError:
+                made = [device]
+            rules = policy + entry.get("signal_policy", [])
+            if rules:
+                for device in made:
+                    rules.apply(device)
+            return made
+
+        def keep(entry, made):
+            loaded[_spec_key(entry, fake)] = made
+            devices.extend(made)
+
+        devices = []
+        for entry in later:
+            proxy = LazyDevice(
+                entry["kwargs"]["name"],
+                lambda e=entry: build(e, self._creator(e["device_class"]))[0],
+                labels=entry["kwargs"].get("labels", ()),
+                on_made=self._made,
+                connect_timeout=config.get("CONNECT_TIMEOUT", DEFAULT_TIMEOUT),
+            )
+            keep(entry, [proxy])
+        if workers <= 1 or len(jobs) <= 1:
+            for entry, Klass in jobs:
+                try:
+                    keep(entry, build(entry, Klass))
+                except Exception as exc:
+                    failures.append((entry, exc))
+        else:
+            # Kept (and registered by load()) in file order.
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                futures = [
+                    (entry, pool.submit(build, entry, Klass)) for entry, Klass in jobs
+                ]
+                for entry, future in futures:
+                    try:
+                        keep(entry, future.result())
+                    except Exception as exc:
+                        failures.append((entry, exc))
+
+        if self._source is not None:
+            self._loaded[self._source] = loaded
+        for device in removed:
+            if is_pending(device):
+                continue  # Never made.
+            # Some creators provide existing objects (such as 'ophyd.sim.motor').
+            if not any(device is new for new in devices):
+                try:
+                    device.destroy()  # Release its EPICS channels.
+                except Exception as exc:
+                    logger.warning("Could not destroy %r: %s", device.name, exc)
+        made = {device.name for device in devices}
+        for name in removed_names:
+            key = "replaced" if name in made else "removed"
+            getattr(self.changes, key).append(name)
+        replaced = set(self.changes.replaced)
+        self.changes.created += [d.name for d in devices if d.name not in replaced]
+        self.changes.devices = list(devices)
+
+        if len(failures) > 0:
+            raise DeviceConstructionError(failures, devices, len(entries))
         return devices
 
+    def parse_yaml_file(self, config_file) -> list[dict]:
+        """
+        Device entries from YAML format file (name or open file).
+
+        The entries come from the file's manifest (compiled when the file
+        changes, see :func:`~instrument.utils.device_manifest.load_manifest`).
+        Raises DeviceManifestError, before any device is made, if any entry
+        is not valid.
+        """
+        if isinstance(config_file, str):
+            config_file = pathlib.Path(config_file)
+        elif not isinstance(config_file, pathlib.Path):
+            # An open file (from 'guarneri.Instrument.load()').
+            config_file = pathlib.Path(config_file.name)
+        return load_manifest(config_file)
+
 
 _instr = Instrument({}, registry=oregistry)  # singleton
@@ -5,31 +5,21 @@ RunEngine Metadata
 .. autosummary::
     ~MD_PATH
     ~get_md_path
+    ~package_versions
     ~re_metadata
 """
 
 import getpass
+import importlib.metadata
 import logging
 import os
 import pathlib
 import socket
 import sys
 
-import apstools
-import bluesky
-import databroker
-import epics
-import h5py
-import intake
-import matplotlib
-import numpy
-import ophyd
-import pyRestTable
-import pysumreg
-import spec2nexus
-
 import bits
 from bits.utils.config_loaders import iconfig
+from bits.utils.metadata_store import STORED_KEYS
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
@@ -39,22 +29,45 @@ re_config = iconfig.get("RUN_ENGINE", {})
 DEFAULT_MD_PATH = pathlib.Path.home() / ".config" / "Bluesky_RunEngine_md"
 HOSTNAME = socket.gethostname() or "localhost"
 USERNAME = getpass.getuser() or "Bluesky user"
-VERSIONS = dict(
-    apstools=apstools.__version__,
-    bluesky=bluesky.__version__,
-    databroker=databroker.__version__,
-    epics=epics.__version__,
-    h5py=h5py.__version__,
-    intake=intake.__version__,
-    matplotlib=matplotlib.__version__,
-    numpy=numpy.__version__,
-    ophyd=ophyd.__version__,
-    pyRestTable=pyRestTable.__version__,
-    python=sys.version.split(" ")[0],
-    pysumreg=pysumreg.__version__,
-    spec2nexus=spec2nexus.__version__,
-    bits=bits.__version__,
+# Module name: distribution name (from which the version is read).
+VERSIONED_PACKAGES = dict(
+    apstools="apstools",
+    bluesky="bluesky",
+    databroker="databroker",
+    epics="pyepics",
+    h5py="h5py",
+    intake="intake",
+    matplotlib="matplotlib",
+    numpy="numpy",
+    ophyd="ophyd",
+    pyRestTable="pyRestTable",
+    pysumreg="pysumreg",
+    spec2nexus="spec2nexus",
 )
+
+
+def package_versions(packages=None):
+    """
+    Versions of installed packages, without importing them.
+
+    PARAMETERS
+
+    packages : dict
+        Module name: distribution name.  Default: ``VERSIONED_PACKAGES``.
+        Packages not installed are not reported.
+    """
+    versions = {}
+    for module, distribution in (packages or VERSIONED_PACKAGES).items():
+        try:
+            versions[module] = importlib.metadata.version(distribution)
+        except importlib.metadata.PackageNotFoundError:
+            logger.debug("Package %r is not installed.", distribution)
+    versions["python"] = sys.version.split(" ")[0]
+    versions["bits"] = bits.__version__
+    return versions
+
+
+VERSIONS = package_versions()
 RE_CONFIG = iconfig.get("RUN_ENGINE", {})
 
 
@@ -79,14 +92,24 @@ def get_md_path():
     return str(path)
 
 
-def re_metadata(cat=None):
-    """Programmatic metadata for the RunEngine."""
+def re_metadata(cat=None, store=None):
+    """
+    Programmatic metadata for the RunEngine.
+
+    With a 'store' (see :mod:`~instrument.utils.metadata_store`), the
+    ``iconfig`` and ``versions`` are saved there, and only their hashes
+    (``iconfig_hash``, ``versions_hash``) are in the metadata.
+    """
     md = {
         "login_id": f"{USERNAME}@{HOSTNAME}",
         "versions": VERSIONS,
         "pid": os.getpid(),
-        "iconfig": iconfig,
+        "iconfig": iconfig.to_dict(),
     }
+    if store is not None:
+        for key in STORED_KEYS:
+            md[f"{key}_hash"] = store.put(md.pop(key))
+        md["metadata_store"] = store.location
     if cat is not None:
         md["databroker_catalog"] = cat.name
     md.update(RE_CONFIG.get("DEFAULT_METADATA", {}))
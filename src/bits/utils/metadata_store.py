@@ -0,0 +1,198 @@
+"""
+Content-addressed store of run metadata
+=======================================
+
+Each run's start document has the whole ``iconfig`` and the package
+``versions``: several kilobytes, the same for every run of a session.
+With a *metadata store*, each distinct content is saved once, and the
+start document has only its hash (such as ``iconfig_hash``), and where
+it is saved (``metadata_store``).  :func:`resolve_metadata` gives them
+back.
+
+Configure in ``iconfig.yml``::
+
+    RUN_ENGINE:
+        METADATA_STORE: catalog
+
+========================  ============================================
+``METADATA_STORE``        content saved in
+========================  ============================================
+(not set)                 each start document (as before)
+``catalog``               the databroker catalog: collection
+                          ``bits_metadata`` (MongoDB), or directory
+                          ``bits_metadata`` next to its files (msgpack)
+any other text            that directory (content-addressed files)
+========================  ============================================
+
+EXAMPLE::
+
+    run = cat[-1]
+    md = resolve_metadata(run.metadata["start"])
+    print(md["iconfig"]["ICONFIG_VERSION"], md["versions"]["bluesky"])
+
+.. autosummary::
+    ~content_hash
+    ~metadata_store
+    ~resolve_metadata
+    ~DirectoryStore
+    ~MongoStore
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+COLLECTION = "bits_metadata"
+STORED_KEYS = ("iconfig", "versions")
+"""Start document keys with content in the store (as KEY_hash)."""
+
+
+def _canonical(content):
+    """The same JSON bytes for the same content (dictionary key order too)."""
+    return json.dumps(
+        content, sort_keys=True, separators=(",", ":"), default=str
+    ).encode()
+
+
+def content_hash(content):
+    """Hash ('sha256:...') of 'content' (anything JSON can represent)."""
+    return "sha256:" + hashlib.sha256(_canonical(content)).hexdigest()
+
+
+class DirectoryStore:
+    """
+    Content in a directory, one JSON file for each hash.
+
+    .. autosummary::
+        ~put
+        ~get
+    """
+
+    def __init__(self, path):
+        """Store in directory 'path' (created when needed)."""
+        self.path = pathlib.Path(path).expanduser().absolute()
+
+    @property
+    def location(self):
+        """Where the content is saved (for the start document)."""
+        return str(self.path)
+
+    def _file(self, key):
+        """File of 'key' ('sha256:abcd...' is in 'sha256/ab/cd...json')."""
+        algorithm, _, digest = key.partition(":")
+        return self.path / algorithm / digest[:2] / f"{digest[2:]}.json"
+
+    def put(self, content):
+        """Save 'content' (once).  Returns its hash."""
+        data = _canonical(content)
+        key = content_hash(content)
+        path = self._file(key)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            temporary.write_bytes(data)
+            os.replace(temporary, path)  # Complete, or not at all.
+            logger.debug("Saved %s in %s", key, self.path)
+        return key
+
+    def get(self, key):
+        """Content of hash 'key'.  Raises KeyError if not saved."""
+        try:
+            return json.loads(self._file(key).read_bytes())
+        except FileNotFoundError:
+            raise KeyError(f"{key} not in {self.path}") from None
+
+    def __repr__(self):
+        """representation of this object."""
+        return f"{self.__class__.__name__}({self.location!r})"
+
+
+class MongoStore:
+    """
+    Content in a MongoDB collection, one document for each hash.
+
+    .. autosummary::
+        ~put
+        ~get
+    """
+
+    def __init__(self, collection):
+        """Store in pymongo 'collection'."""
+        self.collection = collection
+
+    @property
+    def location(self):
+        """Where the content is saved (for the start document)."""
+        return f"mongodb:{self.collection.database.name}/{self.collection.name}"
+
+    def put(self, content):
+        """Save 'content' (once).  Returns its hash."""
+        key = content_hash(content)
+        self.collection.update_one(
+            {"_id": key},
+            {"$setOnInsert": {"content": json.loads(_canonical(content))}},
+            upsert=True,
+        )
+        return key
+
+    def get(self, key):
+        """Content of hash 'key'.  Raises KeyError if not saved."""
+        document = self.collection.find_one({"_id": key})
+        if document is None:
+            raise KeyError(f"{key} not in {self.location}")
+        return document["content"]
+
+    def __repr__(self):
+        """representation of this object."""
+        return f"{self.__class__.__name__}({self.location!r})"
+
+
+def metadata_store(spec, cat=None):
+    """
+    The store described by 'spec' (see module notes), or None.
+
+    'cat' (databroker catalog) is needed for ``spec="catalog"``.
+    """
+    if not spec:
+        return None
+    if spec != "catalog":
+        return DirectoryStore(spec)
+    if cat is None:
+        raise ValueError("METADATA_STORE: catalog needs a databroker catalog.")
+    db = getattr(cat, "_metadatastore_db", None)
+    if db is not None:  # MongoDB
+        return MongoStore(db.get_collection(COLLECTION))
+    paths = getattr(cat, "paths", None)
+    if paths:  # Files, such as msgpack.
+        return DirectoryStore(pathlib.Path(paths[0]).parent / COLLECTION)
+    raise ValueError(f"Catalog {cat.name!r} cannot store metadata.")
+
+
+def _store_at(location):
+    """The store at 'location' (from a start document)."""
+    if location.startswith("mongodb:"):
+        raise ValueError(f"Give the store of {location!r} to resolve_metadata().")
+    return DirectoryStore(location)
+
+
+def resolve_metadata(start, store=None):
+    """
+    Start document 'start' (a copy) with the content of its hashes.
+
+    The store is ``start["metadata_store"]``, unless 'store' is given
+    (needed for a MongoDB store: ``metadata_store("catalog", cat)``).
+    """
+    md = dict(start)
+    for key in STORED_KEYS:
+        hash_key = f"{key}_hash"
+        if hash_key not in md:
+            continue
+        if store is None:
+            store = _store_at(md["metadata_store"])
+        md[key] = store.get(md.pop(hash_key))
+    return md
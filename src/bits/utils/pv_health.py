@@ -0,0 +1,461 @@
+"""
+PV connection health
+====================
+
+Watch the connections of all the devices in ``oregistry``, in the
+background, and check them before a scan.
+
+For each signal, the monitor keeps:
+
+* whether it is connected now (and since when),
+* how many times it has disconnected and reconnected,
+* the latest read round-trip times (EPICS signals are read, a few at a
+  time, every ``INTERVAL`` seconds),
+* the latest put round-trip times (from the ``set()`` operations the
+  RunEngine waits for, once the monitor is attached to the RunEngine).
+
+Latencies are kept in a fixed-size ring buffer (the last ``SAMPLES``
+values) for each signal.
+
+Configure in ``iconfig.yml``::
+
+    PV_HEALTH:
+        ENABLE: true
+        INTERVAL: 1
+        BATCH: 20
+        SAMPLES: 64
+
+EXAMPLE::
+
+    start_health_monitor(RE)
+    print(health_summary())             # table, one row per device
+    RE(require_healthy([m1, scaler1], max_latency=0.5))  # before a scan
+
+.. autosummary::
+    ~start_health_monitor
+    ~stop_health_monitor
+    ~health_summary
+    ~require_healthy
+    ~HealthMonitor
+    ~DeviceHealthError
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+from bluesky import plan_stubs as bps
+from ophyd.signal import EpicsSignalBase
+
+from .config_loaders import iconfig
+from .controls_setup import oregistry
+from .latency import RingBuffer
+from .latency import milliseconds
+from .lazy_devices import is_pending
+from .lazy_devices import resolve
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+DEFAULT_INTERVAL = 1  # seconds between read probes
+DEFAULT_BATCH = 20  # signals read at each probe
+DEFAULT_SAMPLES = 64  # latencies kept for each signal
+DEFAULT_PROBE_TIMEOUT = 2  # seconds
+
+health_monitor = None
+"""The monitor started by :func:`start_health_monitor`."""
+
+
+class DeviceHealthError(RuntimeError):
+    """Required devices are not healthy.  ``problems``: {name: reason}."""
+
+    def __init__(self, problems):
+        """Report all the 'problems'."""
+        self.problems = problems
+        lines = [f"{len(problems)} required devices not healthy:"]
+        lines += [f"  {name}: {reason}" for name, reason in problems.items()]
+        super().__init__("\n".join(lines))
+
+
+class _SignalHealth:
+    """What the monitor knows about one signal."""
+
+    __slots__ = (
+        "signal",
+        "connected",
+        "since",
+        "disconnects",
+        "reconnects",
+        "read_failures",
+        "reads",
+    )
+
+    def __init__(self, signal, samples):
+        self.signal = signal
+        self.connected = bool(signal.connected)
+        self.since = time.time()
+        self.disconnects = 0
+        self.reconnects = 0
+        self.read_failures = 0
+        self.reads = RingBuffer(samples)
+
+
+def _signals(device):
+    """Signals of 'device' (not lazy), or the device itself if a Signal."""
+    if hasattr(device, "walk_signals"):
+        return [walk.item for walk in device.walk_signals(include_lazy=False)]
+    return [device]
+
+
+def _percentile(buffers, q):
+    """The q-th percentile of all the values in 'buffers', or None if none."""
+    values = np.concatenate([buffer.values() for buffer in buffers] or [[]])
+    if len(values) == 0:
+        return None
+    return float(np.percentile(values, q))
+
+
+def _name(device):
+    """Name of 'device' (object or name)."""
+    return device if isinstance(device, str) else resolve(device).name
+
+
+class HealthMonitor:
+    """
+    Watch the connections (and latencies) of the devices in a registry.
+
+    PARAMETERS
+
+    registry : ophydregistry.Registry
+        Devices to watch.  Devices added later are found at the next probe.
+    interval : float
+        Seconds between read probes.  (default: 1)
+    batch : int
+        Number of EPICS signals read at each probe, in turn.  (default: 20)
+    samples : int
+        Number of latencies kept for each signal.  (default: 64)
+    probe_timeout : float
+        Timeout (seconds) of each read probe.  (default: 2)
+
+    .. autosummary::
+        ~start
+        ~stop
+        ~refresh
+        ~probe
+        ~attach
+        ~device_health
+        ~problems
+        ~summary
+    """
+
+    def __init__(
+        self,
+        registry,
+        *,
+        interval=DEFAULT_INTERVAL,
+        batch=DEFAULT_BATCH,
+        samples=DEFAULT_SAMPLES,
+        probe_timeout=DEFAULT_PROBE_TIMEOUT,
+    ):
+        """Monitor for the devices of 'registry'.  Not started yet."""
+        self.registry = registry
+        self.interval = interval
+        self.batch = batch
+        self.samples = samples
+        self.probe_timeout = probe_timeout
+        self._lock = threading.RLock()
+        self._devices = {}  # {id(device): (device, [(signal, cid)])}
+        self._health = {}  # {id(signal): _SignalHealth}
+        self._puts = {}  # {name of the object set: RingBuffer}
+        self._next_probe = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Watch the devices now, and probe them in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pv_health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and all subscriptions."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + self.probe_timeout)
+            self._thread = None
+        with self._lock:
+            for key in list(self._devices):
+                self._forget(key)
+
+    def _run(self):
+        """Background thread: find new devices, probe some signals."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+                self.probe()
+            except Exception as exc:
+                logger.debug("Health probe failed: %s", exc)
+
+    def refresh(self):
+        """Watch devices added to the registry, forget those removed."""
+        roots = {
+            id(device): device
+            for device in self.registry.root_devices
+            if not is_pending(device)
+        }
+        with self._lock:
+            for key in set(self._devices) - set(roots):
+                self._forget(key)
+            for key in set(roots) - set(self._devices):
+                self._watch(roots[key])
+
+    def _watch(self, device):
+        """Subscribe to the connection changes of the signals of 'device'."""
+        subscriptions = []
+        for signal in _signals(device):
+            health = _SignalHealth(signal, self.samples)
+            self._health[id(signal)] = health
+            cid = signal.subscribe(self._on_meta, event_type="meta", run=False)
+            subscriptions.append((signal, cid))
+        self._devices[id(device)] = (device, subscriptions)
+
+    def _forget(self, key):
+        """Stop watching the device with id 'key'."""
+        device, subscriptions = self._devices.pop(key)
+        for signal, cid in subscriptions:
+            signal.unsubscribe(cid)
+            self._health.pop(id(signal), None)
+
+    def _on_meta(self, *, obj=None, connected=None, **kwargs):
+        """(callback) Note a change of the connection of signal 'obj'."""
+        health = self._health.get(id(obj))
+        if health is None or connected is None or bool(connected) == health.connected:
+            return
+        with self._lock:
+            health.connected = bool(connected)
+            health.since = time.time()
+            if connected:
+                health.reconnects += 1
+                logger.info("%s reconnected.", obj.name)
+            else:
+                health.disconnects += 1
+                logger.warning("%s disconnected.", obj.name)
+
+    def probe(self):
+        """Read (round trip) the next 'batch' connected EPICS signals."""
+        with self._lock:
+            candidates = [
+                health
+                for health in self._health.values()
+                if health.connected and isinstance(health.signal, EpicsSignalBase)
+            ]
+        if len(candidates) == 0:
+            return
+        start = self._next_probe % len(candidates)
+        chosen = (candidates[start:] + candidates[:start])[: self.batch]
+        self._next_probe = start + len(chosen)
+        for health in chosen:
+            t0 = time.perf_counter()
+            try:
+                health.signal.get(use_monitor=False, timeout=self.probe_timeout)
+            except Exception as exc:
+                health.read_failures += 1
+                logger.debug("Could not read %s: %s", health.signal.name, exc)
+                continue
+            with self._lock:
+                health.reads.add(time.perf_counter() - t0)
+
+    def attach(self, RE):
+        """Keep the put latency of each ``set()`` the RunEngine waits for."""
+        previous = RE.waiting_hook
+
+        def waiting_hook(statuses):
+            if statuses is not None:
+                t0 = time.perf_counter()
+                for status in statuses:
+                    status.add_callback(lambda st, t0=t0: self._on_put(st, t0))
+            if previous is not None:
+                previous(statuses)
+
+        RE.waiting_hook = waiting_hook
+
+    def _on_put(self, status, t0):
+        """(callback) 'status' is done, 't0' seconds after the wait started."""
+        obj = getattr(status, "device", None) or getattr(status, "obj", None)
+        name = getattr(obj, "name", None)
+        if name is None or not status.success:
+            return
+        with self._lock:
+            if name not in self._puts:
+                self._puts[name] = RingBuffer(self.samples)
+            self._puts[name].add(time.perf_counter() - t0)
+
+    def device_health(self, device):
+        """
+        Health (dict) of 'device' (object or name) and its signals.
+
+        Keys: ``connected``, ``unconnected`` (signal names),
+        ``disconnects``, ``reconnects``, ``read_failures``,
+        ``read_p50``, ``read_p95``, ``put_p50``, ``put_p95`` (seconds).
+        """
+        if isinstance(device, str):
+            device = self.registry.find(device)
+        device = resolve(device)
+        signals = _signals(device)
+        with self._lock:
+            records = [self._health.get(id(signal)) for signal in signals]
+            records = [health for health in records if health is not None]
+            if len(records) == 0:  # Not watched (yet): check it now.
+                records = [_SignalHealth(signal, 1) for signal in signals]
+            reads = [health.reads for health in records]
+            names = {device.name, *(signal.name for signal in signals)}
+            puts = [self._puts[name] for name in names if name in self._puts]
+            return dict(
+                connected=all(health.connected for health in records),
+                unconnected=[h.signal.name for h in records if not h.connected],
+                disconnects=sum(health.disconnects for health in records),
+                reconnects=sum(health.reconnects for health in records),
+                read_failures=sum(health.read_failures for health in records),
+                read_p50=_percentile(reads, 50),
+                read_p95=_percentile(reads, 95),
+                put_p50=_percentile(puts, 50),
+                put_p95=_percentile(puts, 95),
+            )
+
+    def problems(self, devices=None, *, max_latency=None, max_reconnects=None):
+        """
+        Reasons (dict by device name) that 'devices' are not healthy.
+
+        A device is not healthy if any of its signals is not connected, if
+        it has reconnected more than 'max_reconnects' times (flapping), or if
+        its 95th percentile read or put latency is more than 'max_latency'
+        seconds.  All watched devices if 'devices' is None.
+        """
+        if devices is None:
+            with self._lock:
+                devices = [device for device, _s in self._devices.values()]
+        found = {}
+        for device in devices:
+            health = self.device_health(device)
+            name = _name(device)
+            reasons = []
+            if not health["connected"]:
+                unconnected = health["unconnected"]
+                reasons.append(
+                    f"{len(unconnected)} signals not connected"
+                    f" ({', '.join(unconnected[:5])})"
+                )
+            if max_reconnects is not None and health["reconnects"] > max_reconnects:
+                reasons.append(f"reconnected {health['reconnects']} times")
+            if max_latency is not None:
+                for key in ("read_p95", "put_p95"):
+                    value = health[key]
+                    if value is not None and value > max_latency:
+                        reasons.append(f"{key} {milliseconds(value)} ms")
+            if len(reasons) > 0:
+                found[name] = "; ".join(reasons)
+        return found
+
+    def summary(self):
+        """Table (str) of the health of each watched device."""
+        import pyRestTable
+
+        with self._lock:
+            devices = sorted(
+                (device for device, _s in self._devices.values()),
+                key=lambda device: device.name,
+            )
+        table = pyRestTable.Table()
+        table.labels = (
+            "device connected disconnects reconnects"
+            " read_p50_ms read_p95_ms put_p50_ms put_p95_ms"
+        ).split()
+        for device in devices:
+            health = self.device_health(device)
+            connected = "yes"
+            if not health["connected"]:
+                connected = f"NO ({len(health['unconnected'])} signals)"
+            table.addRow(
+                (
+                    device.name,
+                    connected,
+                    health["disconnects"],
+                    health["reconnects"],
+                    milliseconds(health["read_p50"]),
+                    milliseconds(health["read_p95"]),
+                    milliseconds(health["put_p50"]),
+                    milliseconds(health["put_p95"]),
+                )
+            )
+        return str(table)
+
+
+def start_health_monitor(RE=None, registry=None):
+    """
+    Start (once) the health monitor configured by ``PV_HEALTH`` in iconfig.
+
+    Attach it to 'RE' (if given) to keep put latencies.  Watches
+    ``oregistry`` unless another 'registry' is given.  Returns the monitor.
+    """
+    global health_monitor
+
+    if health_monitor is None:
+        if registry is None:
+            registry = oregistry
+
+        config = iconfig.get("PV_HEALTH", {})
+        health_monitor = HealthMonitor(
+            registry,
+            interval=config.get("INTERVAL", DEFAULT_INTERVAL),
+            batch=config.get("BATCH", DEFAULT_BATCH),
+            samples=config.get("SAMPLES", DEFAULT_SAMPLES),
+        )
+        if RE is not None:
+            health_monitor.attach(RE)
+    health_monitor.start()
+    return health_monitor
+
+
+def stop_health_monitor():
+    """Stop (and forget) the health monitor."""
+    global health_monitor
+
+    if health_monitor is not None:
+        health_monitor.stop()
+        health_monitor = None
+
+
+def health_summary():
+    """Table (str) of the health of each device, from the monitor."""
+    if health_monitor is None:
+        return "The PV health monitor is not running."
+    return health_monitor.summary()
+
+
+def require_healthy(devices, *, max_latency=None, max_reconnects=None, monitor=None):
+    """
+    (plan stub) Fail fast if any of 'devices' is not healthy.
+
+    Raises :class:`DeviceHealthError`, listing every problem, before the
+    scan starts.  Uses the health monitor (latencies, reconnects) if
+    running, otherwise only checks that the devices are connected.
+    See :meth:`HealthMonitor.problems` for the parameters.
+    """
+    yield from bps.null()
+    if monitor is None and health_monitor is None:
+        # A new monitor (which watches nothing) checks the connections now.
+        monitor = HealthMonitor(oregistry)
+    monitor = monitor or health_monitor
+    problems = monitor.problems(
+        devices, max_latency=max_latency, max_reconnects=max_reconnects
+    )
+    if len(problems) > 0:
+        raise DeviceHealthError(problems)
+    if devices is None:
+        logger.debug("All watched devices healthy.")
+    else:
+        logger.debug("Required devices healthy: %s", [_name(d) for d in devices])
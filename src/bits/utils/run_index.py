@@ -0,0 +1,330 @@
+"""
+Local index of runs (SQLite)
+============================
+
+Finding a run (such as "scan 1234 from last week") with ``cat.search()``
+reads much of a large catalog.  A :class:`RunIndex` is a small SQLite
+file with a row for each run: uid, scan_id, plan_name, title, start and
+stop time, exit status, number of events, and the names of its
+detectors and motors.  Lookups return uids at once::
+
+    uid = run_index.find(scan_id=1234, since="2026-10-10")[0]
+    run = cat[uid]
+
+As a RunEngine subscription, the index adds each run as it stops.
+Configure in ``iconfig.yml``::
+
+    RUN_ENGINE:
+        RUN_INDEX: .run_index.sqlite
+
+To index the runs already in a catalog (in parallel)::
+
+    bits-run-index backfill CATALOG_NAME --db .run_index.sqlite
+
+.. autosummary::
+    ~RunIndex
+    ~backfill
+    ~run_row
+    ~main
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import logging
+import pathlib
+import sqlite3
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH = 200  # runs for each worker job
+COLUMNS = """
+    uid scan_id plan_name title time_start time_stop exit_status num_events
+""".split()
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    uid TEXT PRIMARY KEY,
+    scan_id INTEGER,
+    plan_name TEXT,
+    title TEXT,
+    time_start REAL,
+    time_stop REAL,
+    exit_status TEXT,
+    num_events INTEGER
+);
+CREATE TABLE IF NOT EXISTS run_devices (
+    uid TEXT NOT NULL REFERENCES runs(uid) ON DELETE CASCADE,
+    role TEXT NOT NULL,  -- 'detector' or 'motor'
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_scan_id ON runs(scan_id);
+CREATE INDEX IF NOT EXISTS runs_plan_name ON runs(plan_name);
+CREATE INDEX IF NOT EXISTS runs_title ON runs(title);
+CREATE INDEX IF NOT EXISTS runs_time_start ON runs(time_start);
+CREATE INDEX IF NOT EXISTS run_devices_name ON run_devices(name, role);
+CREATE INDEX IF NOT EXISTS run_devices_uid ON run_devices(uid);
+"""
+
+
+def _timestamp(when):
+    """Seconds since the epoch of 'when' (number, datetime, or ISO text)."""
+    if isinstance(when, str):
+        when = datetime.datetime.fromisoformat(when)
+    if isinstance(when, datetime.datetime):
+        return when.timestamp()
+    return float(when)
+
+
+def _names(value):
+    """List of names from a start document key ('motors' may be text)."""
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value or []]
+
+
+def run_row(start, stop=None):
+    """(row, devices) for the index, from a run's start and stop documents."""
+    stop = stop or {}
+    row = dict(
+        uid=start["uid"],
+        scan_id=start.get("scan_id"),
+        plan_name=start.get("plan_name"),
+        title=start.get("title"),
+        time_start=start.get("time"),
+        time_stop=stop.get("time"),
+        exit_status=stop.get("exit_status"),
+        num_events=sum((stop.get("num_events") or {}).values()) if stop else None,
+    )
+    devices = [("detector", name) for name in _names(start.get("detectors"))]
+    devices += [("motor", name) for name in _names(start.get("motors"))]
+    return row, devices
+
+
+class RunIndex:
+    """
+    SQLite index of runs.  Subscribe it to the RunEngine.  See module notes.
+
+    .. autosummary::
+        ~__call__
+        ~add
+        ~find
+        ~get
+        ~uids
+        ~close
+    """
+
+    def __init__(self, path):
+        """Index in SQLite file 'path' (created if needed)."""
+        self.path = pathlib.Path(path).expanduser()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        self._starts = {}  # {uid: start document} of open runs
+
+    def __call__(self, name, doc):
+        """(RunEngine subscription) Add each run as it stops."""
+        if name == "start":
+            self._starts[doc["uid"]] = doc
+        elif name == "stop":
+            start = self._starts.pop(doc["run_start"], None)
+            if start is not None:
+                try:
+                    self.add([run_row(start, doc)])
+                except sqlite3.Error as exc:
+                    logger.error("Run %s not indexed: %s", start["uid"], exc)
+
+    def add(self, rows):
+        """Add (or replace) 'rows': (row, devices) from :func:`run_row`."""
+        rows = list(rows)
+        with self._lock, self._db:
+            uids = [(row["uid"],) for row, _devices in rows]
+            self._db.executemany("DELETE FROM run_devices WHERE uid = ?", uids)
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO runs ({', '.join(COLUMNS)})"
+                f" VALUES ({', '.join(':' + c for c in COLUMNS)})",
+                [row for row, _devices in rows],
+            )
+            self._db.executemany(
+                "INSERT INTO run_devices (uid, role, name) VALUES (?, ?, ?)",
+                [
+                    (row["uid"], role, name)
+                    for row, devices in rows
+                    for role, name in devices
+                ],
+            )
+
+    def find(
+        self,
+        *,
+        scan_id=None,
+        plan_name=None,
+        title=None,
+        since=None,
+        until=None,
+        exit_status=None,
+        detector=None,
+        motor=None,
+        limit=None,
+    ):
+        """
+        uids of the runs that match all the terms given, newest first.
+
+        'title' may have SQL wildcards (``%`` and ``_``).  'since' and
+        'until' (start time) are seconds since the epoch, datetimes, or
+        ISO text (such as ``"2026-10-10 08:00"``).
+        """
+        terms = []
+        values = []
+        for column, value in (
+            ("scan_id", scan_id),
+            ("plan_name", plan_name),
+            ("exit_status", exit_status),
+        ):
+            if value is not None:
+                terms.append(f"{column} = ?")
+                values.append(value)
+        if title is not None:
+            terms.append("title LIKE ?")
+            values.append(title)
+        if since is not None:
+            terms.append("time_start >= ?")
+            values.append(_timestamp(since))
+        if until is not None:
+            terms.append("time_start < ?")
+            values.append(_timestamp(until))
+        for role, name in (("detector", detector), ("motor", motor)):
+            if name is not None:
+                terms.append(
+                    "uid IN (SELECT uid FROM run_devices WHERE name = ? AND role = ?)"
+                )
+                values += [name, role]
+        sql = "SELECT uid FROM runs"
+        if terms:
+            sql += " WHERE " + " AND ".join(terms)
+        sql += " ORDER BY time_start DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            values.append(int(limit))
+        with self._lock:
+            return [uid for (uid,) in self._db.execute(sql, values)]
+
+    def get(self, uid):
+        """Indexed values (dict) of run 'uid'.  Raises KeyError if not indexed."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM runs WHERE uid = ?", (uid,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(uid)
+            md = dict(zip(COLUMNS, row, strict=True))
+            devices = self._db.execute(
+                "SELECT role, name FROM run_devices WHERE uid = ?", (uid,)
+            ).fetchall()
+        md["detectors"] = [name for role, name in devices if role == "detector"]
+        md["motors"] = [name for role, name in devices if role == "motor"]
+        return md
+
+    def uids(self):
+        """Set of the uids indexed."""
+        with self._lock:
+            return {uid for (uid,) in self._db.execute("SELECT uid FROM runs")}
+
+    def __len__(self):
+        """Number of runs indexed."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def close(self):
+        """Close the SQLite file."""
+        with self._lock:
+            self._db.close()
+
+
+def _read_runs(cat, uids):
+    """Rows (for the index) of runs 'uids' in catalog 'cat'."""
+    rows = []
+    for uid in uids:
+        try:
+            metadata = cat[uid].metadata
+            rows.append(run_row(metadata["start"], metadata.get("stop")))
+        except Exception as exc:
+            logger.warning("Run %s not indexed: %s", uid, exc)
+    return rows
+
+
+def backfill(
+    cat, index, *, workers=DEFAULT_WORKERS, batch=DEFAULT_BATCH, replace=False
+):
+    """
+    Add the runs of catalog 'cat' to 'index' (RunIndex).
+
+    The runs are read in batches of 'batch', by up to 'workers' threads.
+    Runs already indexed are skipped (unless 'replace').  Returns the
+    number of runs added.
+    """
+    uids = list(cat)
+    if not replace:
+        indexed = index.uids()
+        uids = [uid for uid in uids if uid not in indexed]
+    batches = [uids[i : i + batch] for i in range(0, len(uids), batch)]
+    added = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for rows in pool.map(lambda b: _read_runs(cat, b), batches):
+            index.add(rows)  # One writer: this thread.
+            added += len(rows)
+            logger.info("Indexed %d of %d runs.", added, len(uids))
+    return added
+
+
+def main(argv=None):
+    """Entry point of the ``bits-run-index`` command."""
+    parser = argparse.ArgumentParser(
+        prog="bits-run-index", description="Local (SQLite) index of bluesky runs."
+    )
+    parser.add_argument("--db", default=".run_index.sqlite", help="SQLite file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fill = commands.add_parser("backfill", help="index the runs of a catalog")
+    fill.add_argument("catalog", help="databroker catalog name")
+    fill.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    fill.add_argument("--batch", type=int, default=DEFAULT_BATCH)
+    fill.add_argument("--replace", action="store_true", help="index all runs again")
+    find = commands.add_parser("find", help="print uids of matching runs")
+    find.add_argument("--scan-id", type=int)
+    find.add_argument("--plan-name")
+    find.add_argument("--title", help="SQL LIKE pattern")
+    find.add_argument("--since", help="ISO date/time")
+    find.add_argument("--until", help="ISO date/time")
+    find.add_argument("--limit", type=int)
+    args = parser.parse_args(argv)
+
+    index = RunIndex(args.db)
+    if args.command == "backfill":
+        import databroker
+
+        cat = databroker.catalog[args.catalog].v2
+        added = backfill(
+            cat, index, workers=args.workers, batch=args.batch, replace=args.replace
+        )
+        print(f"{added} runs indexed in {args.db} ({len(index)} in all).")
+    else:
+        for uid in index.find(
+            scan_id=args.scan_id,
+            plan_name=args.plan_name,
+            title=args.title,
+            since=args.since,
+            until=args.until,
+            limit=args.limit,
+        ):
+            print(uid)
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
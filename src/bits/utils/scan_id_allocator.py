@@ -0,0 +1,217 @@
+"""
+Allocate scan_id from an EPICS PV
+=================================
+
+The RunEngine asks for a new ``scan_id`` as each run opens.  With
+:class:`ScanIdAllocator` as the RunEngine's ``scan_id_source``, that
+costs no EPICS communication at all:
+
+* The PV's value is monitored (and read in the background when the PV
+  connects), so the next scan_id is known before it is needed.
+* Each new scan_id is written first (and ``fsync``-ed) to a local counter
+  file, then to the PV in the background.  A scan_id, once returned, is
+  never given again, even after a crash.
+* When the PV is slow or disconnected, runs continue with scan_ids from
+  the local counter file.  When the PV connects again, the PV and the
+  counter are reconciled: both take the larger value.
+
+The new scan_id is one more than the larger of the PV's value and the
+local counter.  To start the numbering again, use :meth:`ScanIdAllocator.reset`
+(setting only the PV is not enough).
+
+Configure in ``iconfig.yml``::
+
+    RUN_ENGINE:
+        SCAN_ID_PV: "IOC:bluesky_scan_id"
+        SCAN_ID_FILE: .scan_id
+
+EXAMPLE::
+
+    scan_id_epics = EpicsSignal("IOC:bluesky_scan_id", name="scan_id_epics")
+    RE.scan_id_source = ScanIdAllocator(scan_id_epics, ".scan_id")
+
+.. autosummary::
+    ~ScanIdAllocator
+"""
+
+import concurrent.futures
+import logging
+import os
+import pathlib
+import threading
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+DEFAULT_FILE = ".scan_id"
+DEFAULT_TIMEOUT = 2  # seconds, for each get or put of the PV
+
+
+class ScanIdAllocator:
+    """
+    Callable ``scan_id_source`` for the RunEngine.  See the module notes.
+
+    PARAMETERS
+
+    signal : ophyd.Signal
+        The scan_id PV (such as an ``EpicsSignal``).
+    path : str
+        Local counter file.  (default: ``.scan_id``)
+    timeout : float
+        Timeout (seconds) of each background get or put of the PV.
+        (default: 2)
+
+    .. autosummary::
+        ~__call__
+        ~last
+        ~reset
+        ~sync
+        ~close
+    """
+
+    def __init__(self, signal, path=DEFAULT_FILE, *, timeout=DEFAULT_TIMEOUT):
+        """Allocate from 'signal', with local counter file 'path'."""
+        self.signal = signal
+        self.path = pathlib.Path(path)
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._local = self._read_local()
+        self._pv_value = None  # Last value known from the PV.
+        self._sync_queued = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="scan_id"
+        )
+        self._cids = [
+            signal.subscribe(self._on_value, run=False),
+            signal.subscribe(self._on_meta, event_type="meta", run=False),
+        ]
+        self._queue_sync()  # Connect and read the PV in the background.
+
+    def __call__(self, md=None):
+        """Return a new scan_id ('md' is not used)."""
+        with self._lock:
+            scan_id = self.last + 1
+            self._write_local(scan_id)
+        if not self.signal.connected:
+            logger.warning(
+                "scan_id PV %s not connected.  scan_id=%d from %s.",
+                self._pv_name,
+                scan_id,
+                self.path,
+            )
+        self._queue_sync()
+        return scan_id
+
+    @property
+    def last(self):
+        """The most recent scan_id (larger of the PV and local counter)."""
+        with self._lock:
+            return max(self._local, self._pv_value or 0)
+
+    @property
+    def _pv_name(self):
+        """Name of the PV (or the signal)."""
+        return getattr(self.signal, "pvname", self.signal.name)
+
+    def reset(self, scan_id=0):
+        """Start the numbering again: the next scan_id is 'scan_id' + 1."""
+        self._executor.submit(self._reset, scan_id).result()
+
+    def sync(self):
+        """Reconcile the PV and the local counter now (blocking)."""
+        self._executor.submit(self._sync).result()
+
+    def close(self):
+        """Finish background work and stop watching the PV."""
+        for cid in self._cids:
+            self.signal.unsubscribe(cid)
+        self._executor.shutdown(wait=True)
+
+    # Local counter file
+
+    def _read_local(self):
+        """scan_id in the local counter file (0 if none)."""
+        try:
+            return int(self.path.read_text().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError as exc:
+            raise ValueError(f"Not a scan_id in {self.path}: {exc}") from exc
+
+    def _write_local(self, scan_id):
+        """Write 'scan_id' to the local counter file, safely on disk."""
+        temporary = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(temporary, "w") as f:
+            f.write(f"{scan_id}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        try:  # The rename itself must also be on disk.
+            fd = os.open(self.path.parent, os.O_RDONLY)
+        except OSError:
+            pass
+        else:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._local = scan_id
+
+    # PV (in the background thread)
+
+    def _on_value(self, *, value=None, **kwargs):
+        """(callback) The PV has a new value."""
+        if value is None:
+            return
+        with self._lock:
+            self._pv_value = int(value)
+
+    def _on_meta(self, *, connected=None, **kwargs):
+        """(callback) The PV connected or disconnected."""
+        if connected:
+            logger.info("scan_id PV %s connected.", self._pv_name)
+            self._queue_sync()
+        elif connected is not None:
+            logger.warning(
+                "scan_id PV %s disconnected.  Using %s.", self._pv_name, self.path
+            )
+
+    def _queue_sync(self):
+        """Reconcile in the background (once, however many requests)."""
+        with self._lock:
+            if self._sync_queued:
+                return
+            self._sync_queued = True
+        self._executor.submit(self._sync)
+
+    def _put(self, scan_id):
+        """Write 'scan_id' to the PV and wait for it."""
+        self.signal.set(scan_id).wait(timeout=self.timeout)
+
+    def _reset(self, scan_id):
+        """Write 'scan_id' to the PV, then to the local counter."""
+        self._put(scan_id)
+        with self._lock:
+            self._write_local(scan_id)
+            self._pv_value = scan_id
+
+    def _sync(self):
+        """Make the PV and the local counter agree: both take the larger."""
+        with self._lock:
+            self._sync_queued = False
+        try:
+            self.signal.wait_for_connection(timeout=self.timeout)
+            if not self.signal.connected:
+                raise TimeoutError(f"{self._pv_name} not connected")
+            pv_value = int(self.signal.get())
+            with self._lock:
+                target = max(pv_value, self._local)
+            if target > pv_value:
+                self._put(target)
+                logger.debug("scan_id PV %s set to %d.", self._pv_name, target)
+            with self._lock:
+                self._pv_value = max(target, self._pv_value or 0)
+                if target > self._local:
+                    self._write_local(target)
+        except Exception as exc:
+            logger.debug("scan_id PV %s not synchronized: %s", self._pv_name, exc)
@@ -0,0 +1,279 @@
+"""
+Serialization backends
+======================
+
+Write and read dictionaries in several file formats, for
+:class:`~bits.utils.stored_dict.StoredDict` and for configuration files.
+
+=======  ==================  ==========================================
+name     class               format
+=======  ==================  ==========================================
+yaml     YAMLSerializer      human-readable YAML (libyaml if available)
+json     JSONSerializer      JSON text, one top-level entry per line
+msgpack  MsgpackSerializer   binary MessagePack (``msgpack`` package)
+=======  ==================  ==========================================
+
+Each top-level ``{key: value}`` entry of a dictionary is serialized as a
+separate *fragment*.  A file is the fragments joined together.  When only a
+few entries change, only those entries need to be serialized again.
+
+.. autosummary::
+
+    ~get_serializer
+    ~yaml_dump
+    ~yaml_load
+    ~JSONSerializer
+    ~MsgpackSerializer
+    ~YAMLSerializer
+"""
+
+__all__ = """
+    get_serializer
+    yaml_dump
+    yaml_load
+    JSONSerializer
+    MsgpackSerializer
+    YAMLSerializer
+""".split()
+
+import datetime
+import json
+import logging
+
+import yaml
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+# Use libyaml (C) when available.
+_BaseSafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_BaseSafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+class _SafeDumper(_BaseSafeDumper):
+    """Safe YAML dumper that also accepts tuples and subclasses of basic types."""
+
+
+for _type, _representer in {
+    bool: yaml.representer.SafeRepresenter.represent_bool,
+    dict: yaml.representer.SafeRepresenter.represent_dict,
+    float: yaml.representer.SafeRepresenter.represent_float,
+    int: yaml.representer.SafeRepresenter.represent_int,
+    list: yaml.representer.SafeRepresenter.represent_list,
+    str: yaml.representer.SafeRepresenter.represent_str,
+    tuple: yaml.representer.SafeRepresenter.represent_list,
+}.items():
+    _SafeDumper.add_multi_representer(_type, _representer)
+
+
+def yaml_load(text, legacy=False):
+    """
+    Parse YAML 'text' (str or bytes) with the safe (libyaml, if available) loader.
+
+    Raises ValueError if 'text' has Python tags (such as ``!!python/tuple``,
+    as written by older versions).  With 'legacy' (configuration files
+    only), such text is read with ``yaml.FullLoader`` instead, with a warning.
+    """
+    try:
+        return yaml.load(text, Loader=_BaseSafeLoader)
+    except yaml.constructor.ConstructorError as exc:
+        if not legacy:
+            raise ValueError(
+                f"Not safe YAML: {exc.problem}.  To read it (once) and write"
+                " it again as safe YAML:"
+                " yaml_dump(yaml.load(text, Loader=yaml.FullLoader))."
+            ) from exc
+        logger.warning(
+            "Not safe YAML (%s), read with 'yaml.FullLoader'.  Please remove"
+            " the Python tags.",
+            exc.problem,
+        )
+        return yaml.load(text, Loader=yaml.FullLoader)
+
+
+def yaml_dump(contents, **kwargs):
+    """Write 'contents' as YAML text with the safe (libyaml, if available) dumper."""
+    kwargs.setdefault("indent", 2)
+    return yaml.dump(contents, Dumper=_SafeDumper, **kwargs)
+
+
+def _json_key(key):
+    """Raise TypeError (as 'json.dumps()' does) if 'key' is not a JSON key."""
+    if not isinstance(key, (str, int, float, bool, type(None))):
+        raise TypeError(
+            f"keys must be str, int, float, bool or None, not {key.__class__.__name__}"
+        )
+
+
+class _Serializer:
+    """
+    Base class of the serialization backends.
+
+    .. autosummary::
+
+        ~dumps
+        ~encode_item
+        ~join
+        ~loads
+        ~validate
+    """
+
+    name = None
+    binary = False  # Is the file content binary?
+    suffix = None  # Customary file name suffix.
+
+    def validate(self, key, value):
+        """
+        Raise TypeError if '{key: value}' is not JSON serializable.
+
+        Return the fragment for '{key: value}' if validation made it
+        (so it is not serialized twice), otherwise None.
+        """
+        json.dumps({key: value})
+
+    def encode_item(self, key, value):
+        """Serialize one top-level entry, '{key: value}', as a bytes fragment."""
+        raise NotImplementedError
+
+    def join(self, items, title=None):
+        """Content of a file from the (key, fragment) pairs in 'items'."""
+        raise NotImplementedError
+
+    def loads(self, data):
+        """Dictionary from file content 'data' (bytes)."""
+        raise NotImplementedError
+
+    def dumps(self, contents, title=None):
+        """File content (bytes) for dictionary 'contents'."""
+        items = [(k, self.encode_item(k, v)) for k, v in contents.items()]
+        return self.join(items, title=title)
+
+    def __repr__(self):
+        """representation of this object."""
+        return f"<{self.__class__.__name__} {self.name!r}>"
+
+
+class YAMLSerializer(_Serializer):
+    """
+    Human-readable YAML, with libyaml (``CSafeLoader``/``CSafeDumper``) if available.
+
+    Values are validated as JSON (fast, in C).  YAML fragments are made only
+    when the file is written.
+    """
+
+    name = "yaml"
+    suffix = ".yml"
+
+    def encode_item(self, key, value):
+        """Serialize one top-level entry, '{key: value}', as a bytes fragment."""
+        return yaml_dump({key: value}).encode()
+
+    def join(self, items, title=None):
+        """Content of a file from the (key, fragment) pairs in 'items'."""
+        header = ""
+        if isinstance(title, str) and len(title) > 0:
+            header += f"# {title}\n"
+        header += f"# Dictionary contents written: {datetime.datetime.now()}\n\n"
+        try:
+            items = sorted(items, key=lambda item: item[0])
+        except TypeError:
+            pass  # Keys of mixed types.  Leave them in dictionary order.
+        body = b"".join(fragment for _key, fragment in items) or b"{}\n"
+        return header.encode() + body
+
+    def loads(self, data):
+        """Dictionary from file content 'data' (bytes)."""
+        return yaml_load(data)
+
+
+class JSONSerializer(_Serializer):
+    """
+    JSON text, one top-level entry per line.
+
+    Validation makes the fragment.  JSON object keys are always strings.
+    """
+
+    name = "json"
+    suffix = ".json"
+
+    def validate(self, key, value):
+        """Raise TypeError if not JSON serializable.  Return the fragment."""
+        return self.encode_item(key, value)
+
+    def encode_item(self, key, value):
+        """Serialize one top-level entry, '{key: value}', as a bytes fragment."""
+        return json.dumps({key: value})[1:-1].encode()
+
+    def join(self, items, title=None):
+        """Content of a file from the (key, fragment) pairs in 'items'."""
+        if len(items) == 0:
+            return b"{}\n"
+        return b"{\n" + b",\n".join(fragment for _key, fragment in items) + b"\n}\n"
+
+    def loads(self, data):
+        """Dictionary from file content 'data' (bytes)."""
+        return json.loads(data)
+
+
+class MsgpackSerializer(_Serializer):
+    """
+    Binary MessagePack, requires the ``msgpack`` package.
+
+    Validation makes the fragment.
+    """
+
+    name = "msgpack"
+    binary = True
+    suffix = ".msgpack"
+
+    def __init__(self):
+        """Import msgpack now, so a missing package is reported early."""
+        import msgpack
+
+        self._msgpack = msgpack
+
+    def validate(self, key, value):
+        """Raise TypeError if not serializable.  Return the fragment."""
+        return self.encode_item(key, value)
+
+    def encode_item(self, key, value):
+        """Serialize one top-level entry, '{key: value}', as a bytes fragment."""
+        _json_key(key)
+        packb = self._msgpack.packb
+        return packb(key) + packb(value)
+
+    def join(self, items, title=None):
+        """Content of a file from the (key, fragment) pairs in 'items'."""
+        header = self._msgpack.Packer().pack_map_header(len(items))
+        return header + b"".join(fragment for _key, fragment in items)
+
+    def loads(self, data):
+        """Dictionary from file content 'data' (bytes)."""
+        return self._msgpack.unpackb(data, strict_map_key=False)
+
+
+SERIALIZERS = {
+    klass.name: klass for klass in (JSONSerializer, MsgpackSerializer, YAMLSerializer)
+}
+"""Known serializers, by name."""
+
+
+def get_serializer(serializer="yaml"):
+    """
+    Return a serializer object.
+
+    PARAMETERS
+
+    serializer : str or object
+        Name of a serializer (one of: ``json``, ``msgpack``, ``yaml``), or
+        a serializer object (which is returned unchanged).
+    """
+    if not isinstance(serializer, str):
+        return serializer
+    try:
+        klass = SERIALIZERS[serializer.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Unknown serializer {serializer!r}.  Choose from: {sorted(SERIALIZERS)}."
+        ) from None
+    return klass()
@@ -0,0 +1,496 @@
+"""
+Monitor or poll: a policy for each EPICS signal
+===============================================
+
+By default, every EPICS signal keeps a CA monitor: each change of its PV
+is sent to (and processed by) this Python session, even for PVs that are
+rarely read (such as most configuration PVs).  A *signal policy* chooses,
+for each signal:
+
+``monitor``
+    ``true``: keep a monitor.  ``false``: no monitor, read the PV (round
+    trip) each time its value is needed.  Signals with subscriptions
+    (such as a motor's readback) always keep their monitor.
+``deadband``
+    Ignore monitor updates that differ from the last one by less than this
+    (numbers only).  The IOC still sends them; this session does not
+    process them.
+``timeout``, ``write_timeout``, ``connection_timeout``
+    Timeouts (seconds) of this signal, instead of ``OPHYD.TIMEOUTS``.
+
+A policy is a list of rules.  Each rule has settings and (optionally)
+what it matches:
+
+``device_class``
+    Class of the device (``ophyd.EpicsMotor``, or ``EpicsMotor``),
+    including subclasses.
+``device``
+    Name of the device (wildcards such as ``m*`` are allowed).
+``component``
+    Dotted name of the signal within its device (such as ``velocity`` or
+    ``cam.acquire_time``, wildcards allowed).
+``kind``
+    Kind of the signal: ``hinted``, ``normal``, ``config``, or ``omitted``.
+
+For each setting, the last rule that matches (and has that setting)
+wins.  Rules from ``SIGNAL_POLICY`` in ``iconfig.yml`` come first, then
+those of the device's entry in the devices file (``signal_policy``)::
+
+    # iconfig.yml
+    SIGNAL_POLICY:
+      - {kind: config, monitor: false}
+      - {device_class: ophyd.EpicsMotor, component: user_readback, deadband: 0.0005}
+
+    # devices.yml
+    ophyd.EpicsMotor:
+    - name: m1
+      prefix: ioc:m1
+      signal_policy:
+        - {component: "*", timeout: 10}
+
+The policy is applied to each device made by ``make_devices()``, as it
+is made.  :func:`policy_report` measures the monitors (and their update
+rate) of some devices, applies a policy, and measures again.
+
+Some settings have no public ophyd (or control layer) API: the private
+attributes used are listed in :data:`SIGNAL_PRIVATE` and
+:data:`PV_PRIVATE`, and checked (once for each class) before they are
+used.  A RuntimeError names any that a new version removed.
+
+.. autosummary::
+    ~SignalPolicy
+    ~apply_policy
+    ~check_rules
+    ~monitor_stats
+    ~policy_report
+    ~MonitorStats
+    ~PolicyReport
+"""
+
+import fnmatch
+import importlib.metadata
+import logging
+import sys
+import threading
+import time
+
+from ophyd.signal import EpicsSignalBase
+
+from .config_loaders import iconfig
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+MATCH_KEYS = ("device_class", "device", "component", "kind")
+SETTING_KEYS = ("monitor", "deadband", "timeout", "write_timeout", "connection_timeout")
+TIMEOUT_KEYS = ("timeout", "write_timeout", "connection_timeout")
+KINDS = ("hinted", "normal", "config", "omitted")
+SIGNAL_PRIVATE = (
+    "_read_pv",
+    "_read_changed",
+    "_monitors",
+    "_callbacks",
+    "_metadata_lock",
+    "_auto_monitor",
+    *(f"_{key}" for key in TIMEOUT_KEYS),
+)
+"""Private attributes of ophyd's EPICS signals used here (ophyd 1.11)."""
+PV_PRIVATE = {
+    "caproto": ("_reference_count", "_auto_monitor_sub", "_check_auto_monitor_sub"),
+    "pyepics": ("_reference_count", "_monref"),
+}
+"""Private attributes of each control layer's PVs used here."""
+TESTED_VERSIONS = "ophyd 1.11, caproto 1.3, pyepics 3.5"
+
+
+def check_rules(rules):
+    """Raise ValueError if any of 'rules' (list of dict) is not valid."""
+    if not isinstance(rules, (list, tuple)):
+        raise ValueError(f"Signal policy must be a list of rules, not {rules!r}.")
+    for rule in rules:
+        if not isinstance(rule, dict):
+            raise ValueError(f"Signal policy rule must be a dictionary: {rule!r}")
+        unknown = set(rule) - set(MATCH_KEYS) - set(SETTING_KEYS)
+        if len(unknown) > 0:
+            raise ValueError(
+                f"Unknown keys {sorted(unknown)} in signal policy rule {rule!r}."
+            )
+        if rule.get("kind", "hinted") not in KINDS:
+            raise ValueError(f"Unknown kind in {rule!r}.  Use one of {KINDS}.")
+        for key in ("deadband", *TIMEOUT_KEYS):
+            value = rule.get(key, 0)
+            if value is not None and (not isinstance(value, (int, float)) or value < 0):
+                raise ValueError(f"{key!r} must be a number >= 0 in {rule!r}.")
+
+
+def _kind_name(signal):
+    """Most important kind of 'signal' (hinted, normal, config, omitted)."""
+    kind = signal.kind
+    for name in KINDS[:-1]:
+        if getattr(type(kind), name) in kind:
+            return name
+    return "omitted"
+
+
+def _class_names(device):
+    """Names (short and dotted) of the classes of 'device'."""
+    names = set()
+    for klass in type(device).__mro__:
+        names.add(klass.__name__)
+        parts = klass.__module__.split(".")
+        for n in range(1, len(parts) + 1):  # Also as imported: ophyd.EpicsMotor
+            module = sys.modules.get(".".join(parts[:n]))
+            if getattr(module, klass.__name__, None) is klass:
+                names.add(f"{module.__name__}.{klass.__name__}")
+    return names
+
+
+def _epics_signals(device):
+    """(dotted name, signal) of each EPICS signal of 'device' (not lazy)."""
+    if isinstance(device, EpicsSignalBase):
+        return [("", device)]
+    if not hasattr(device, "walk_signals"):
+        return []
+    return [
+        (walk.dotted_name, walk.item)
+        for walk in device.walk_signals(include_lazy=False)
+        if isinstance(walk.item, EpicsSignalBase)
+    ]
+
+
+class SignalPolicy:
+    """
+    Rules choosing monitor/poll, deadband, and timeouts of each signal.
+
+    See the module notes for the rules.
+
+    .. autosummary::
+        ~from_iconfig
+        ~settings
+        ~apply
+    """
+
+    def __init__(self, rules=()):
+        """Policy of 'rules' (list of dict, first to last)."""
+        rules = list(rules or [])
+        check_rules(rules)
+        self.rules = rules
+
+    def __bool__(self):
+        """Are there any rules?"""
+        return len(self.rules) > 0
+
+    def __add__(self, rules):
+        """This policy, then 'rules' (list or SignalPolicy)."""
+        return SignalPolicy(self.rules + list(getattr(rules, "rules", rules) or []))
+
+    @classmethod
+    def from_iconfig(cls):
+        """The policy of ``SIGNAL_POLICY`` in iconfig."""
+        return cls(iconfig.get("SIGNAL_POLICY") or [])
+
+    def settings(self, device, dotted_name, signal):
+        """Settings (dict) for 'signal' ('dotted_name' within 'device')."""
+        classes = None
+        found = {}
+        for rule in self.rules:
+            if "device_class" in rule:
+                classes = classes or _class_names(device)
+                if rule["device_class"] not in classes:
+                    continue
+            if "device" in rule and not fnmatch.fnmatchcase(
+                device.name, rule["device"]
+            ):
+                continue
+            if "component" in rule and not fnmatch.fnmatchcase(
+                dotted_name, rule["component"]
+            ):
+                continue
+            if "kind" in rule and _kind_name(signal) != rule["kind"]:
+                continue
+            found.update({k: v for k, v in rule.items() if k in SETTING_KEYS})
+        return found
+
+    def apply(self, device):
+        """
+        Apply the policy to the EPICS signals of 'device'.
+
+        Returns {signal name: settings applied}.
+        """
+        applied = {}
+        for dotted_name, signal in _epics_signals(device):
+            settings = self.settings(device, dotted_name, signal)
+            if len(settings) > 0:
+                applied[signal.name] = _apply_settings(signal, settings)
+        return applied
+
+
+# How the settings are applied to ophyd signals (both control layers).
+
+_checked = set()  # Classes (signal, PVs) with all the private attributes.
+
+
+def _layer(pv):
+    """Control layer ('caproto' or 'pyepics') of PV 'pv'."""
+    modules = [klass.__module__ for klass in type(pv).__mro__]
+    return "caproto" if any(m.startswith("caproto.") for m in modules) else "pyepics"
+
+
+def _versions():
+    """Versions (text) of ophyd and the control layers installed."""
+    versions = []
+    for package in ("ophyd", "caproto", "pyepics"):
+        try:
+            versions.append(f"{package} {importlib.metadata.version(package)}")
+        except importlib.metadata.PackageNotFoundError:
+            pass
+    return ", ".join(versions)
+
+
+def _check_private_api(signal):
+    """
+    Raise RuntimeError if 'signal' (or its PVs) lacks a private attribute used.
+
+    Checked once for each class of signal and PV.
+    """
+    pvs = [getattr(signal, name, None) for name in ("_read_pv", "_write_pv")]
+    classes = (type(signal), *(type(pv) for pv in pvs))
+    if classes in _checked:
+        return
+    missing = [
+        f"{type(signal).__name__}.{name}"
+        for name in SIGNAL_PRIVATE
+        if not hasattr(signal, name)
+    ]
+    for pv in pvs:
+        if pv is not None:
+            missing += [
+                f"{type(pv).__module__}.{type(pv).__name__}.{name}"
+                for name in PV_PRIVATE[_layer(pv)]
+                if not hasattr(pv, name)
+            ]
+    if len(missing) > 0:
+        raise RuntimeError(
+            f"Signal policy cannot be applied to {signal.name!r}:"
+            f" {', '.join(missing)} not found with {_versions()}."
+            f"  (Tested with {TESTED_VERSIONS}.)"
+        )
+    _checked.add(classes)
+
+
+def _signal_pvs(signal):
+    """{pvname: PV} of the read (and write) PVs of 'signal'."""
+    pvs = {signal.pvname: signal._read_pv}
+    write_pv = getattr(signal, "_write_pv", None)
+    if write_pv is not None:
+        pvs[signal.setpoint_pvname] = write_pv
+    return pvs
+
+
+def _pv_monitoring(pv):
+    """Does control layer PV 'pv' have a CA monitor now?"""
+    if hasattr(pv, "_auto_monitor_sub"):  # caproto
+        return pv._auto_monitor_sub is not None
+    return getattr(pv, "_monref", None) is not None  # PyEpics
+
+
+def _set_pv_monitor(pv, on):
+    """Start (or stop) the CA monitor of control layer PV 'pv'."""
+    pv.auto_monitor = on  # PyEpics: (un)subscribes once connected.
+    if hasattr(pv, "_auto_monitor_sub"):  # caproto
+        if not on and pv._auto_monitor_sub is not None:
+            pv._auto_monitor_sub.clear()
+            pv._auto_monitor_sub = None
+        elif on and pv.connected:
+            pv._check_auto_monitor_sub()
+
+
+def _deadband_filter(callback, deadband):
+    """Call 'callback' only when the value changes by 'deadband' or more."""
+    last = [None]
+
+    def filtered(value=None, **kwargs):
+        try:
+            if last[0] is not None and abs(value - last[0]) < deadband:
+                return
+        except TypeError:
+            pass  # Not a number: no deadband.
+        last[0] = value
+        callback(value=value, **kwargs)
+
+    filtered.deadband = deadband
+    return filtered
+
+
+def _no_subscriber(**kwargs):
+    """Subscribed for a moment: starts the monitor of a signal."""
+
+
+def _apply_settings(signal, settings):
+    """Apply 'settings' to EPICS 'signal'.  Returns the settings applied."""
+    _check_private_api(signal)
+    applied = {}
+    for key in TIMEOUT_KEYS:
+        if key in settings:
+            setattr(signal, f"_{key}", settings[key])
+            applied[key] = settings[key]
+
+    if "deadband" in settings:
+        read_changed = type(signal)._read_changed.__get__(signal)
+        if settings["deadband"]:
+            read_changed = _deadband_filter(read_changed, settings["deadband"])
+        signal._read_changed = read_changed  # Used from now on, then:
+        index = signal._monitors.get(signal.pvname)
+        callbacks = signal._read_pv.callbacks
+        if index is not None and index in callbacks:  # Already in use.
+            callbacks[index] = (read_changed, callbacks[index][1])
+        applied["deadband"] = settings["deadband"]
+
+    monitor = settings.get("monitor")
+    if monitor is not None:
+        if not monitor and len(signal._callbacks[signal.SUB_VALUE]) > 0:
+            monitor = True  # Its subscribers need the monitor.
+        applied["monitor"] = monitor
+        with signal._metadata_lock:
+            signal._auto_monitor = monitor
+            own = (signal._read_pv, getattr(signal, "_write_pv", None))
+            for pvname, pv in _signal_pvs(signal).items():
+                users = sum(1 for p in own if p is pv)  # Read & write: 2.
+                if not monitor:
+                    index = signal._monitors.get(pvname)
+                    if index is not None:
+                        pv.remove_callback(index)
+                        signal._monitors[pvname] = None
+                if pv._reference_count <= users:  # Not shared with other signals.
+                    _set_pv_monitor(pv, monitor)
+        if monitor:  # A subscription (re)starts the signal's monitor.
+            signal.subscribe(_no_subscriber, run=False)
+            signal.clear_sub(_no_subscriber)
+    return applied
+
+
+def apply_policy(devices, policy=None):
+    """
+    Apply 'policy' (default: from iconfig) to 'devices'.
+
+    Returns {signal name: settings applied}.
+    """
+    if policy is None:
+        policy = SignalPolicy.from_iconfig()
+    elif not isinstance(policy, SignalPolicy):
+        policy = SignalPolicy(policy)
+    applied = {}
+    if policy:
+        for device in devices:
+            applied.update(policy.apply(device))
+    logger.debug("Signal policy applied to %d signals.", len(applied))
+    return applied
+
+
+# Measure
+
+
+class MonitorStats:
+    """
+    CA monitors of some devices, and their updates (in 'seconds').
+
+    .. autosummary::
+        ~rate
+    """
+
+    def __init__(self, signals, pvs, monitors, updates, seconds):
+        """Measured values."""
+        self.signals = signals
+        """Number of EPICS signals."""
+        self.pvs = pvs
+        """Number of PVs (some signals have two)."""
+        self.monitors = monitors
+        """Number of PVs with a CA monitor."""
+        self.updates = updates
+        """Monitor updates received while measuring."""
+        self.seconds = seconds
+        """Time measured."""
+
+    @property
+    def rate(self):
+        """Monitor updates per second."""
+        return self.updates / self.seconds if self.seconds > 0 else 0
+
+    def __repr__(self):
+        """representation of this object."""
+        return (
+            f"<{self.__class__.__name__}"
+            f" pvs={self.pvs} monitors={self.monitors} rate={self.rate:.1f}/s>"
+        )
+
+
+def monitor_stats(devices, seconds=5.0):
+    """Count the CA monitors of 'devices' and their updates for 'seconds'."""
+    pvs = {}
+    n_signals = 0
+    for device in devices:
+        for _name, signal in _epics_signals(device):
+            _check_private_api(signal)
+            n_signals += 1
+            pvs.update(_signal_pvs(signal))
+    monitored = [pv for pv in pvs.values() if _pv_monitoring(pv)]
+
+    lock = threading.Lock()
+    updates = [0]
+
+    def count(**kwargs):
+        with lock:
+            updates[0] += 1
+
+    indexes = [(pv, pv.add_callback(count, with_ctrlvars=False)) for pv in monitored]
+    t0 = time.monotonic()
+    time.sleep(seconds)
+    elapsed = time.monotonic() - t0
+    for pv, index in indexes:
+        pv.remove_callback(index)
+    return MonitorStats(n_signals, len(pvs), len(monitored), updates[0], elapsed)
+
+
+class PolicyReport:
+    """Monitors before and after a policy was applied (see :func:`policy_report`)."""
+
+    def __init__(self, before, after, applied):
+        """Report of 'before' and 'after' (MonitorStats)."""
+        self.before = before
+        self.after = after
+        self.applied = applied
+        """{signal name: settings applied}"""
+
+    def __str__(self):
+        """Table: before and after."""
+        import pyRestTable
+
+        table = pyRestTable.Table()
+        table.labels = ["", "before", "after"]
+        table.addRow(("EPICS signals", self.before.signals, self.after.signals))
+        table.addRow(("PVs", self.before.pvs, self.after.pvs))
+        table.addRow(("active monitors", self.before.monitors, self.after.monitors))
+        table.addRow(
+            (
+                "updates per second",
+                f"{self.before.rate:.1f}",
+                f"{self.after.rate:.1f}",
+            )
+        )
+        table.addRow(("signals with a policy", "", len(self.applied)))
+        return str(table)
+
+
+def policy_report(devices, policy=None, seconds=5.0):
+    """
+    Measure, apply 'policy' (default: from iconfig) to 'devices', measure.
+
+    Returns a :class:`PolicyReport` (print it for a table).  Takes twice
+    'seconds'.
+    """
+    before = monitor_stats(devices, seconds)
+    applied = apply_policy(devices, policy)
+    after = monitor_stats(devices, seconds)
+    report = PolicyReport(before, after, applied)
+    logger.info("Signal policy:\n%s", report)
+    return report
@@ -10,16 +10,33 @@ Device factories are used to:
 * *Import* a device which is pre-defined in a module, such as the
   ophyd simulators in ``ophyd.sim``.
 
+The device manifest (see :mod:`~instrument.utils.device_manifest`) lists
+each device that :func:`factory_base` or :func:`motors` would make, as a
+separate entry.  With ``bulk: true``, the factory is kept as one entry:
+it creates and connects the EPICS channels of all its devices at once (see
+:mod:`~instrument.utils.bulk_channels`), then makes the devices.
+
+:func:`synthetic_beamline` makes many simulated motors and detectors (no
+EPICS), to test an instrument at full size on any computer.
+
 .. autosummary::
 
     ~factory_base
+    ~factory_entries
     ~motors
+    ~motors_entries
     ~predefined_device
+    ~synthetic_beamline
 """
 
 import logging
 
-from apstools.utils import dynamic_import
+from .bulk_channels import connect_channels
+from .bulk_channels import pv_names
+from .device_manifest import register_expansion
+from .device_manifest import resolve_creator
+from .synthetic_devices import SyntheticDetector
+from .synthetic_devices import SyntheticResponse
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
@@ -47,7 +64,7 @@ def predefined_device(*, name="", creator=""):
     """
     if creator == "":
         raise ValueError("Must provide a value for 'creator'.")
-    device = dynamic_import(creator)
+    device = resolve_creator(creator)
     if name != "":
         device.name = name
     logger.debug(device)
@@ -61,6 +78,8 @@ def factory_base(
     first=0,
     last=0,
     creator="ophyd.Signal",
+    bulk=False,
+    bulk_timeout=10,
     **kwargs,
 ):
     """
@@ -92,26 +111,75 @@ def factory_base(
         Name of the *creator* code that will be used to construct each device.
         (default: ``"ophyd.Signal"``)
 
+    bulk : bool
+        If ``True``, first create the EPICS channels of all the objects
+        and wait (once) for them to connect.  (default: ``False``)
+
+    bulk_timeout : float
+        With 'bulk', wait up to this long (seconds) for the channels to
+        connect.  (default: 10)
+
     kwargs : dict
         Dictionary of additional keyword arguments.  This is included
         when creating each object.
     """
+    klass = resolve_creator(creator)
+    entries = _factory_entries(
+        prefix=prefix, names=names, first=first, last=last, creator=creator, **kwargs
+    )
+    channels = []  # Keep the channels until the objects are made.
+    if bulk and prefix is not None:
+        names = [pv for _c, kw in entries for pv in pv_names(klass, kw["prefix"])]
+        channels, unconnected = connect_channels(names, timeout=bulk_timeout)
+        if len(unconnected) > 0:
+            logger.warning(
+                "%d of %d PVs not connected: %s",
+                len(unconnected),
+                len(channels),
+                ", ".join(unconnected[:10]),
+            )
+    for _creator, keywords in entries:
+        device = klass(**keywords)
+        logger.debug(device)
+        yield device
+
+
+def factory_entries(*, bulk=False, bulk_timeout=10, **kwargs):
+    """
+    List of (creator, kwargs) for each object :func:`factory_base` makes.
+
+    Same parameters as :func:`factory_base`.  Returns None with 'bulk'
+    (the objects are made together, by the factory).
+    """
+    if bulk:
+        return None
+    return _factory_entries(**kwargs)
+
+
+def _factory_entries(
+    *,
+    prefix=None,
+    names="object{}",
+    first=0,
+    last=0,
+    creator="ophyd.Signal",
+    **kwargs,
+):
+    """List of (creator, kwargs) for each object :func:`factory_base` makes."""
     if "{" not in names:
         names += "{}"
     if prefix is not None and "{" not in prefix:
         prefix += "{}"
 
-    klass = dynamic_import(creator)
-
+    entries = []
     first, last = sorted([first, last])
     for i in range(first, 1 + last):
         keywords = {"name": names.format(i)}
         if prefix is not None:
             keywords["prefix"] = prefix.format(i)
         keywords.update(kwargs)
-        device = klass(**keywords)
-        logger.debug(device)
-        yield device
+        entries.append((creator, keywords))
+    return entries
 
 
 def motors(
@@ -134,6 +202,8 @@ def motors(
           - {prefix: "ioc:m", first: 1, last: 4, labels: ["motor"]}
           # skip m5 & m6
           - {prefix: "ioc:m", first: 7, last: 22, labels: ["motor"]}
+          # connect all channels of these 64 motors at once
+          - {prefix: "ioc2:m", first: 1, last: 64, labels: ["motor"], bulk: true}
 
     Uses this pattern:
 
@@ -178,13 +248,21 @@ def motors(
 
     kwargs : dict
         Dictionary of additional keyword arguments.  This is included
-        with each EpicsMotor object.
+        with each EpicsMotor object (except 'bulk' and 'bulk_timeout',
+        see :func:`factory_base`).
     """
+    kwargs = _motors_kwargs(
+        prefix=prefix, names=names, first=first, last=last, **kwargs
+    )
+    for motor in factory_base(**kwargs):
+        yield motor
+
+
+def _motors_kwargs(*, prefix=None, names="m{}", first=0, last=0, **kwargs):
+    """Arguments of :func:`factory_base` for :func:`motors`."""
     if prefix is None:
         raise ValueError("Must define a string value for 'prefix'.")
 
-    kwargs["names"] = names or "m{}"
-    kwargs["prefix"] = prefix
     kwargs.update(
         {
             "prefix": prefix,
@@ -194,6 +272,102 @@ def motors(
             "creator": "ophyd.EpicsMotor",
         }
     )
+    return kwargs
 
-    for motor in factory_base(**kwargs):
-        yield motor
+
+def motors_entries(**kwargs):
+    """
+    List of (creator, kwargs) for each motor :func:`motors` makes.
+
+    Same parameters as :func:`motors`.  Returns None with 'bulk'.
+    """
+    return factory_entries(**_motors_kwargs(**kwargs))
+
+
+def synthetic_beamline(
+    *,
+    n_motors=10,
+    n_detectors=4,
+    motor_names="sm{}",
+    detector_names="sd{}",
+    seed=0,
+    image_shape=None,
+    noise="poisson",
+    motor_labels=("motors", "synthetic"),
+    detector_labels=("detectors", "synthetic"),
+):
+    """
+    Make simulated motors and detectors (no EPICS) with reproducible data.
+
+    Each detector sees a peak as one of the motors moves (see
+    :class:`~instrument.utils.synthetic_devices.SyntheticResponse`).  The
+    same 'seed' gives the same peaks and the same readings.
+
+    Example entry in `devices.yml` file:
+
+    .. code-block:: yaml
+        :linenos:
+
+        bits.utils.sim_creator.synthetic_beamline:
+          # 200 motors (sm1 .. sm200), 40 detectors (sd1 .. sd40)
+          - {n_motors: 200, n_detectors: 40, seed: 1}
+          # 2 motors (ix1, ix2), 4 detectors (img1 .. img4) with 256 x 256 images
+          - n_motors: 2
+            motor_names: "ix{}"
+            n_detectors: 4
+            detector_names: "img{}"
+            image_shape: [256, 256]
+            seed: 2
+
+    PARAMETERS
+
+    n_motors : int
+        Number of motors (``ophyd.sim.SynAxis``).  (default: 10)
+    n_detectors : int
+        Number of detectors
+        (:class:`~instrument.utils.synthetic_devices.SyntheticDetector`).
+        (default: 4)
+    motor_names : str
+        Name *pattern* for the motors, numbered from 1.  (default: ``"sm{}"``)
+    detector_names : str
+        Name *pattern* for the detectors, numbered from 1.
+        (default: ``"sd{}"``)
+    seed : int
+        Seed of the random number generators.  (default: 0)
+    image_shape : list or None
+        Shape of each detector's image.  No images if None.  (default: None)
+    noise : str
+        ``"poisson"``, ``"uniform"``, or ``"none"``.  (default: "poisson")
+    motor_labels : list
+        Labels of each motor.  (default: ``["motors", "synthetic"]``)
+    detector_labels : list
+        Labels of each detector.  (default: ``["detectors", "synthetic"]``)
+    """
+    from ophyd.sim import SynAxis
+
+    if "{" not in motor_names:
+        motor_names += "{}"
+    if "{" not in detector_names:
+        detector_names += "{}"
+
+    axes = [
+        SynAxis(name=motor_names.format(i), labels=list(motor_labels))
+        for i in range(1, 1 + n_motors)
+    ]
+    model = SyntheticResponse(
+        axes, n_detectors, seed=seed, image_shape=image_shape, noise=noise
+    )
+    yield from axes
+    for i in range(n_detectors):
+        detector = SyntheticDetector(
+            name=detector_names.format(i + 1),
+            model=model,
+            index=i,
+            labels=list(detector_labels),
+        )
+        logger.debug(detector)
+        yield detector
+
+
+register_expansion(factory_base, factory_entries)
+register_expansion(motors, motors_entries)
@@ -0,0 +1,136 @@
+"""
+Local soft IOC for tests and benchmarks
+=======================================
+
+A caproto soft IOC, on this host only, with the PVs of many motors (the
+fields of ``ophyd.EpicsMotor``, motors ``PREFIX1`` through ``PREFIXN``)
+and, optionally, a scan_id PV.  The motors do not move.
+
+From the command line (``EPICS_CA_SERVER_PORT`` sets the port)::
+
+    python -m bits.utils.soft_ioc --prefix sim:m --motors 64 --scan-id sim:scan_id
+
+From Python, :func:`soft_ioc` runs it in another process, on a private
+port, and gives the EPICS environment variables to reach it::
+
+    with soft_ioc(prefix="sim:m", motors=4) as env:
+        subprocess.run([sys.executable, "client.py"], env={**os.environ, **env})
+
+The environment must be set before the control layer (PyEpics or
+caproto) starts, which is why clients run in another process.
+
+.. autosummary::
+    ~soft_ioc
+    ~epics_env
+    ~motor_pvdb
+    ~main
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+MOTOR_FIELDS = """
+    .RBV .VAL .OFF .DIR .FOFF .SET .VELO .ACCL .MOVN .DMOV
+    .HLS .LLS .HLM .LLM .TDIR .STOP .HOMF .HOMR
+""".split()
+
+
+def motor_pvdb(prefix, n_motors):
+    """PV database for motors 1 .. 'n_motors'."""
+    from caproto import ChannelDouble
+    from caproto import ChannelString
+
+    pvdb = {}
+    for i in range(1, n_motors + 1):
+        for field in MOTOR_FIELDS:
+            pvdb[f"{prefix}{i}{field}"] = ChannelDouble(value=0, precision=3)
+        pvdb[f"{prefix}{i}.EGU"] = ChannelString(value="mm")
+    return pvdb
+
+
+def epics_env(port):
+    """EPICS environment variables: clients and server on this host, 'port'."""
+    return {
+        "EPICS_CA_ADDR_LIST": "127.0.0.1",
+        "EPICS_CA_AUTO_ADDR_LIST": "NO",
+        "EPICS_CA_SERVER_PORT": str(port),
+        "EPICS_CA_REPEATER_PORT": str(port + 1),
+        "EPICS_CAS_SERVER_PORT": str(port),
+        "EPICS_CAS_BEACON_PORT": str(port + 1),
+        "EPICS_CAS_INTF_ADDR_LIST": "127.0.0.1",
+    }
+
+
+def _free_port():
+    """A TCP port not in use now."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def soft_ioc(*, prefix="sim:m", motors=0, scan_id=None, port=None, timeout=30):
+    """
+    Run the soft IOC (another process) while in this context.
+
+    Yields the EPICS environment variables (dict) for its clients.
+    Waits (up to 'timeout' seconds) until the IOC accepts connections.
+    Use the same 'port' to start it again with the same environment.
+    """
+    port = port or _free_port()
+    env = epics_env(port)
+    command = [sys.executable, "-m", __name__, "--prefix", prefix]
+    command += ["--motors", str(motors)]
+    if scan_id is not None:
+        command += ["--scan-id", scan_id]
+    process = subprocess.Popen(
+        command,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        t0 = time.monotonic()
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Soft IOC exited ({process.returncode}).")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError as exc:
+                if time.monotonic() - t0 > timeout:
+                    raise TimeoutError(f"Soft IOC not started in {timeout} s.") from exc
+                time.sleep(0.1)
+        yield env
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(argv=None):
+    """Run the IOC until interrupted."""
+    from caproto import ChannelInteger
+    from caproto.server import run
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prefix", default="sim:m", help="motor PV prefix")
+    parser.add_argument("--motors", type=int, default=0, help="number of motors")
+    parser.add_argument("--scan-id", help="name of a scan_id PV (integer)")
+    args = parser.parse_args(argv)
+    pvdb = motor_pvdb(args.prefix, args.motors)
+    if args.scan_id is not None:
+        pvdb[args.scan_id] = ChannelInteger(value=0)
+    run(pvdb, interfaces=["127.0.0.1"], log_pv_names=False)
+
+
+if __name__ == "__main__":
+    main()
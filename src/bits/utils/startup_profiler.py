@@ -0,0 +1,201 @@
+"""
+Startup profiler
+================
+
+Measure where the time goes when a bluesky session starts.
+
+Startup code marks its phases (catalog, RunEngine, callbacks, file
+writers, devices) with :func:`phase`.  The cost of an unmeasured phase is
+one ``time.perf_counter()`` call at each end.
+
+The ``bits-startup-report`` command starts a clean Python process,
+imports ``bits.demo_instrument.startup`` (optionally, also makes the
+devices), and reports the phases.  With ``--imports``, it also reports
+import times (from ``python -X importtime``) by top-level package.
+
+EXAMPLE::
+
+    bits-startup-report --imports
+    bits-startup-report --devices --json startup.json
+
+.. autosummary::
+    ~aggregate_import_times
+    ~main
+    ~phase
+    ~phases
+    ~report
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+_T0 = time.perf_counter()  # Phase start times are relative to this.
+_phases = []  # Completed phases, in order of completion.
+_local = threading.local()  # Present nesting depth of phases, by thread.
+MARKER = "BITS_STARTUP_PHASES="  # Prefix of the report line from the child.
+
+CHILD_SCRIPT = """
+import json
+from bits.utils import startup_profiler
+
+with startup_profiler.phase("import bits.demo_instrument.startup"):
+    import bits.demo_instrument.startup as startup
+if {devices}:
+    with startup_profiler.phase("RE(make_devices())"):
+        startup.RE(startup.make_devices())
+print(startup_profiler.MARKER + json.dumps(startup_profiler.phases()))
+"""
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Record the time taken by the code in this context as phase 'name'.
+
+    EXAMPLE::
+
+        with phase("RunEngine"):
+            RE = bluesky.RunEngine()
+    """
+    depth = getattr(_local, "depth", 0)
+    t0 = time.perf_counter()
+    _local.depth = depth + 1
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        _phases.append(
+            dict(
+                name=name,
+                start=t0 - _T0,
+                seconds=time.perf_counter() - t0,
+                depth=depth,
+            )
+        )
+
+
+def phases():
+    """Phases recorded in this process (list of dict), in order of starting."""
+    return sorted(_phases, key=lambda entry: entry["start"])
+
+
+def aggregate_import_times(text):
+    """
+    Import time (seconds) by top-level package, from ``-X importtime`` output.
+
+    Sums the *self* time of each module, so nothing is counted twice.
+    Returns a dictionary, largest first.
+    """
+    totals = {}
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # The header line.
+        package = fields[2].strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(fields[0]) * 1e-6
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def report(results, top=20):
+    """Text tables of the phases and import times in 'results' (from 'main()')."""
+    import pyRestTable
+
+    table = pyRestTable.Table()
+    table.labels = "phase seconds start".split()
+    for entry in sorted(results["phases"], key=lambda e: e["seconds"], reverse=True):
+        name = "  " * entry["depth"] + entry["name"]
+        table.addRow((name, f"{entry['seconds']:.3f}", f"{entry['start']:.3f}"))
+    text = f"Startup phases (total {results['total_seconds']:.3f} s)\n\n{table}"
+
+    imports = results.get("imports")
+    if imports:
+        table = pyRestTable.Table()
+        table.labels = "package seconds".split()
+        for package, seconds in list(imports.items())[:top]:
+            table.addRow((package, f"{seconds:.3f}"))
+        total = sum(imports.values())
+        text += f"\nImport time by package (total {total:.3f} s)\n\n{table}"
+    return text
+
+
+def _profile(devices=False, imports=False, cwd=None):
+    """Profile startup in a new Python process.  Return the results (dict)."""
+    command = [sys.executable]
+    if imports:
+        command += ["-X", "importtime"]
+    command += ["-c", CHILD_SCRIPT.format(devices=devices)]
+    with contextlib.ExitStack() as stack:
+        if cwd is None:  # Keep files made by startup out of the way.
+            cwd = stack.enter_context(tempfile.TemporaryDirectory())
+        t0 = time.perf_counter()
+        process = subprocess.run(
+            command,
+            capture_output=True,
+            cwd=cwd,
+            env={**os.environ, "PYTHONUNBUFFERED": "1"},
+            text=True,
+        )
+        elapsed = time.perf_counter() - t0
+    lines = [ln for ln in process.stdout.splitlines() if ln.startswith(MARKER)]
+    if process.returncode != 0 or len(lines) == 0:
+        raise RuntimeError(
+            f"Startup failed (exit code {process.returncode}):\n{process.stderr}"
+        )
+    results = dict(
+        total_seconds=elapsed,
+        phases=json.loads(lines[-1][len(MARKER) :]),
+    )
+    if imports:
+        results["imports"] = aggregate_import_times(process.stderr)
+    return results
+
+
+def main(argv=None):
+    """Entry point of the ``bits-startup-report`` command."""
+    parser = argparse.ArgumentParser(
+        prog="bits-startup-report",
+        description="Report the time taken by each phase of bluesky session startup.",
+    )
+    parser.add_argument("--devices", action="store_true", help="also make the devices")
+    parser.add_argument(
+        "--imports",
+        action="store_true",
+        help="also report import time by package (python -X importtime)",
+    )
+    parser.add_argument(
+        "--json", metavar="FILE", help="write the results as JSON ('-' for stdout)"
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="number of packages to report"
+    )
+    parser.add_argument(
+        "--cwd", help="working directory for startup (default: a temporary one)"
+    )
+    args = parser.parse_args(argv)
+
+    results = _profile(devices=args.devices, imports=args.imports, cwd=args.cwd)
+    if args.json == "-":
+        print(json.dumps(results, indent=2))
+    else:
+        if args.json is not None:
+            pathlib.Path(args.json).write_text(json.dumps(results, indent=2))
+        print(report(results, top=args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
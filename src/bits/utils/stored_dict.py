@@ -10,27 +10,443 @@ Replaces ``bluesky.utils.PersistentDict``.
 * Contents stored in a single human-readable YAML file.
 * Sync to disk shortly after dictionary is updated.
 
+Other file formats (JSON, msgpack) may be chosen with the 'serializer'
+argument.  See :mod:`~bits.utils.serializers`.  Each top-level entry is
+serialized separately and kept, so a write to storage serializes only the
+entries changed since the last write.
+
+All StoredDict objects share one flush scheduler (a single daemon thread).
+Updates made while a dictionary waits to be written only move its deadline.
+Pending writes are completed when the Python interpreter exits.
+
+While Sphinx builds the documentation, new entries are ignored.  This is
+decided once, at import (see :data:`BUILDING_DOCS`), so writes never walk
+the call stack.
+
+In *journal* mode, each change is appended to a journal file (one JSON line
+per change) instead of rewriting the YAML file.  The journal is compacted
+into the YAML file once it grows past a size or line count threshold.
+The YAML file is always replaced atomically.
+
+In *shared* mode, several processes (such as a queueserver worker and an
+IPython console) may use the same file.  Each write to storage locks the
+file (advisory lock), merges changes made by other processes, then writes.
+A dictionary re-reads the file only when its inode, size, or modification
+time has changed.  Conflicts are resolved by key: keys changed by this
+process replace those keys in storage, all other keys come from storage.
+
+With *track_nested*, dictionaries and lists stored as values report their
+own changes, such as ``md["sample"]["temperature"] = 300``.  Only the
+changed value is validated and only its top-level entry is serialized
+again.  In journal mode, the change is journaled by its key path.
+Nested containers are tracked once they are reached by item access
+(``[key]`` or ``get()``), never copied on each access.
+
 .. autosummary::
 
+    ~BUILDING_DOCS
     ~StoredDict
+    ~flush_statistics
 """
 
-__all__ = ["StoredDict"]
+__all__ = ["BUILDING_DOCS", "StoredDict", "flush_statistics"]
 
+import atexit
 import collections.abc
-import datetime
-import inspect
+import contextlib
+import copy
+import heapq
+import itertools
 import json
 import logging
+import os
 import pathlib
+import sys
 import threading
 import time
 
-import yaml
+from .serializers import _json_key
+from .serializers import get_serializer
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 logger.bsdev(__file__)
 
+_DELETED = object()  # Marks a key deleted but not yet written to storage.
+_WHOLE = object()  # A nested container changed as a whole.
+
+
+def _building_docs():
+    """Is Sphinx building the documentation?"""
+    if os.environ.get("BITS_DOCS_BUILD", "").lower() in ("1", "true", "yes"):
+        return True
+    program = pathlib.Path(sys.argv[0]).name if sys.argv else ""
+    return "sphinx-build" in program
+
+
+BUILDING_DOCS = _building_docs()
+"""
+True if Sphinx is building the documentation (then StoredDict ignores new entries).
+
+Set environment variable ``BITS_DOCS_BUILD=1`` before import, or run
+``sphinx-build``.
+"""
+
+
+class _FlushScheduler:
+    """
+    Write StoredDict objects to storage when their deadlines expire.
+
+    One daemon thread serves every StoredDict in this process.  It waits on
+    a condition variable for the earliest deadline in a heap.  A write to a
+    dictionary that is already waiting only moves its deadline (the write is
+    *coalesced* with the pending one).
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._heap = []  # (deadline, sequence, key)
+        self._pending = {}  # key: [deadline, StoredDict]
+        self._sequence = itertools.count()
+        self._thread = None
+        self.coalesced = 0
+        self.flushes = 0
+        self.scheduled = 0
+
+    def schedule(self, sdict, deadline):
+        """Write 'sdict' to storage at (or soon after) 'deadline'."""
+        key = id(sdict)
+        with self._condition:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [deadline, sdict]
+                heapq.heappush(self._heap, (deadline, next(self._sequence), key))
+                self.scheduled += 1
+                self._condition.notify()
+            else:
+                entry[0] = deadline  # The thread re-queues it when due.
+                self.coalesced += 1
+                sdict.coalesced_writes += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="StoredDict_flush",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def cancel(self, sdict):
+        """Forget any pending write of 'sdict'.  Return True if one was pending."""
+        with self._condition:
+            return self._pending.pop(id(sdict), None) is not None
+
+    def is_pending(self, sdict):
+        """Is a write of 'sdict' waiting for its deadline?"""
+        return id(sdict) in self._pending
+
+    def flush_all(self):
+        """Write every pending StoredDict now (such as at interpreter exit)."""
+        with self._condition:
+            pending = [sdict for _deadline, sdict in self._pending.values()]
+            self._pending.clear()
+        for sdict in pending:
+            self._write(sdict)
+
+    def statistics(self):
+        """Counters describing the work of this scheduler."""
+        with self._condition:
+            return dict(
+                scheduled=self.scheduled,
+                coalesced=self.coalesced,
+                flushes=self.flushes,
+                pending=len(self._pending),
+            )
+
+    def _next_due(self):
+        """Wait for the next StoredDict to be due.  Call with the lock held."""
+        while True:
+            if len(self._heap) == 0:
+                self._condition.wait()
+                continue
+            deadline, _sequence, key = self._heap[0]
+            entry = self._pending.get(key)
+            if entry is None:  # Flushed (or cancelled) since it was queued.
+                heapq.heappop(self._heap)
+            elif entry[0] > deadline:  # Deadline was extended.
+                heapq.heapreplace(self._heap, (entry[0], next(self._sequence), key))
+            elif deadline > time.time():
+                self._condition.wait(deadline - time.time())
+            else:
+                heapq.heappop(self._heap)
+                del self._pending[key]
+                return entry[1]
+
+    def _run(self):
+        """Threaded task."""
+        logger.debug("Starting StoredDict flush scheduler.")
+        while True:
+            with self._condition:
+                sdict = self._next_due()
+            self._write(sdict)
+
+    def _write(self, sdict):
+        """Write one StoredDict, never raising into the scheduler thread."""
+        try:
+            sdict._write_storage()
+            with self._condition:
+                self.flushes += 1
+        except Exception as exc:
+            logger.error("Could not write %s: %s", sdict._file, exc)
+
+    def _after_fork_in_child(self):
+        """The thread (and maybe the lock) were not copied by os.fork()."""
+        self._condition = threading.Condition()
+        self._thread = None
+
+
+_scheduler = _FlushScheduler()
+atexit.register(_scheduler.flush_all)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_scheduler._after_fork_in_child)
+
+
+def flush_statistics():
+    """
+    Report the work of the StoredDict flush scheduler.
+
+    Returns a dictionary with these keys:
+
+    ``scheduled``
+        Number of writes that started a waiting period.
+    ``coalesced``
+        Number of writes absorbed into an already-pending flush.
+    ``flushes``
+        Number of times a dictionary was written by the scheduler.
+    ``pending``
+        Number of dictionaries waiting to be written now.
+    """
+    return _scheduler.statistics()
+
+
+def _raw_item(node, key):
+    """Item 'key' of container 'node', without tracking it."""
+    if isinstance(node, dict):
+        return dict.__getitem__(node, key)
+    return list.__getitem__(node, key)
+
+
+def _tracked(value, owner, path, parent):
+    """
+    Return 'value' as a container tracked by StoredDict 'owner'.
+
+    Returns None if 'value' is not a dict or list, or is already tracked at
+    this place.  The new container is a shallow copy of 'value'.
+    """
+    klass = _TRACKED.get(type(value))
+    if klass is None:
+        return None
+    if (
+        type(value) is klass
+        and value._owner is owner
+        and value._path == path
+        and value._parent is parent
+    ):
+        return None
+    container = klass(value)
+    container._owner = owner
+    container._path = path  # Keys from the top-level key, None under a list.
+    container._parent = parent  # Enclosing container, when under a list.
+    return container
+
+
+class _Tracked:
+    """Common methods of the nested containers of a StoredDict."""
+
+    __slots__ = ()
+
+    def __reduce_ex__(self, protocol):
+        """Copies and pickles are plain containers."""
+        base = dict if isinstance(self, dict) else list
+        return base, (base(self),)
+
+    def _child(self, key, value):
+        """Track 'value', found at 'key'.  Call with the owner's '_lock' held."""
+        if isinstance(self, dict) and self._parent is None:
+            path, parent = self._path + (key,), None
+        else:
+            path, parent = None, self  # List items change with their list.
+        return _tracked(value, self._owner, path, parent)
+
+    def _report(self, key=_WHOLE, value=None):
+        """
+        Report a change to the owner.  Call with the owner's '_lock' held.
+
+        Changes within a list report the list (at its path) as changed.
+        Returns True if the owner recorded the change.
+        """
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        if node is self and key is not _WHOLE and isinstance(self, dict):
+            return self._owner._nested_changed(self, self._path + (key,), value)
+        return self._owner._nested_changed(node, node._path, node)
+
+    def _mutate(self, method, *args, values=(), key=_WHOLE, value=None):
+        """Validate 'values', call 'method', and report the change."""
+        owner = self._owner
+        owner._validate_nested(values)
+        with owner._lock:
+            result = method(self, *args)
+            recorded = self._report(key, value)
+        if recorded:
+            owner._delayed_sync_to_storage()
+        return result
+
+
+class _TrackedDict(_Tracked, dict):
+    """A dictionary within a StoredDict, reports its changes."""
+
+    __slots__ = ("_owner", "_path", "_parent")
+
+    def __getitem__(self, key):
+        """Get value by key (tracked, if a container)."""
+        value = dict.__getitem__(self, key)
+        if type(value) in _TRACKED:
+            with self._owner._lock:
+                value = dict.__getitem__(self, key)
+                child = self._child(key, value)
+                if child is not None:
+                    dict.__setitem__(self, key, child)
+                    value = child
+        return value
+
+    def __setitem__(self, key, value):
+        """Set value by key."""
+        self._mutate(
+            dict.__setitem__, key, value, values={key: value}, key=key, value=value
+        )
+
+    def __delitem__(self, key):
+        """Delete value by key."""
+        self._mutate(dict.__delitem__, key, key=key, value=_DELETED)
+
+    def __ior__(self, other):
+        """Update from 'other'."""
+        self.update(other)
+        return self
+
+    def clear(self):
+        """Remove all items."""
+        self._mutate(dict.clear)
+
+    def get(self, key, default=None):
+        """Get value by key (tracked, if a container), or 'default'."""
+        return self[key] if key in self else default
+
+    def pop(self, key, *default):
+        """Remove 'key' and return its value (or 'default')."""
+        if key not in self:
+            return dict.pop(self, key, *default)
+        return self._mutate(dict.pop, key, key=key, value=_DELETED)
+
+    def popitem(self):
+        """Remove and return the last (key, value) pair."""
+        return self._mutate(dict.popitem)
+
+    def setdefault(self, key, default=None):
+        """Return value of 'key', after setting it to 'default' if not found."""
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        """Update from a mapping (or pairs) and keywords."""
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+class _TrackedList(_Tracked, list):
+    """A list within a StoredDict, reports its changes (as the whole list)."""
+
+    __slots__ = ("_owner", "_path", "_parent")
+
+    def __getitem__(self, index):
+        """Get item (tracked, if a container).  Slices are plain lists."""
+        value = list.__getitem__(self, index)
+        if type(value) in _TRACKED and not isinstance(index, slice):
+            with self._owner._lock:
+                value = list.__getitem__(self, index)
+                child = self._child(index, value)
+                if child is not None:
+                    list.__setitem__(self, index, child)
+                    value = child
+        return value
+
+    def __setitem__(self, index, value):
+        """Set item (or slice)."""
+        if isinstance(index, slice):
+            value = list(value)
+        self._mutate(list.__setitem__, index, value, values=value)
+
+    def __delitem__(self, index):
+        """Delete item (or slice)."""
+        self._mutate(list.__delitem__, index)
+
+    def __iadd__(self, other):
+        """Extend with 'other'."""
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        """Repeat the items 'n' times."""
+        self._mutate(list.__imul__, n)
+        return self
+
+    def append(self, value):
+        """Append 'value'."""
+        self._mutate(list.append, value, values=value)
+
+    def clear(self):
+        """Remove all items."""
+        self._mutate(list.clear)
+
+    def extend(self, values):
+        """Append the items of 'values'."""
+        values = list(values)
+        self._mutate(list.extend, values, values=values)
+
+    def insert(self, index, value):
+        """Insert 'value' before 'index'."""
+        self._mutate(list.insert, index, value, values=value)
+
+    def pop(self, index=-1):
+        """Remove and return item at 'index' (default last)."""
+        return self._mutate(list.pop, index)
+
+    def remove(self, value):
+        """Remove the first occurrence of 'value'."""
+        self._mutate(list.remove, value)
+
+    def reverse(self):
+        """Reverse the items in place."""
+        self._mutate(list.reverse)
+
+    def sort(self, *, key=None, reverse=False):
+        """Sort the items in place."""
+        self._mutate(lambda items: list.sort(items, key=key, reverse=reverse))
+
+
+_TRACKED = {
+    dict: _TrackedDict,
+    list: _TrackedList,
+    _TrackedDict: _TrackedDict,
+    _TrackedList: _TrackedList,
+}
+
 
 class StoredDict(collections.abc.MutableMapping):
     """
@@ -38,13 +454,16 @@ class StoredDict(collections.abc.MutableMapping):
 
     .. autosummary::
 
+        ~compact
         ~flush
+        ~increment
         ~popitem
         ~reload
+        ~transaction
 
     .. rubric:: Static methods
 
-    All support for the YAML format is implemented in the static methods.
+    All support for the file format is implemented in the static methods.
 
     .. autosummary::
 
@@ -54,7 +473,19 @@ class StoredDict(collections.abc.MutableMapping):
     ----
     """
 
-    def __init__(self, file, delay=5, title=None, serializable=True):
+    def __init__(
+        self,
+        file,
+        delay=5,
+        title=None,
+        serializable=True,
+        journal=False,
+        compact_lines=1_000,
+        compact_bytes=1_000_000,
+        shared=False,
+        serializer="yaml",
+        track_nested=False,
+    ):
         """
         StoredDict : Dictionary that syncs to storage
 
@@ -70,34 +501,108 @@ class StoredDict(collections.abc.MutableMapping):
             Default: "Written by StoredDict."
         serializable : bool
             If True, validate new dictionary entries are JSON serializable.
+        journal : bool
+            If True, append changes to a journal file (same name as 'file',
+            with ``.journal`` appended) and only rewrite 'file' to compact
+            the journal.
+            Default: False
+        compact_lines : int
+            Compact the journal when it has at least this many lines.
+            Default: 1000
+        compact_bytes : int
+            Compact the journal when it has at least this many bytes.
+            Default: 1,000,000
+        shared : bool
+            If True, the file may be used by other processes at the same time.
+            Lock the file (same name as 'file', with ``.lock`` appended) while
+            writing and merge changes made by other processes.
+            Default: False
+        serializer : str or object
+            File format: ``"yaml"``, ``"json"``, ``"msgpack"``, or a serializer
+            object.  See :func:`~bits.utils.serializers.get_serializer`.
+            Default: ``"yaml"``
+        track_nested : bool
+            If True, dictionaries and lists in the values report their own
+            changes (such as ``md["sample"]["temperature"] = 300``), which are
+            then written to storage.  Only the changed parts are validated.
+            Default: False
         """
         self._file = pathlib.Path(file)
         self._delay = max(0, delay)
         self._title = title or f"Written by {self.__class__.__name__}."
         self.test_serializable = serializable
-
-        self.sync_in_progress = False
+        self._serializer = get_serializer(serializer)
+        self.track_nested = track_nested
+
+        self.journal = journal
+        self._journal_file = self._file.with_name(f"{self._file.name}.journal")
+        self._journal_lines = 0  # Number of lines in the journal file.
+        self._journal_pending = {}  # Changes not yet written, by key (or path).
+        self.compact_lines = max(1, compact_lines)
+        self.compact_bytes = max(1, compact_bytes)
+
+        if shared and fcntl is None:
+            raise ValueError("Shared mode requires the 'fcntl' module.")
+        self.shared = shared
+        self._lock_file = self._file.with_name(f"{self._file.name}.lock")
+        self._file_lock = threading.RLock()  # Held with the lock file.
+        self._file_lock_depth = 0
+        self._file_lock_fd = None
+        self._dirty = {}  # Changes not yet written, by key.
+        self._signature = None  # Identifies the storage last read or written.
+
+        self.coalesced_writes = 0
         self._sync_deadline = time.time()
-        self._sync_key = f"sync_agent_{id(self):x}"
-        self._sync_loop_period = 0.005
 
+        self._lock = threading.RLock()  # Guards changes to '_cache'.
+        self._write_lock = threading.Lock()  # One write to storage at a time.
         self._cache = {}
+        self._cache_shared = False  # True when a snapshot is using '_cache'.
+        # By key: serialized fragment, or a unique token until serialized.
+        self._fragments = {}
+        self._encoded = {}  # By key: (token, fragment) serialized by last write.
         self.reload()
 
+    def __copy__(self):
+        """Copies are plain dictionaries (not also written to storage)."""
+        self._refresh()
+        return dict(self._cache)
+
+    def __deepcopy__(self, memo):
+        """Copies are plain dictionaries (not also written to storage)."""
+        self._refresh()
+        with self._lock:
+            return copy.deepcopy(dict(self._cache), memo)
+
     def __delitem__(self, key):
         """Delete dictionary value by key."""
-        del self._cache[key]
+        self._refresh()
+        with self._lock:
+            del self._mutable_cache()[key]
+            self._changed(key, _DELETED)
+        self._delayed_sync_to_storage()
 
     def __getitem__(self, key):
         """Get dictionary value by key."""
-        return self._cache[key]
+        self._refresh()
+        value = self._cache[key]
+        if self.track_nested and type(value) in _TRACKED:
+            with self._lock:
+                value = self._cache[key]
+                container = _tracked(value, self, (key,), None)
+                if container is not None:
+                    # Same content, so not a change to write to storage.
+                    self._cache[key] = value = container
+        return value
 
     def __iter__(self):
         """Iterate over the dictionary keys."""
+        self._refresh()
         yield from self._cache
 
     def __len__(self):
         """Number of keys in the dictionary."""
+        self._refresh()
         return len(self._cache)
 
     def __repr__(self):
@@ -106,54 +611,286 @@ class StoredDict(collections.abc.MutableMapping):
 
     def __setitem__(self, key, value):
         """Write to the dictionary."""
-        outermost_frame = inspect.getouterframes(inspect.currentframe())[-1]
-        if "sphinx-build" in outermost_frame.filename:
-            # Seems that Sphinx is building the documentation.
-            # Ignore all the objects it tries to add.
+        if BUILDING_DOCS:
+            # Ignore all the objects Sphinx tries to add.
             return
 
-        if self.test_serializable:
-            json.dumps({key: value})
+        line, fragment = None, None
+        if self.journal:
+            # The journal entry is the serializability test.
+            _json_key(key)
+            line = json.dumps({"op": "set", "key": key, "value": value})
+        elif self.test_serializable:
+            # Keep the fragment, if the test made one.
+            fragment = self._serializer.validate(key, value)
+
+        with self._lock:
+            self._mutable_cache()[key] = value  # Store the new (or revised) content.
+            self._changed(key, value, line, fragment)
+        self._delayed_sync_to_storage()
+
+    def _changed(self, key, value, line=None, fragment=None, path=None):
+        """Remember a change not yet written to storage.  Call with '_lock' held."""
+        if value is _DELETED:
+            self._fragments.pop(key, None)
+        else:
+            self._fragments[key] = object() if fragment is None else fragment
+        if self.journal:
+            if value is _DELETED:
+                line = json.dumps({"op": "del", "key": key})
+            # Latest change last, so changes by key and by path stay in order.
+            pending = key if path is None else path
+            self._journal_pending.pop(pending, None)
+            self._journal_pending[pending] = line
+        if self.shared:
+            self._dirty[key] = value
+
+    def _nested_changed(self, container, path, value):
+        """
+        Remember a change to nested 'container' at key 'path'.  Call with '_lock' held.
 
-        self._cache[key] = value  # Store the new (or revised) content.
+        Returns False (nothing to write) if 'container' is no longer in this
+        dictionary, such as after its top-level key was replaced.
+        """
+        node = self._cache
+        try:
+            for key in container._path:
+                node = _raw_item(node, key)
+        except (IndexError, KeyError, TypeError):
+            return False
+        if node is not container:
+            return False
+        line = None
+        if self.journal:
+            op = {"op": "set", "path": list(path), "value": value}
+            if value is _DELETED:
+                op = {"op": "del", "path": list(path)}
+            line = json.dumps(op)
+        key = path[0]
+        self._changed(key, self._cache[key], line, path=tuple(path))
+        return True
+
+    def _validate_nested(self, values):
+        """Raise TypeError if new nested 'values' are not JSON serializable."""
+        if self.test_serializable or self.journal:
+            json.dumps(values)
+
+    @property
+    def sync_in_progress(self):
+        """Is this dictionary waiting to be written to storage?"""
+        return _scheduler.is_pending(self)
+
+    def _mutable_cache(self):
+        """
+        Return '_cache', ready to be changed.  Call with '_lock' held.
 
-        # Reset the deadline.
-        self._sync_deadline = time.time() + self._delay
-        logger.debug("new sync deadline in %f s.", self._delay)
+        Copy-on-write: if a snapshot is being written to storage, make a new
+        '_cache' so the snapshot is never changed while it is written.
+        """
+        if self._cache_shared:
+            self._cache = dict(self._cache)
+            self._cache_shared = False
+        return self._cache
 
-        if not self.sync_in_progress:
-            # Start the sync_agent (thread).
-            self._delayed_sync_to_storage()
+    def _snapshot(self):
+        """Return the contents, unchanged by any later updates."""
+        with self._lock:
+            self._cache_shared = True
+            return self._cache
 
     def _delayed_sync_to_storage(self):
         """
         Sync the metadata to storage.
 
-        Start a time-delay thread.  New writes to the metadata dictionary will
-        extend the deadline.  Sync once the deadline is reached.
+        Register with the flush scheduler.  New writes to the metadata
+        dictionary will extend the deadline.  Sync once the deadline is reached.
         """
+        # Reset the deadline.
+        self._sync_deadline = time.time() + self._delay
+        logger.debug("new sync deadline in %f s.", self._delay)
+        _scheduler.schedule(self, self._sync_deadline)
+
+    def _write_storage(self):
+        """Write a snapshot (or, in journal mode, the changes) to storage."""
+        with self._storage_lock(), self._write_lock:
+            if self.shared:
+                self._refresh()  # Merge changes written by other processes.
+                with self._lock:
+                    self._dirty = {}  # These will be in the snapshot.
+            self._write_locked()
+            if self.shared:
+                self._signature = self._storage_signature()
+
+    def _serialize(self):
+        """
+        File content for a snapshot of the dictionary.  Call with '_write_lock' held.
 
-        def sync_agent():
-            """Threaded task."""
-            logger.debug("Starting sync_agent...")
-            self.sync_in_progress = True
-            while time.time() < self._sync_deadline:
-                time.sleep(self._sync_loop_period)
-            logger.debug("Sync waiting period ended")
-            self.sync_in_progress = False
-
-            StoredDict.dump(self._file, self._cache, title=self._title)
+        Only entries changed since the last write are serialized.
+        With 'track_nested', nested containers are changed in place, so the
+        entries are serialized with '_lock' held.
+        """
+        with self._lock:
+            contents = self._snapshot()
+            tokens = dict(self._fragments)
+        guard = self._lock if self.track_nested else contextlib.nullcontext()
+        items, encoded = [], {}
+        with guard:
+            for key, value in contents.items():
+                token = tokens[key]
+                if isinstance(token, bytes):  # serialized by validation
+                    fragment = token
+                else:
+                    previous, fragment = self._encoded.get(key, (None, None))
+                    if previous is not token:  # changed since the last write
+                        fragment = self._serializer.encode_item(key, value)
+                    encoded[key] = (token, fragment)
+                items.append((key, fragment))
+        self._encoded = encoded
+        return self._serializer.join(items, title=self._title)
+
+    def _write_locked(self):
+        """Write to storage.  Call with '_write_lock' held."""
+        if not self.journal:
+            _atomic_write(self._file, self._serialize())
+            return
 
-        thred = threading.Thread(target=sync_agent)
-        thred.start()
+        with self._lock:
+            lines = list(self._journal_pending.values())
+            self._journal_pending = {}
+        if len(lines) > 0:
+            with open(self._journal_file, "a") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_lines += len(lines)
+        if (
+            self._journal_lines >= self.compact_lines
+            or self._journal_size() >= self.compact_bytes
+        ):
+            self._compact()
+
+    def _journal_size(self):
+        """Size (bytes) of the journal file."""
+        try:
+            return self._journal_file.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def compact(self):
+        """Rewrite the YAML file with all changes and empty the journal."""
+        with self._storage_lock(), self._write_lock:
+            self._compact()
+            if self.shared:
+                self._signature = self._storage_signature()
+
+    def _compact(self):
+        """Compact the journal.  Call with '_write_lock' held."""
+        logger.debug("compact(): %d journal lines", self._journal_lines)
+        # Changes still pending are in the snapshot and will be journaled
+        # again later.  Replay is idempotent, so that is harmless.
+        _atomic_write(self._file, self._serialize())
+        # A crash before the next step replays the journal onto the new file.
+        if self._journal_file.exists():
+            with open(self._journal_file, "w"):
+                pass  # truncate
+        self._journal_lines = 0
 
     def flush(self):
         """Force a write of the dictionary to disk"""
         logger.debug("flush()")
-        if not self.sync_in_progress:
-            StoredDict.dump(self._file, self._cache, title=self._title)
+        _scheduler.cancel(self)
         self._sync_deadline = time.time()
-        self.sync_in_progress = False
+        self._write_storage()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Read-modify-write with storage locked, then write immediately.
+
+        In shared mode, no other process can write to storage until the
+        transaction ends.  Nested transactions are allowed.
+
+        EXAMPLE::
+
+            with md.transaction():
+                md["count"] = md.get("count", 0) + 1
+        """
+        with self._storage_lock():
+            self._refresh()
+            yield self
+            self.flush()
+
+    def increment(self, key, start=0):
+        """
+        Add one to the value of 'key' (or to 'start' if not found) in a transaction.
+
+        Returns the new value.  Use this (in shared mode) to allocate a number,
+        such as ``scan_id``, that is unique across processes.
+        """
+        with self.transaction():
+            value = self.get(key, start) + 1
+            self[key] = value
+        return value
+
+    @contextlib.contextmanager
+    def _storage_lock(self):
+        """Hold the advisory lock on storage (shared mode only).  Re-entrant."""
+        if not self.shared:
+            yield
+            return
+        with self._file_lock:
+            if self._file_lock_depth == 0:
+                self._file_lock_fd = os.open(self._lock_file, os.O_RDWR | os.O_CREAT)
+                fcntl.flock(self._file_lock_fd, fcntl.LOCK_EX)
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+                if self._file_lock_depth == 0:
+                    fcntl.flock(self._file_lock_fd, fcntl.LOCK_UN)
+                    os.close(self._file_lock_fd)
+                    self._file_lock_fd = None
+
+    def _storage_signature(self):
+        """Identify the present content of storage, without reading it."""
+        signature = []
+        for path in (self._file, self._journal_file):
+            try:
+                st = path.stat()
+                signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _refresh(self):
+        """Shared mode: read storage again if another process changed it."""
+        if not self.shared or self._storage_signature() == self._signature:
+            return
+        with self._storage_lock():
+            signature = self._storage_signature()
+            if signature == self._signature:
+                return  # Another thread just did this.
+            logger.debug("Storage changed by another process: %s", self._file)
+            contents = StoredDict.load(self._file, self._serializer)
+            journal_lines = 0
+            if self.journal:
+                journal_lines = StoredDict.replay(self._journal_file, contents)
+            with self._lock:
+                # Keys changed here but not yet written win over storage.
+                for key, value in self._dirty.items():
+                    if value is _DELETED:
+                        contents.pop(key, None)
+                    else:
+                        contents[key] = value
+                self._fragments = {
+                    key: self._fragments[key] if key in self._dirty else object()
+                    for key in contents
+                }
+                self._cache = contents
+                self._cache_shared = False
+            self._journal_lines = journal_lines
+            self._signature = self._storage_signature()
 
     def popitem(self):
         """
@@ -162,31 +899,92 @@ class StoredDict(collections.abc.MutableMapping):
         Pairs are returned in LIFO (last-in, first-out) order.
         Raises KeyError if the dict is empty.
         """
-        return self._cache.popitem()
+        with self._lock:
+            item = self._mutable_cache().popitem()
+            self._changed(item[0], _DELETED)
+        self._delayed_sync_to_storage()
+        return item
 
     def reload(self):
         """Read dictionary from storage."""
         logger.debug("reload()")
-        self._cache = StoredDict.load(self._file)
+        with self._storage_lock():
+            contents = StoredDict.load(self._file, self._serializer)
+            if self.journal:
+                self._journal_lines = StoredDict.replay(self._journal_file, contents)
+            with self._lock:
+                self._cache = contents
+                self._cache_shared = False
+                self._fragments = {key: object() for key in contents}
+                self._journal_pending = {}
+                self._dirty = {}
+            self._signature = self._storage_signature()
 
     @staticmethod
-    def dump(file, contents, title=None):
-        """Write dictionary to YAML file."""
+    def dump(file, contents, title=None, serializer="yaml"):
+        """Write dictionary to file (YAML by default, atomic replacement of 'file')."""
         logger.debug("_dump(): file='%s', contents=%r, title=%r", file, contents, title)
-        with open(file, "w") as f:
-            if isinstance(title, str) and len(title) > 0:
-                f.write(f"# {title}\n")
-            f.write(f"# Dictionary contents written: {datetime.datetime.now()}\n\n")
-            f.write(yaml.dump(contents, indent=2))
+        serializer = get_serializer(serializer)
+        _atomic_write(file, serializer.dumps(contents, title=title))
 
     @staticmethod
-    def load(file):
-        """Read dictionary from YAML file."""
-        from .config_loaders import load_config_yaml
-
+    def load(file, serializer="yaml"):
+        """Read dictionary from file (YAML by default)."""
         file = pathlib.Path(file)
         logger.debug("_load('%s')", file)
         md = None
         if file.exists():
-            md = load_config_yaml(file)
+            data = file.read_bytes()
+            if len(data) > 0:
+                md = get_serializer(serializer).loads(data)
         return md or {}  # In case file is empty.
+
+    @staticmethod
+    def replay(file, contents):
+        """
+        Apply the changes in journal 'file' to dictionary 'contents'.
+
+        Returns the number of journal lines.  An incomplete last line (such
+        as from a crash while writing) is ignored and removed from the file.
+        Lines with a key ``path`` change a nested container.
+        """
+        file = pathlib.Path(file)
+        logger.debug("_replay('%s')", file)
+        if not file.exists():
+            return 0
+        n_lines = 0
+        complete = 0  # Bytes in complete lines.
+        with open(file, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    logger.warning("Ignoring incomplete last line in '%s'.", file)
+                    break
+                complete += len(line)
+                n_lines += 1
+                entry = json.loads(line)
+                node, key = contents, entry.get("key")
+                try:
+                    if "path" in entry:
+                        *parents, key = entry["path"]
+                        for parent in parents:
+                            node = node[parent]
+                    if entry["op"] == "set":
+                        node[key] = entry["value"]
+                    elif entry["op"] == "del" and isinstance(node, dict):
+                        node.pop(key, None)
+                except (IndexError, KeyError, TypeError):
+                    logger.warning("Cannot apply line %d of '%s'.", n_lines, file)
+        if complete < file.stat().st_size:
+            os.truncate(file, complete)
+        return n_lines
+
+
+def _atomic_write(file, data):
+    """Replace 'file' with 'data' (bytes): write a temporary file, then rename."""
+    file = pathlib.Path(file)
+    temporary = file.with_name(f".{file.name}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, file)
@@ -0,0 +1,193 @@
+"""
+Synthetic detectors
+===================
+
+Simulated detectors (no EPICS) that respond to simulated motors, for
+testing an instrument at the size of a real one.
+
+A :class:`SyntheticResponse` holds the response model of many detectors.
+Each detector sees a peak (Gaussian, on a background) as one motor moves.
+The peaks of all detectors are computed together (with NumPy), once for
+each set of motor positions.  Noise is then added to each reading.
+
+Everything is drawn from random number generators started with 'seed':
+the same seed gives the same peaks and the same sequence of readings.
+
+EXAMPLE::
+
+    motors = [ophyd.sim.SynAxis(name=f"sm{i}") for i in range(1, 5)]
+    model = SyntheticResponse(motors, 8, seed=1, image_shape=(64, 64))
+    detectors = [
+        SyntheticDetector(name=f"sd{i+1}", model=model, index=i)
+        for i in range(8)
+    ]
+
+See :func:`~instrument.utils.sim_creator.synthetic_beamline` to make
+these from ``devices.yml``.
+
+.. autosummary::
+    ~SyntheticDetector
+    ~SyntheticResponse
+"""
+
+import logging
+
+import numpy as np
+from ophyd import Component
+from ophyd import Device
+from ophyd import Kind
+from ophyd.sim import SynSignal
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+NOISE_MODELS = ("poisson", "uniform", "none")
+
+
+class SyntheticResponse:
+    """
+    Response model (peak, background, noise) of several synthetic detectors.
+
+    Detector ``i`` responds to motor ``i % len(motors)``.
+
+    PARAMETERS
+
+    motors : list
+        Motors (with a ``position``) the detectors respond to.
+    n_detectors : int
+        Number of detectors.
+    seed : int
+        Seed of the random number generators.  (default: 0)
+    image_shape : tuple or None
+        Shape of each detector's image.  No images if None.  (default: None)
+    noise : str
+        Noise added to each reading: ``"poisson"``, ``"uniform"`` (up to
+        the square root of the signal), or ``"none"``.  (default: "poisson")
+    span : float
+        Peak centers are drawn from ``-span/2 .. span/2``.  (default: 10)
+
+    .. autosummary::
+        ~counts
+        ~image
+        ~peaks
+    """
+
+    def __init__(
+        self,
+        motors,
+        n_detectors,
+        *,
+        seed=0,
+        image_shape=None,
+        noise="poisson",
+        span=10,
+    ):
+        """Draw the peak of each detector."""
+        if len(motors) == 0 and n_detectors > 0:
+            raise ValueError("Synthetic detectors need at least one motor.")
+        if noise not in NOISE_MODELS:
+            raise ValueError(f"Unknown noise {noise!r}.  Use one of {NOISE_MODELS}.")
+        self.motors = list(motors)
+        self.noise = noise
+        self.image_shape = None if image_shape is None else tuple(image_shape)
+
+        n = n_detectors
+        rng = np.random.default_rng(seed)
+        self.axis = np.arange(n) % max(len(self.motors), 1)
+        self.center = rng.uniform(-span / 2, span / 2, n)
+        self.sigma = rng.uniform(0.05, 0.2, n) * span
+        self.amplitude = 10 ** rng.uniform(3, 5, n)
+        self.background = rng.uniform(0, 100, n)
+        # Where the spot of each image is, and how wide (fraction of the image).
+        self.spot = rng.uniform(0.25, 0.75, (n, 2))
+        self.spot_width = rng.uniform(0.05, 0.15, n)
+        # Noise of each detector has its own generator: readings do not
+        # depend on the order in which the detectors are read.
+        self._rngs = [np.random.default_rng([seed, i]) for i in range(n)]
+        self._profiles = {}  # {index: normalized image profile}
+        self._key = None  # motor positions of the cached peaks
+        self._peaks = None
+
+    def peaks(self):
+        """Peak value (without noise) of every detector at the motor positions."""
+        n_used = min(len(self.motors), len(self.axis))
+        positions = np.array([m.position for m in self.motors[:n_used]], dtype=float)
+        key = positions.tobytes()
+        if key != self._key:
+            x = positions[self.axis]
+            self._peaks = self.background + self.amplitude * np.exp(
+                -0.5 * ((x - self.center) / self.sigma) ** 2
+            )
+            self._key = key
+        return self._peaks
+
+    def _add_noise(self, index, value):
+        """'value' (scalar or array) with the noise of detector 'index'."""
+        rng = self._rngs[index]
+        if self.noise == "poisson":
+            return np.asarray(rng.poisson(value), dtype=float)
+        if self.noise == "uniform":
+            return value + np.sqrt(value) * rng.uniform(-1, 1, np.shape(value))
+        return value
+
+    def counts(self, index):
+        """A reading (float) of detector 'index'."""
+        return float(self._add_noise(index, self.peaks()[index]))
+
+    def _profile(self, index):
+        """Spot of detector 'index': 2-D Gaussian profile, sums to 1."""
+        profile = self._profiles.get(index)
+        if profile is None:
+            rows, cols = self.image_shape
+            y = (np.arange(rows) / rows - self.spot[index, 0]) / self.spot_width[index]
+            x = (np.arange(cols) / cols - self.spot[index, 1]) / self.spot_width[index]
+            profile = np.outer(np.exp(-0.5 * y**2), np.exp(-0.5 * x**2))
+            profile /= profile.sum()
+            self._profiles[index] = profile
+        return profile
+
+    def image(self, index):
+        """An image (array of 'image_shape') of detector 'index'."""
+        if self.image_shape is None:
+            raise ValueError("This model has no images (image_shape is None).")
+        return self._add_noise(index, self.peaks()[index] * self._profile(index))
+
+
+class SyntheticDetector(Device):
+    """
+    Simulated detector with a :class:`SyntheticResponse`.
+
+    ``counts`` (hinted) is read with each trigger; so is ``image`` if the
+    model has images.
+
+    PARAMETERS
+
+    model : SyntheticResponse
+        Response model shared by several detectors.
+    index : int
+        Which detector of 'model' this is.
+    """
+
+    counts = Component(SynSignal, kind=Kind.hinted)
+    image = Component(SynSignal, kind=Kind.omitted)
+
+    def __init__(self, *args, model=None, index=0, **kwargs):
+        """Detector 'index' of 'model'."""
+        if model is None:
+            raise ValueError("Must provide a 'model' (a SyntheticResponse).")
+        super().__init__(*args, **kwargs)
+        self.model = model
+        self.index = index
+        self.counts.name = self.name
+        self.counts.sim_set_func(lambda: model.counts(index))
+        if model.image_shape is not None:
+            self.image.kind = Kind.normal
+            self.image.sim_set_func(lambda: model.image(index))
+        self.trigger()
+
+    def trigger(self):
+        """Compute new readings."""
+        status = self.counts.trigger()
+        if self.model.image_shape is not None:
+            status = status & self.image.trigger()
+        return status
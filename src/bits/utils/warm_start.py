@@ -0,0 +1,142 @@
+"""
+Warm start for the queueserver
+==============================
+
+Open a queueserver environment faster by forking each RE worker from a
+*template* process that has imported the slow, shareable modules already.
+
+``start-re-manager`` forks each RE worker (at every ``environment open``)
+from its watchdog process.  The ``bits-start-re-manager`` command (same
+arguments as ``start-re-manager``) imports those modules into the
+watchdog process first, then runs the queueserver.  The worker's startup
+module finds them in ``sys.modules`` and only creates the per-session
+state: the RunEngine, RE.md, catalog, file writers, devices and their
+EPICS connections.
+
+Only modules that start no threads when imported can be shared: threads
+are not copied into a forked process.  ``ophyd`` (and any module that
+imports it) starts its EPICS threads when imported, so device support is
+imported after the fork.  :func:`prepare_template` refuses modules that
+start threads.
+
+Configure in ``iconfig.yml``::
+
+    WARM_START:
+        MODULES: [numpy, databroker, bluesky]
+
+The end of startup logs the time since the worker was forked (the
+open-to-ready latency).  See :func:`report_ready`.
+
+.. autosummary::
+    ~main
+    ~prepare_template
+    ~ready_latency
+    ~report_ready
+"""
+
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from .config_loaders import iconfig
+
+logger = logging.getLogger(__name__)
+logger.bsdev(__file__)
+
+DEFAULT_MODULES = """
+    numpy
+    scipy
+    pandas
+    h5py
+    matplotlib
+    intake
+    databroker
+    bluesky
+    bluesky.plans
+    bluesky.callbacks.best_effort
+    apstools.callbacks
+    pyRestTable
+    pysumreg
+    spec2nexus
+""".split()
+"""Modules imported by the template (none start threads when imported)."""
+
+_forked_at = None  # time.time() when this process was forked from the template.
+_t0 = time.time()  # Process start (or import of bits), if not forked.
+
+
+def _after_fork_in_child():
+    """In a new worker: note the time, pick up any edits to iconfig.yml."""
+    global _forked_at
+
+    _forked_at = time.time()
+    try:
+        iconfig.reload()
+    except Exception as exc:
+        logger.error("Could not reload %s: %s", iconfig.path, exc)
+
+
+def prepare_template(modules=None):
+    """
+    Import 'modules' into this (the template) process.
+
+    Returns a dictionary of import time (seconds) by module name.
+    Raises RuntimeError if importing a module starts a thread.
+    """
+    times = {}
+    for name in modules or DEFAULT_MODULES:
+        before = set(threading.enumerate())
+        t0 = time.perf_counter()
+        importlib.import_module(name)
+        times[name] = time.perf_counter() - t0
+        started = set(threading.enumerate()) - before
+        if len(started) > 0:
+            names = sorted(thread.name for thread in started)
+            raise RuntimeError(
+                f"Importing {name!r} started threads {names}."
+                "  Threads are not copied into forked workers."
+                "  Remove it from WARM_START.MODULES in iconfig.yml."
+            )
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+    return times
+
+
+def ready_latency():
+    """
+    Seconds since this worker was forked from the template.
+
+    If not forked from a template, seconds since ``bits`` was imported.
+    """
+    return time.time() - (_forked_at or _t0)
+
+
+def report_ready():
+    """Log (and return) the time taken for this session to become ready."""
+    seconds = ready_latency()
+    since = "forked from the warm start template" if _forked_at else "bits import"
+    logger.info("Session ready %.3f s after %s.", seconds, since)
+    return seconds
+
+
+def main():
+    """Entry point of ``bits-start-re-manager``: warm template, then queueserver."""
+    from bluesky_queueserver.manager.start_manager import start_manager
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        # The RE worker must be forked (not spawned) to share the imports.
+        multiprocessing.set_start_method("fork", force=True)
+        config = iconfig.get("WARM_START", {})
+        t0 = time.perf_counter()
+        times = prepare_template(config.get("MODULES"))
+        logger.info(
+            "Warm start template: %d modules imported in %.3f s.",
+            len(times),
+            time.perf_counter() - t0,
+        )
+    else:
+        logger.warning("Processes cannot be forked here.  No warm start.")
+    return start_manager()